@@ -59,8 +59,9 @@ fi
 # 5. Data Initialization (Call rebuild_data.sh)
 echo -e "${YELLOW}[5/6] Initializing RAG data...${NC}"
 INDEX_FILE="data/byteplus.index"
+INDEX_POINTER="data/index/CURRENT"
 
-if [ -f "$INDEX_FILE" ]; then
+if [ -f "$INDEX_POINTER" ] || [ -f "$INDEX_FILE" ]; then
     echo "Index file exists. Skipping initial crawl/index."
     echo "To force rebuild, run: ./rebuild_data.sh"
 else
@@ -0,0 +1,151 @@
+import os
+import sys
+import json
+import time
+import platform
+import threading
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Add src to path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+
+from utils.paths import DATA_DIR
+# Re-exported for the benchmark scripts
+from utils.metrics import current_rss_mb, peak_rss_mb
+
+# Saved runs: data/benchmarks/<kind>/<timestamp>_<label>.json
+BENCHMARK_DIR = DATA_DIR / "benchmarks"
+# Last stdout line of a benchmark worker process
+RESULT_PREFIX = "BENCH_RESULT "
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0..1); 0.0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def latency_summary(values_ms: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values_ms),
+        "mean_ms": sum(values_ms) / len(values_ms) if values_ms else 0.0,
+        "p50_ms": percentile(values_ms, 0.50),
+        "p95_ms": percentile(values_ms, 0.95),
+        "p99_ms": percentile(values_ms, 0.99),
+        "max_ms": max(values_ms) if values_ms else 0.0,
+    }
+
+
+def emit_result(result: Dict[str, Any]):
+    """Reports a worker's result (plus its peak RSS) to the driver, see `run_child`."""
+    result["peak_rss_mb"] = peak_rss_mb()
+    print(RESULT_PREFIX + json.dumps(result), flush=True)
+
+
+def run_child(cmd: List[str], log_path: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Runs a benchmark worker in a fresh interpreter (so peak RSS is its own), with
+    stdout/stderr going to `log_path`. Returns the worker's `emit_result` dict plus
+    wall time, CPU time and peak RSS; raises RuntimeError if it fails or times out.
+    """
+    start_t = time.perf_counter()
+    with open(log_path, "w", encoding="utf-8") as log:
+        proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+        timer = threading.Timer(timeout, proc.kill) if timeout else None
+        if timer:
+            timer.start()
+        try:
+            _, status, usage = os.wait4(proc.pid, 0)
+        finally:
+            if timer:
+                timer.cancel()
+    wall_sec = time.perf_counter() - start_t
+    with open(log_path, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    result_lines = [line for line in lines if line.startswith(RESULT_PREFIX)]
+    if os.waitstatus_to_exitcode(status) != 0 or not result_lines:
+        reason = f"timed out after {timeout:.0f}s" if timeout and wall_sec >= timeout else "failed"
+        tail = "\n".join(lines[-20:])
+        raise RuntimeError(f"Worker {reason} (log: {log_path}):\n{tail}")
+    result = json.loads(result_lines[-1][len(RESULT_PREFIX):])
+    result["wall_sec"] = wall_sec
+    # ru_maxrss of the waited child (KiB on Linux), cross-checks the worker's own figure
+    child_peak = usage.ru_maxrss / 2**20 if sys.platform == "darwin" else usage.ru_maxrss / 2**10
+    result["peak_rss_mb"] = max(result.get("peak_rss_mb", 0.0), child_peak)
+    result["cpu_sec"] = usage.ru_utime + usage.ru_stime
+    return result
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def save_results(kind: str, label: str, payload: Dict[str, Any]) -> Path:
+    """Writes one benchmark run as JSON and returns its path."""
+    out_dir = BENCHMARK_DIR / kind
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    safe_label = "".join(c if c.isalnum() or c in "-_." else "-" for c in label) or "run"
+    path = out_dir / f"{stamp}_{safe_label}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def resolve_baseline(kind: str, ref: str, exclude: Optional[Path] = None) -> Optional[Path]:
+    """`ref` is a path, or "latest" for the newest saved run of this kind (other than `exclude`)."""
+    if ref != "latest":
+        return Path(ref)
+    runs = sorted((BENCHMARK_DIR / kind).glob("*.json"))
+    runs = [p for p in runs if exclude is None or p.resolve() != exclude.resolve()]
+    return runs[-1] if runs else None
+
+
+def load_results(path: Path) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def lookup(data: Dict[str, Any], dotted: str) -> Optional[float]:
+    """Numeric value at a dotted path ("summary.latency.p50_ms"), or None."""
+    for part in dotted.split("."):
+        if not isinstance(data, dict) or part not in data:
+            return None
+        data = data[part]
+    return data if isinstance(data, (int, float)) else None
+
+
+# (metric path, "higher" | "lower" is better, tolerance, "abs" | "rel")
+Check = Tuple[str, str, float, str]
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], checks: List[Check]) -> List[str]:
+    """
+    Prints current vs baseline for each checked metric and returns the names
+    of the metrics that got worse by more than their tolerance.
+    """
+    regressions = []
+    print(f"\n{'metric':<32} {'baseline':>12} {'current':>12} {'delta':>10}")
+    for name, better, tolerance, mode in checks:
+        new, old = lookup(current, name), lookup(baseline, name)
+        if new is None or old is None:
+            continue
+        delta = new - old
+        worse = -delta if better == "higher" else delta
+        limit = tolerance if mode == "abs" else tolerance * abs(old)
+        flag = ""
+        if worse > limit:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        rel = f"{delta / old:+.1%}" if old else f"{delta:+.3f}"
+        print(f"{name:<32} {old:>12.4f} {new:>12.4f} {rel:>10}{flag}")
+    return regressions
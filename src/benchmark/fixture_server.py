@@ -0,0 +1,221 @@
+import os
+import sys
+import glob
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+# Add src to path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+
+from utils.paths import DATA_DIR
+
+DOCS_PREFIX = "/en/docs/ecs"
+SEED_SLUG = "Elastic_Compute_Service"
+REAL_HOST = "https://docs.byteplus.com"
+
+TOPICS = [
+    ("Instance", "instance", "An ECS instance is a virtual server with vCPUs, memory, an image and cloud disks."),
+    ("Snapshot", "snapshot", "A snapshot is a point-in-time copy of a cloud disk that can be used to roll back data."),
+    ("Image", "image", "A custom image captures the system disk so new instances start with the same software."),
+    ("Security group", "security-group", "Security groups filter inbound and outbound traffic with allow rules."),
+    ("Billing", "billing", "Instances are billed pay-as-you-go or by subscription; the billing method can be converted."),
+    ("Cloud disk", "cloud-disk", "ESSD cloud disks are persistent block storage; local SSDs are ephemeral and fast."),
+    ("Instance type", "instance-type", "ModifyInstanceSpec changes the instance type to upgrade or downgrade vCPUs and memory."),
+    ("Monitoring", "monitoring", "The monitoring plugin reports CPU, memory, disk and network metrics."),
+]
+MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August",
+          "September", "October", "November", "December"]
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}--BytePlus</title></head>
+<body>
+<div class="arco-layout-sider"><div class="arco-menu-inner">
+{sidebar}
+</div></div>
+<main class="doc-main"><h1>{title}</h1></main>
+<script>window.__INITIAL_STATE__={state};</script>
+</body></html>
+"""
+
+
+def _quill_ops(paragraphs):
+    ops = []
+    for kind, text in paragraphs:
+        ops.append({"insert": text})
+        if kind == "h2":
+            ops.append({"insert": "\n", "attributes": {"header": 2}})
+        elif kind == "li":
+            ops.append({"insert": "\n", "attributes": {"list": "bullet"}})
+        else:
+            ops.append({"insert": "\n"})
+    return ops
+
+
+class SyntheticDocs:
+    """
+    Deterministic docs tree in the shape of the BytePlus pages: every page has the
+    `arco-menu-inner` sidebar listing all pages, and its body embedded in the page
+    state as Quill `Content` JSON (most pages) or `MDContent` markdown.
+    """
+
+    def __init__(self, pages: int = 100, paragraphs: int = 12, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.paragraphs = paragraphs
+        self.slugs = [SEED_SLUG] + [
+            f"{TOPICS[i % len(TOPICS)][1]}-{i:05d}" for i in range(1, pages)
+        ]
+        self._sidebar = "\n".join(
+            f'<a class="arco-menu-item" href="{DOCS_PREFIX}/{slug}">{slug.replace("-", " ")}</a>'
+            for slug in self.slugs
+        )
+        self._cache: Dict[str, bytes] = {}
+
+    def _paragraphs(self, i: int, topic: str, body: str):
+        rng = random.Random(i)
+        paras = [("p", body)]
+        for j in range(self.paragraphs):
+            if j % 4 == 0:
+                paras.append(("h2", f"{topic} section {j // 4 + 1}"))
+            month = MONTHS[rng.randrange(12)]
+            paras.append(("li" if j % 3 == 2 else "p",
+                          f"{month} {rng.randint(1, 28)}, 2025: {body} Step {j + 1} applies to region "
+                          f"ap-southeast-{rng.randint(1, 3)} and instance family ecs.g{rng.randint(1, 4)}i."))
+        return paras
+
+    def page(self, slug: str) -> Optional[bytes]:
+        if slug in self._cache:
+            return self._cache[slug]
+        if slug not in self.slugs:
+            return None
+        i = self.slugs.index(slug)
+        title, _, body = TOPICS[i % len(TOPICS)]
+        title = f"{title} {i}" if i else "Elastic Compute Service"
+        paras = self._paragraphs(i, title, body)
+        doc = {"Title": title, "ParentCode": f"ecs-{TOPICS[i % len(TOPICS)][1]}"}
+        if i % 5 == 4:
+            md = "\n\n".join(("## " if kind == "h2" else "- " if kind == "li" else "") + text for kind, text in paras)
+            doc.update({"Content": "", "MDContent": md})
+        else:
+            # Quill delta serialised as a JSON string inside the page state, like the real site
+            doc["Content"] = json.dumps({"version": 2, "data": {"0": {"ops": _quill_ops(paras)}}})
+        html = PAGE_TEMPLATE.format(title=title, sidebar=self._sidebar,
+                                    state=json.dumps({"doc": doc}, ensure_ascii=False))
+        self._cache[slug] = html.encode("utf-8")
+        return self._cache[slug]
+
+    def get(self, path: str) -> Optional[bytes]:
+        if not path.startswith(DOCS_PREFIX + "/"):
+            return None
+        return self.page(path[len(DOCS_PREFIX) + 1:].strip("/"))
+
+
+class RecordedDocs:
+    """Serves pages saved by the crawler (data/raw/<source>/*.json) under their original paths."""
+
+    def __init__(self, raw_dir: str):
+        self.pages: Dict[str, str] = {}
+        for path in glob.glob(os.path.join(raw_dir, "**/*.json"), recursive=True):
+            with open(path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            self.pages[urlparse(raw["url"]).path.rstrip("/")] = raw.get("raw_content", "")
+        if not self.pages:
+            raise FileNotFoundError(f"No recorded pages in {raw_dir}")
+        self.host = ""
+        # The seed is the recorded page listed in data/sources/urls.json (else the shortest path)
+        self.seed_path = min(self.pages, key=len)
+        sources_file = DATA_DIR / "sources/urls.json"
+        if sources_file.exists():
+            with open(sources_file, "r", encoding="utf-8") as f:
+                seeds = [urlparse(entry["url"]).path.rstrip("/") for entry in json.load(f)]
+            self.seed_path = next((p for p in seeds if p in self.pages), self.seed_path)
+
+    @property
+    def slugs(self):
+        return list(self.pages)
+
+    def get(self, path: str) -> Optional[bytes]:
+        html = self.pages.get(path.rstrip("/"))
+        if html is None:
+            return None
+        # Keep the crawler on the fixture server
+        return html.replace(REAL_HOST, self.host).encode("utf-8")
+
+
+def _handler(docs, latency_ms: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if latency_ms:
+                time.sleep(latency_ms / 1000)
+            body = docs.get(urlparse(self.path).path)
+            if body is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+class FixtureServer:
+    """Local docs site for offline crawler/pipeline benchmarks (never load-test the real site)."""
+
+    def __init__(self, docs, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0):
+        self.docs = docs
+        self.server = ThreadingHTTPServer((host, port), _handler(docs, latency_ms))
+        self.server.daemon_threads = True
+        self.base_url = f"http://{host}:{self.server.server_address[1]}"
+        if isinstance(docs, RecordedDocs):
+            docs.host = self.base_url
+        self._thread = None
+
+    @property
+    def seed_url(self) -> str:
+        if isinstance(self.docs, RecordedDocs):
+            return self.base_url + self.docs.seed_path
+        return f"{self.base_url}{DOCS_PREFIX}/{SEED_SLUG}"
+
+    def start(self) -> "FixtureServer":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fixture-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic or recorded BytePlus docs tree locally.")
+    parser.add_argument("--pages", type=int, default=100, help="Synthetic pages (incl. seed)")
+    parser.add_argument("--paragraphs", type=int, default=12, help="Paragraphs per synthetic page")
+    parser.add_argument("--recorded", default=None, help="Serve crawler output instead (e.g. data/raw/byteplus_ecs)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Added per-request latency")
+    args = parser.parse_args()
+
+    docs = RecordedDocs(args.recorded) if args.recorded else SyntheticDocs(args.pages, args.paragraphs)
+    server = FixtureServer(docs, port=args.port, latency_ms=args.latency_ms)
+    print(f"[Info] Serving {len(docs.slugs)} pages. Seed: {server.seed_url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+MOCK_MODEL = "mock-llm"
+FILLER = ("The instance type can be changed from the console after the instance is stopped and "
+          "billing follows the new specification from the next cycle").split()
+
+
+class MockLLMBehaviour:
+    """
+    Latency / failure model of the mock: `ttft_ms` before the first token (or the whole
+    response), then `token_ms` per completion token, both scaled by ±`jitter`.
+    A share `error_rate` of requests fails with `error_status` (500, or 429 for rate limits).
+    With `disconnect_after` > 0 streams drop the connection after that many tokens.
+    """
+
+    def __init__(self, ttft_ms: float = 300.0, token_ms: float = 20.0, tokens: int = 64,
+                 jitter: float = 0.2, error_rate: float = 0.0, error_status: int = 500, seed: int = 0,
+                 disconnect_after: int = 0):
+        self.ttft_ms = ttft_ms
+        self.token_ms = token_ms
+        self.tokens = tokens
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.disconnect_after = disconnect_after
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {"requests": 0, "streams": 0, "errors": 0, "completion_tokens": 0}
+
+    def delay(self, ms: float) -> float:
+        with self._lock:
+            factor = 1 + self._rng.uniform(-self.jitter, self.jitter)
+        return max(0.0, ms * factor) / 1000
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+    def count(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                self.counts[key] += value
+
+    def completion(self, messages: List[Dict], max_tokens: int) -> List[str]:
+        """Completion as a list of tokens (words): echoes the question, then filler text."""
+        question = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        words = ["Mock", "answer", "to:"] + question.split()[:12]
+        n = min(self.tokens, max_tokens) if max_tokens else self.tokens
+        words += [FILLER[i % len(FILLER)] for i in range(max(0, n - len(words)))]
+        return [w + " " for w in words[:n]]
+
+
+def _prompt_tokens(messages: List[Dict]) -> int:
+    # ~4 characters per token; good enough for usage accounting in tests
+    return sum(len(str(m.get("content") or "")) for m in messages) // 4 + 1
+
+
+def _handler(behaviour: MockLLMBehaviour):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status: int, payload: Dict[str, Any]):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _write_chunk(self, data: str):
+            raw = data.encode("utf-8")
+            self.wfile.write(f"{len(raw):x}\r\n".encode() + raw + b"\r\n")
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send_json(200, {"object": "list", "data": [{"id": MOCK_MODEL, "object": "model"}]})
+            elif self.path.startswith("/health"):
+                self._send_json(200, {"status": "ok", **behaviour.counts})
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_error(404)
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            messages = body.get("messages", [])
+            stream = bool(body.get("stream"))
+            behaviour.count(requests=1, streams=int(stream))
+            if behaviour.should_fail():
+                behaviour.count(errors=1)
+                time.sleep(behaviour.delay(behaviour.ttft_ms))
+                self._send_json(behaviour.error_status, {"error": {
+                    "message": "Mock LLM injected failure", "type": "server_error", "code": behaviour.error_status}})
+                return
+
+            tokens = behaviour.completion(messages, body.get("max_tokens") or 0)
+            behaviour.count(completion_tokens=len(tokens))
+            prompt_tokens = _prompt_tokens(messages)
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                     "total_tokens": prompt_tokens + len(tokens)}
+            base = {"id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}", "created": int(time.time()),
+                    "model": body.get("model") or MOCK_MODEL}
+            if not stream:
+                time.sleep(behaviour.delay(behaviour.ttft_ms) + behaviour.delay(behaviour.token_ms) * len(tokens))
+                self._send_json(200, {**base, "object": "chat.completion", "usage": usage, "choices": [{
+                    "index": 0, "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                    "finish_reason": "stop"}]})
+                return
+
+            # Server-sent events over a chunked response, like the OpenAI streaming API
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            chunk = {**base, "object": "chat.completion.chunk"}
+            try:
+                time.sleep(behaviour.delay(behaviour.ttft_ms))
+                for i, token in enumerate(tokens):
+                    if behaviour.disconnect_after and i == behaviour.disconnect_after:
+                        # Mid-stream failure: no terminating chunk
+                        self.close_connection = True
+                        return
+                    if i:
+                        time.sleep(behaviour.delay(behaviour.token_ms))
+                    delta = {"content": token, **({"role": "assistant"} if i == 0 else {})}
+                    self._write_chunk("data: " + json.dumps({**chunk, "choices": [
+                        {"index": 0, "delta": delta, "finish_reason": None}]}) + "\n\n")
+                self._write_chunk("data: " + json.dumps({**chunk, "choices": [
+                    {"index": 0, "delta": {}, "finish_reason": "stop"}]}) + "\n\n")
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    self._write_chunk("data: " + json.dumps({**chunk, "choices": [], "usage": usage}) + "\n\n")
+                self._write_chunk("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # Client gave up (deadline / hedged request won)
+                self.close_connection = True
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+class MockLLMServer:
+    """OpenAI-compatible /v1/chat/completions (plain and streaming) for offline load tests."""
+
+    def __init__(self, behaviour: MockLLMBehaviour = None, host: str = "127.0.0.1", port: int = 0):
+        self.behaviour = behaviour or MockLLMBehaviour()
+        self.server = ThreadingHTTPServer((host, port), _handler(self.behaviour))
+        self.server.daemon_threads = True
+        self.base_url = f"http://{host}:{self.server.server_address[1]}/v1"
+        self._thread = None
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="mock-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.behaviour.counts)
+
+
+def use_mock_llm(base_url: str, config: Dict):
+    """
+    Points the configured provider and its fallback at the mock via the usual
+    environment overrides ({PROVIDER}_BASE_URL / _MODEL and the api_key_env variable).
+    Must run before LLMClient / RAGGenerator are created.
+    """
+    providers = [config.get("provider", "doubao"), config.get("llm", {}).get("fallback_provider")]
+    for provider in filter(None, providers):
+        conf = config.get(provider) or {}
+        os.environ[f"{provider.upper()}_BASE_URL"] = base_url
+        os.environ[f"{provider.upper()}_MODEL"] = MOCK_MODEL
+        if conf.get("api_key_env"):
+            os.environ[conf["api_key_env"]] = "mock-key"
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    group = parser.add_argument_group("mock LLM")
+    group.add_argument("--mock-ttft-ms", type=float, default=300.0, help="Latency before the first token")
+    group.add_argument("--mock-token-ms", type=float, default=20.0, help="Latency per completion token")
+    group.add_argument("--mock-tokens", type=int, default=64, help="Completion length in tokens")
+    group.add_argument("--mock-jitter", type=float, default=0.2, help="Relative latency jitter (0.2 = ±20%%)")
+    group.add_argument("--mock-error-rate", type=float, default=0.0, help="Share of requests that fail")
+    group.add_argument("--mock-error-status", type=int, default=500, help="HTTP status of injected failures")
+    group.add_argument("--mock-disconnect-after", type=int, default=0,
+                       help="Drop streams after this many tokens (0 = never)")
+
+
+def behaviour_from_args(args) -> MockLLMBehaviour:
+    return MockLLMBehaviour(ttft_ms=args.mock_ttft_ms, token_ms=args.mock_token_ms, tokens=args.mock_tokens,
+                            jitter=args.mock_jitter, error_rate=args.mock_error_rate,
+                            error_status=args.mock_error_status, disconnect_after=args.mock_disconnect_after)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM server with configurable latency.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockLLMServer(behaviour_from_args(args), host=args.host, port=args.port)
+    print(f"[Info] Mock LLM at {server.base_url}. Point a provider at it, e.g.:")
+    print(f"  DEEPSEEK_BASE_URL={server.base_url} DEEPSEEK_MODEL={MOCK_MODEL} DEEPSEEK_API_KEY=mock-key")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from typing import Any, Dict
+
+# Add src to path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+
+from utils.paths import SRC_DIR
+from utils.profiling import add_profile_arguments, profiled
+from benchmark.common import (
+    BENCHMARK_DIR, environment, save_results, resolve_baseline, load_results, compare, emit_result, run_child,
+)
+from benchmark.fixture_server import FixtureServer, SyntheticDocs, RecordedDocs
+
+STAGES = ("crawl", "process", "index")
+
+REGRESSION_CHECKS = [
+    ("stages.crawl.pages_per_sec", "higher", 0.20, "rel"),
+    ("stages.process.blocks_per_sec", "higher", 0.20, "rel"),
+    ("stages.index.embeddings_per_sec", "higher", 0.20, "rel"),
+    ("stages.crawl.peak_rss_mb", "lower", 0.10, "rel"),
+    ("stages.process.peak_rss_mb", "lower", 0.10, "rel"),
+    ("stages.index.peak_rss_mb", "lower", 0.10, "rel"),
+]
+
+
+# --- Stage workers (run in a fresh interpreter each, so peak RSS is per stage) ---
+
+def _work_crawl(args) -> Dict[str, Any]:
+    from crawler.byteplus_crawler import crawl_source
+
+    with open(args.sources, "r", encoding="utf-8") as f:
+        sources = json.load(f)
+    start_t = time.perf_counter()
+    with profiled("crawl", args):
+        pages = sum(crawl_source(e["url"], e["source_name"], args.raw_dir, args.max_pages, args.delay)
+                    for e in sources)
+    return {"pages": pages, "work_sec": time.perf_counter() - start_t}
+
+
+def _work_process(args) -> Dict[str, Any]:
+    # The processor imports its parser as a top-level module
+    sys.path.append(str(SRC_DIR / "processor"))
+    from processor.simple_rag_processor import process_directory
+
+    start_t = time.perf_counter()
+    with profiled("process", args):
+        blocks = process_directory(args.raw_dir, args.blocks)
+    return {"blocks": len(blocks), "chars": sum(len(b["content"]) for b in blocks),
+            "work_sec": time.perf_counter() - start_t}
+
+
+def _work_index(args) -> Dict[str, Any]:
+    from utils import metrics
+    from embedding.embedder import RAGEmbedder
+    from retrieval.build_index import build_full
+    from retrieval import index_store
+    from pathlib import Path
+
+    with open(args.blocks, "r", encoding="utf-8") as f:
+        blocks = json.load(f)
+    load_t = time.perf_counter()
+    embedder = RAGEmbedder(args.config)
+    model_load_sec = time.perf_counter() - load_t
+    index_file, meta_file = index_store.artifact_paths(Path(args.index_dir))
+    start_t = time.perf_counter()
+    with profiled("index", args), metrics.trace("benchmark.index") as t:
+        build_full(blocks, index_file, meta_file, embedder=embedder)
+    stages = t.stage_ms()
+    return {"embeddings": len(blocks), "work_sec": time.perf_counter() - start_t,
+            "embed_sec": stages.get("embed", 0.0) / 1000, "model_load_sec": model_load_sec}
+
+
+WORKERS = {"crawl": _work_crawl, "process": _work_process, "index": _work_index}
+
+
+def run_worker(args):
+    emit_result(WORKERS[args.worker](args))
+
+
+# --- Driver ---
+
+def run_stage(stage: str, paths: Dict[str, str], args) -> Dict[str, Any]:
+    """Runs one stage in a child process; returns its counters plus wall time and peak RSS."""
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker", stage,
+           "--sources", paths["sources"], "--raw-dir", paths["raw_dir"], "--blocks", paths["blocks"],
+           "--index-dir", paths["index_dir"], "--delay", str(args.delay), "--max-pages", str(args.max_pages)]
+    if args.config:
+        cmd += ["--config", args.config]
+    if args.profile:
+        # Profiles only the timed work of each stage, one set of files per stage
+        cmd += ["--profile", args.profile, "--profile-top", str(args.profile_top),
+                "--profile-interval-ms", str(args.profile_interval_ms),
+                "--profile-dir", args.profile_dir or str(BENCHMARK_DIR / "pipeline" / "profiles")]
+        if args.profile_memory:
+            cmd.append("--profile-memory")
+    log_path = os.path.join(paths["workdir"], f"{stage}.log")
+    print(f"[Info] Stage {stage}...")
+    try:
+        return run_child(cmd, log_path)
+    except RuntimeError as e:
+        raise RuntimeError(f"Stage {stage}: {e}") from None
+
+
+def run(args) -> Dict[str, Any]:
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag-pipeline-bench-")
+    paths = {
+        "workdir": workdir,
+        "sources": os.path.join(workdir, "urls.json"),
+        "raw_dir": os.path.join(workdir, "raw"),
+        "blocks": os.path.join(workdir, "processed", "blocks.json"),
+        "index_dir": os.path.join(workdir, "index"),
+    }
+    os.makedirs(paths["index_dir"], exist_ok=True)
+
+    docs = RecordedDocs(args.recorded) if args.recorded else SyntheticDocs(args.pages, args.paragraphs)
+    server = FixtureServer(docs, latency_ms=args.latency_ms).start()
+    try:
+        with open(paths["sources"], "w", encoding="utf-8") as f:
+            json.dump([{"url": server.seed_url, "source_name": "fixture_docs"}], f)
+        print(f"[Info] Fixture server {server.base_url} with {len(docs.slugs)} pages; work dir {workdir}")
+
+        stages = {}
+        for stage in STAGES:
+            stages[stage] = run_stage(stage, paths, args)
+    finally:
+        server.stop()
+        if not args.workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    crawl, process, index = stages["crawl"], stages["process"], stages["index"]
+    crawl["pages_per_sec"] = crawl["pages"] / crawl["work_sec"] if crawl["work_sec"] else 0.0
+    process["blocks_per_sec"] = process["blocks"] / process["work_sec"] if process["work_sec"] else 0.0
+    index["embeddings_per_sec"] = index["embeddings"] / index["embed_sec"] if index["embed_sec"] else 0.0
+    index["blocks_per_sec"] = index["embeddings"] / index["work_sec"] if index["work_sec"] else 0.0
+
+    return {
+        "kind": "pipeline",
+        "label": args.label,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "setup": {
+            "docs": "recorded" if args.recorded else "synthetic",
+            "recorded": args.recorded,
+            "pages_served": len(docs.slugs),
+            "paragraphs": None if args.recorded else args.paragraphs,
+            "crawl_delay_sec": args.delay,
+            "server_latency_ms": args.latency_ms,
+            "config": args.config,
+        },
+        "environment": environment(),
+        "stages": stages,
+        "total_wall_sec": sum(s["wall_sec"] for s in stages.values()),
+    }
+
+
+def print_summary(result: Dict[str, Any]):
+    s = result["stages"]
+    print("\n" + "=" * 30 + " PIPELINE BENCHMARK " + "=" * 30)
+    print(f"Docs: {result['setup']['docs']} ({result['setup']['pages_served']} pages), "
+          f"crawl delay {result['setup']['crawl_delay_sec']}s, server latency {result['setup']['server_latency_ms']}ms")
+    print(f"{'stage':<10}{'items':>10}{'rate':>22}{'work s':>10}{'wall s':>10}{'cpu s':>10}{'peak RSS':>12}")
+    rows = [
+        ("crawl", s["crawl"]["pages"], f"{s['crawl']['pages_per_sec']:.1f} pages/s"),
+        ("process", s["process"]["blocks"], f"{s['process']['blocks_per_sec']:.1f} blocks/s"),
+        ("index", s["index"]["embeddings"], f"{s['index']['embeddings_per_sec']:.1f} embeddings/s"),
+    ]
+    for name, items, rate in rows:
+        st = s[name]
+        print(f"{name:<10}{items:>10}{rate:>22}{st['work_sec']:>10.2f}{st['wall_sec']:>10.2f}"
+              f"{st['cpu_sec']:>10.2f}{st['peak_rss_mb']:>10.0f}MB")
+    print(f"Index model load: {s['index']['model_load_sec']:.1f}s (excluded from work time)")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline crawl -> process -> index benchmark against a local docs fixture server.")
+    parser.add_argument("--pages", type=int, default=200, help="Synthetic pages to serve (incl. seed)")
+    parser.add_argument("--paragraphs", type=int, default=12, help="Paragraphs per synthetic page")
+    parser.add_argument("--recorded", default=None, help="Serve crawler output instead (e.g. data/raw/byteplus_ecs)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated server latency per request")
+    parser.add_argument("--delay", type=float, default=0.0, help="Crawler delay per request (the crawler default is 0.3)")
+    parser.add_argument("--max-pages", type=int, default=100000, help="Crawler page limit")
+    parser.add_argument("--config", default=None, help="rag_config.yaml variant for the index stage")
+    parser.add_argument("--workdir", default=None, help="Keep stage outputs and logs here (default: temp dir)")
+    parser.add_argument("--keep", action="store_true", help="Don't delete the temp work dir")
+    parser.add_argument("--label", default="run", help="Name for the saved results file")
+    parser.add_argument("--compare", default=None, metavar="PATH|latest", help="Compare against a saved run")
+    parser.add_argument("--no-save", action="store_true", help="Don't write results to data/benchmarks/pipeline/")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions")
+    add_profile_arguments(parser)
+    # Internal: run a single stage in this process
+    parser.add_argument("--worker", choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--sources", help=argparse.SUPPRESS)
+    parser.add_argument("--raw-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--blocks", help=argparse.SUPPRESS)
+    parser.add_argument("--index-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    result = run(args)
+    print_summary(result)
+
+    saved = None
+    if not args.no_save:
+        saved = save_results("pipeline", args.label, result)
+        print(f"\n[Info] Results saved to {saved}")
+
+    if args.compare:
+        baseline_path = resolve_baseline("pipeline", args.compare, exclude=saved)
+        if baseline_path is None or not baseline_path.exists():
+            print(f"[Warning] No baseline found for '{args.compare}'")
+            return
+        print(f"[Info] Comparing with {baseline_path}")
+        regressions = compare(result, load_results(baseline_path), REGRESSION_CHECKS)
+        if regressions:
+            print(f"\n[Warning] {len(regressions)} regression(s): {', '.join(regressions)}")
+            if args.fail_on_regression:
+                sys.exit(1)
+        else:
+            print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+# Add src to path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+
+from utils.paths import ROOT_DIR, CONFIG_DIR
+from utils.dates import time_range_from_text
+from retrieval import index_store
+from retrieval.lexical import is_lexical_query
+from benchmark.common import (
+    environment, latency_summary, save_results, resolve_baseline, load_results, compare,
+)
+from benchmark.mock_llm_server import MockLLMServer, add_mock_arguments, behaviour_from_args, use_mock_llm
+
+QUERY_LOG_PATH = ROOT_DIR / "logs" / "queries.jsonl"
+# How each captured endpoint is replayed
+ENDPOINT_MODES = {"search": "search", "answer": "answer", "answer_stream": "stream", "chat": "stream"}
+MODES = ("recorded", "search", "answer", "stream")
+
+REGRESSION_CHECKS = [
+    ("summary.throughput_rps", "higher", 0.10, "rel"),
+    ("summary.error_rate", "lower", 0.01, "abs"),
+    ("summary.latency.p50_ms", "lower", 0.20, "rel"),
+    ("summary.latency.p99_ms", "lower", 0.20, "rel"),
+    ("summary.ttft.p50_ms", "lower", 0.20, "rel"),
+]
+
+
+def load_workload(path: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Captured queries (utils/query_log.py format), in timestamp order."""
+    with open(path, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    records.sort(key=lambda r: r["ts"])
+    return records[:limit] if limit else records
+
+
+def workload_from_eval_set(path: str, requests: int, rate: float, endpoint: str = "search") -> List[Dict[str, Any]]:
+    """Synthetic workload when there is no captured log: evaluation-set queries at a fixed rate."""
+    from benchmark.retrieval_bench import load_eval_set
+
+    items = load_eval_set(path)
+    return [{"ts": i / rate, "endpoint": endpoint, "query": items[i % len(items)]["query"], "top_k": 3,
+             "filters": items[i % len(items)].get("filters")} for i in range(requests)]
+
+
+class Replayer:
+    """
+    Open-loop replay: each request is issued at its (scaled) original offset, whether
+    or not earlier ones have finished, on at most `concurrency` worker threads.
+    Latency is measured from the scheduled time, so time spent waiting for a free
+    worker under overload counts (no coordinated omission); service time excludes it.
+    """
+
+    def __init__(self, searcher, generator=None, concurrency: int = 8, mode: str = "recorded"):
+        self.searcher = searcher
+        self.generator = generator
+        self.concurrency = concurrency
+        self.mode = mode
+        self._lock = threading.Lock()
+        self.samples: List[Dict[str, Any]] = []
+
+    def mode_of(self, record: Dict[str, Any]) -> str:
+        if self.mode != "recorded":
+            return self.mode
+        return ENDPOINT_MODES.get(record.get("endpoint"), "search")
+
+    def _retrieve(self, record: Dict[str, Any]):
+        """Same flow as the web UI / API: time filter, lexical fast path, dense+hybrid search, rewrites."""
+        searcher, query = self.searcher, record["query"]
+        top_k, shards, mmr_lambda = record.get("top_k") or 3, record.get("shards"), record.get("mmr_lambda")
+        filters = dict(record.get("filters") or {})
+        time_range = time_range_from_text(query) if record.get("auto_time_filter", True) else None
+        if time_range:
+            filters["time_from"], filters["time_to"] = time_range
+
+        rewriter = self.generator.rewriter if self.generator is not None else None
+        pending = None
+        if rewriter and record.get("rewrite", True) and not (searcher.lexical_fast_path and is_lexical_query(query)):
+            pending = rewriter.submit(query)
+
+        def attempt(filters):
+            lexical = searcher.lexical_lookup(query, top_k, filters, shards)
+            if lexical is not None:
+                return lexical, None
+            vector = searcher.embedder.encode(query)
+            return searcher.search_vector(vector, top_k=top_k, filters=filters, shards=shards,
+                                          mmr_lambda=mmr_lambda, query_text=query), vector
+
+        results, vector = attempt(filters)
+        if not results and time_range:
+            filters.pop("time_from")
+            filters.pop("time_to")
+            results, vector = attempt(filters)
+        if pending is not None and vector is not None:
+            rewrites = rewriter.wait(pending)
+            if rewrites:
+                results = searcher.search_rewrites(results, rewrites, top_k=top_k, filters=filters,
+                                                   shards=shards, mmr_lambda=mmr_lambda)
+        return results, vector
+
+    def _execute(self, record: Dict[str, Any], scheduled: float):
+        from generator.generate import BUSY_MESSAGE
+
+        started = time.perf_counter()
+        mode = self.mode_of(record)
+        sample = {"endpoint": record.get("endpoint", "search"), "mode": mode,
+                  "queue_ms": (started - scheduled) * 1000, "error": None, "degraded": False}
+        try:
+            results, vector = self._retrieve(record)
+            sample["retrieval_ms"] = (time.perf_counter() - started) * 1000
+            answer = None
+            if mode == "answer":
+                result = self.generator.answer(record["query"], results, query_vector=vector,
+                                               index_version=self.searcher.version)
+                answer = result["answer"]
+            elif mode == "stream":
+                stream = self.generator.answer_stream(record["query"], results, query_vector=vector,
+                                                      index_version=self.searcher.version)
+                answer = "".join(stream)
+                sample["ttft_ms"] = stream.debug.get("ttft_ms")
+            if answer is not None:
+                # LLM failures come back as error text rather than exceptions
+                if answer == BUSY_MESSAGE:
+                    sample["degraded"] = True
+                elif answer.startswith("Error"):
+                    sample["error"] = answer[:200]
+        except Exception as e:
+            sample["error"] = f"{type(e).__name__}: {e}"[:200]
+        finished = time.perf_counter()
+        sample["service_ms"] = (finished - started) * 1000
+        sample["latency_ms"] = (finished - scheduled) * 1000
+        with self._lock:
+            self.samples.append(sample)
+
+    def run(self, workload: List[Dict[str, Any]], speed: float = 1.0, rate: Optional[float] = None) -> float:
+        """Replays the workload; returns the wall time in seconds."""
+        t0 = workload[0]["ts"] if workload else 0.0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="replay") as pool:
+            for i, record in enumerate(workload):
+                offset = i / rate if rate else (record["ts"] - t0) / speed
+                delay = start + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self._execute, record, start + offset)
+        return time.perf_counter() - start
+
+
+def summarize(samples: List[Dict[str, Any]], wall_sec: float, offered_sec: float) -> Dict[str, Any]:
+    def section(group: List[Dict[str, Any]]) -> Dict[str, Any]:
+        ok = [s for s in group if not s["error"]]
+        errors = len(group) - len(ok)
+        return {
+            "requests": len(group),
+            "errors": errors,
+            "error_rate": errors / len(group) if group else 0.0,
+            "degraded": sum(1 for s in group if s["degraded"]),
+            "latency": latency_summary([s["latency_ms"] for s in ok]),
+            "service": latency_summary([s["service_ms"] for s in ok]),
+            "queue": latency_summary([s["queue_ms"] for s in group]),
+            "ttft": latency_summary([s["ttft_ms"] for s in ok if s.get("ttft_ms") is not None]),
+        }
+
+    summary = section(samples)
+    summary["wall_sec"] = wall_sec
+    summary["offered_rps"] = len(samples) / offered_sec if offered_sec else 0.0
+    summary["throughput_rps"] = (summary["requests"] - summary["errors"]) / wall_sec if wall_sec else 0.0
+    summary["by_mode"] = {mode: section([s for s in samples if s["mode"] == mode])
+                          for mode in sorted({s["mode"] for s in samples})}
+    error_counts: Dict[str, int] = {}
+    for s in samples:
+        if s["error"]:
+            error_counts[s["error"]] = error_counts.get(s["error"], 0) + 1
+    summary["top_errors"] = sorted(error_counts.items(), key=lambda kv: -kv[1])[:5]
+    return summary
+
+
+def run(args) -> Dict[str, Any]:
+    from generator.llm_client import load_config, load_env
+    from retrieval.search_engine import SimpleRAGSearcher
+
+    config_path = args.config or str(CONFIG_DIR / "rag_config.yaml")
+    if args.eval_set:
+        workload = workload_from_eval_set(args.eval_set, args.requests, args.rate or 2.0, args.endpoint)
+    else:
+        workload = load_workload(args.log, args.limit)
+    if not workload:
+        raise ValueError("Empty workload")
+
+    mock = None
+    if args.mock_llm:
+        # .env first, so the mock overrides (not the other way round)
+        load_env()
+        mock = MockLLMServer(behaviour_from_args(args)).start()
+        use_mock_llm(mock.base_url, load_config(config_path))
+        print(f"[Info] Mock LLM at {mock.base_url}")
+    try:
+        if args.version:
+            shard_paths, version = index_store.shard_paths(index_store.VERSIONS_DIR / args.version), args.version
+        else:
+            shard_paths, version = index_store.current_shard_paths()
+        # The shadow candidate would share this process and skew its latency / RSS
+        searcher = SimpleRAGSearcher(shard_paths=shard_paths, version=version, shadow=False)
+        replayer = Replayer(searcher, concurrency=args.concurrency, mode=args.mode)
+        # The generator (and its LLM client) is only needed if anything calls the LLM
+        if any(replayer.mode_of(r) != "search" for r in workload):
+            from generator.generate import RAGGenerator
+            replayer.generator = RAGGenerator(config_path)
+
+        offered_sec = len(workload) / args.rate if args.rate else (
+            (workload[-1]["ts"] - workload[0]["ts"]) / args.speed or 1.0)
+        print(f"[Info] Replaying {len(workload)} requests over ~{offered_sec:.1f}s "
+              f"with {args.concurrency} workers (mode: {args.mode})")
+        wall_sec = replayer.run(workload, speed=args.speed, rate=args.rate)
+    finally:
+        if mock is not None:
+            mock.stop()
+
+    return {
+        "kind": "replay",
+        "label": args.label,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "setup": {
+            "workload": args.eval_set or str(args.log),
+            "requests": len(workload),
+            "mode": args.mode,
+            "speed": args.speed,
+            "rate": args.rate,
+            "concurrency": args.concurrency,
+            "index_version": version,
+            "config": config_path,
+            "mock_llm": {
+                "ttft_ms": args.mock_ttft_ms, "token_ms": args.mock_token_ms, "tokens": args.mock_tokens,
+                "jitter": args.mock_jitter, "error_rate": args.mock_error_rate,
+                "server": mock.stats(),
+            } if mock else None,
+        },
+        "environment": environment(),
+        "summary": summarize(replayer.samples, wall_sec, offered_sec),
+    }
+
+
+def print_summary(result: Dict[str, Any]):
+    s = result["summary"]
+    print("\n" + "=" * 30 + " REPLAY " + "=" * 30)
+    print(f"Requests: {s['requests']} in {s['wall_sec']:.1f}s | offered {s['offered_rps']:.2f} req/s, "
+          f"throughput {s['throughput_rps']:.2f} req/s")
+    print(f"Errors: {s['errors']} ({s['error_rate']:.1%}) | degraded (busy): {s['degraded']}")
+    print(f"{'mode':<10}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>12}{'p99 ms':>10}"
+          f"{'max ms':>10}{'queue p99':>11}{'ttft p50':>10}")
+    for mode, m in [("all", s)] + list(s["by_mode"].items()):
+        lat = m["latency"]
+        ttft = f"{m['ttft']['p50_ms']:.0f}" if m["ttft"]["count"] else "-"
+        print(f"{mode:<10}{m['requests']:>10}{m['errors']:>8}{lat['p50_ms']:>10.1f}{lat['p95_ms']:>12.1f}"
+              f"{lat['p99_ms']:>10.1f}{lat['max_ms']:>10.1f}{m['queue']['p99_ms']:>11.1f}{ttft:>10}")
+    for message, count in s["top_errors"]:
+        print(f"  {count}x {message}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured queries against the searcher / generator.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--log", default=str(QUERY_LOG_PATH), help="Captured query log (query_log.path)")
+    source.add_argument("--eval-set", default=None, help="Build a synthetic workload from an evaluation set instead")
+    parser.add_argument("--requests", type=int, default=100, help="Requests in the --eval-set workload")
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINT_MODES), default="search",
+                        help="Endpoint of the --eval-set workload")
+    parser.add_argument("--limit", type=int, default=None, help="Replay only the first N captured queries")
+    parser.add_argument("--speed", type=float, default=1.0, help="Rate multiplier for the original timing (2 = twice as fast)")
+    parser.add_argument("--rate", type=float, default=None, help="Fixed request rate (req/s) instead of the original timing")
+    parser.add_argument("--concurrency", type=int, default=8, help="Max requests in flight")
+    parser.add_argument("--mode", choices=MODES, default="recorded",
+                        help="recorded: search / answer / stream as captured; otherwise force one")
+    parser.add_argument("--config", default=None, help="rag_config.yaml variant")
+    parser.add_argument("--version", default=None, help="Published index version (default: CURRENT)")
+    parser.add_argument("--mock-llm", action="store_true", help="Answer LLM calls from a local mock server")
+    add_mock_arguments(parser)
+    parser.add_argument("--label", default="run", help="Name for the saved results file")
+    parser.add_argument("--compare", default=None, metavar="PATH|latest", help="Compare against a saved run")
+    parser.add_argument("--no-save", action="store_true", help="Don't write results to data/benchmarks/replay/")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions")
+    args = parser.parse_args()
+
+    result = run(args)
+    print_summary(result)
+
+    saved = None
+    if not args.no_save:
+        saved = save_results("replay", args.label, result)
+        print(f"\n[Info] Results saved to {saved}")
+
+    if args.compare:
+        baseline_path = resolve_baseline("replay", args.compare, exclude=saved)
+        if baseline_path is None or not baseline_path.exists():
+            print(f"[Warning] No baseline found for '{args.compare}'")
+            return
+        print(f"[Info] Comparing with {baseline_path}")
+        regressions = compare(result, load_results(baseline_path), REGRESSION_CHECKS)
+        if regressions:
+            print(f"\n[Warning] {len(regressions)} regression(s): {', '.join(regressions)}")
+            if args.fail_on_regression:
+                sys.exit(1)
+        else:
+            print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Add src to path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+
+from utils.paths import DATA_DIR, CONFIG_DIR
+from utils import metrics
+from utils.profiling import add_profile_arguments, profiled
+from retrieval import index_store
+from benchmark.common import (
+    BENCHMARK_DIR, current_rss_mb, peak_rss_mb, latency_summary, percentile, environment,
+    save_results, resolve_baseline, load_results, compare,
+)
+
+EVAL_SET_PATH = DATA_DIR / "evaluation_set.jsonl"
+K_VALUES = (1, 3, 5, 10)
+
+# Quality may not drop by more than 0.02 (absolute); latency/memory by more than 20% / 10%
+REGRESSION_CHECKS = [(f"summary.recall@{k}", "higher", 0.02, "abs") for k in K_VALUES] + [
+    ("summary.mrr", "higher", 0.02, "abs"),
+    ("summary.latency.p50_ms", "lower", 0.20, "rel"),
+    ("summary.latency.p99_ms", "lower", 0.20, "rel"),
+    ("summary.memory.peak_rss_mb", "lower", 0.10, "rel"),
+]
+
+
+def load_eval_set(path: str) -> List[Dict[str, Any]]:
+    """
+    One JSON object per line:
+      {"id": ..., "query": ..., "concepts": [["snapshot"], ["custom image", "image template"]],
+       "filters": {...} (optional)}
+    Each concept is a list of alternative phrasings; a retrieved block covers the
+    concept if its title or content contains any of them (case-insensitive).
+    """
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            item = json.loads(line)
+            if not item.get("query") or not item.get("concepts"):
+                raise ValueError(f"{path}:{line_no}: 'query' and 'concepts' are required")
+            item.setdefault("id", f"line{line_no}")
+            item["concepts"] = [[alt.lower() for alt in concept] for concept in item["concepts"]]
+            items.append(item)
+    return items
+
+
+def covered_concepts(result, concepts: List[List[str]]) -> set:
+    text = f"{result.source_meta.get('title', '')}\n{result.content}".lower()
+    return {i for i, alternatives in enumerate(concepts) if any(alt in text for alt in alternatives)}
+
+
+def score_ranking(results: List, concepts: List[List[str]]) -> Dict[str, float]:
+    """recall@k = share of concepts covered by the top k blocks; rr = 1 / rank of the first relevant block."""
+    covered_by_rank = [covered_concepts(r, concepts) for r in results]
+    scores = {}
+    for k in K_VALUES:
+        covered = set().union(*covered_by_rank[:k]) if covered_by_rank else set()
+        scores[f"recall@{k}"] = len(covered) / len(concepts)
+    scores["rr"] = next((1.0 / rank for rank, c in enumerate(covered_by_rank, 1) if c), 0.0)
+    return scores
+
+
+def build_temporary_index(blocks_path: str, embedder, workdir: str):
+    """Indexes a processor output (e.g. from another chunking config) into `workdir`."""
+    from retrieval.build_index import build_full
+
+    with open(blocks_path, "r", encoding="utf-8") as f:
+        blocks = json.load(f)
+    index_file, meta_file = index_store.artifact_paths(Path(workdir))
+    start_t = time.perf_counter()
+    build_full(blocks, index_file, meta_file, embedder=embedder)
+    return index_file, meta_file, len(blocks), (time.perf_counter() - start_t) * 1000
+
+
+def run(args) -> Dict[str, Any]:
+    from embedding.embedder import RAGEmbedder
+    from retrieval.search_engine import SimpleRAGSearcher
+
+    eval_set = load_eval_set(args.eval_set)
+    rss_start = current_rss_mb()
+    embedder = RAGEmbedder(args.config, model_name=args.model)
+    rss_model = current_rss_mb()
+
+    workdir = None
+    build_ms = None
+    # No shadow candidate in the measured process; --no-rerank also skips loading the cross-encoder
+    searcher_opts = {"rerank": not args.no_rerank, "shadow": False}
+    try:
+        if args.blocks:
+            workdir = tempfile.mkdtemp(prefix="rag-bench-")
+            index_file, meta_file, n_blocks, build_ms = build_temporary_index(args.blocks, embedder, workdir)
+            print(f"[Info] Indexed {n_blocks} blocks from {args.blocks} in {build_ms:.0f} ms")
+            searcher = SimpleRAGSearcher(index_file, meta_file, embedder=embedder, **searcher_opts)
+        elif args.index:
+            searcher = SimpleRAGSearcher(args.index, args.meta, embedder=embedder, **searcher_opts)
+        else:
+            if args.version:
+                shard_paths, version = index_store.shard_paths(index_store.VERSIONS_DIR / args.version), args.version
+            else:
+                shard_paths, version = index_store.current_shard_paths()
+            searcher = SimpleRAGSearcher(shard_paths=shard_paths, version=version, embedder=embedder,
+                                         **searcher_opts)
+        rss_index = current_rss_mb()
+
+        max_k = max(K_VALUES) if args.top_k is None else args.top_k
+        plan = searcher.plan(max_k, args.mmr_lambda)
+        if args.no_rerank:
+            plan["rerank"] = False
+
+        def search_once(item):
+            filters = item.get("filters")
+            lexical = searcher.lexical_lookup(item["query"], max_k, filters)
+            if lexical is not None:
+                return lexical
+            vector = searcher.embedder.encode(item["query"])
+            candidates = searcher.first_stage(vector, plan["fetch_k"], filters)[0]
+            return searcher.second_stage(vector, candidates, plan, filters, query_text=item["query"])
+
+        # Warm-up: model kernels, page cache for memory-mapped files, reranker
+        for item in eval_set[:args.warmup]:
+            search_once(item)
+
+        per_query = []
+        all_latencies = []
+        stage_samples: Dict[str, List[float]] = {}
+        with profiled("retrieval", args, artifact_dir=BENCHMARK_DIR / "retrieval"):
+            for item in eval_set:
+                latencies = []
+                results = None
+                for _ in range(args.repeat):
+                    with metrics.trace("benchmark.retrieval") as t:
+                        start_t = time.perf_counter()
+                        results = search_once(item)
+                        latencies.append((time.perf_counter() - start_t) * 1000)
+                    for stage, ms in t.stage_ms().items():
+                        stage_samples.setdefault(stage, []).append(ms)
+                all_latencies += latencies
+                scores = score_ranking(results, item["concepts"])
+                per_query.append({
+                    "id": item["id"],
+                    "category": item.get("category"),
+                    "query": item["query"],
+                    **scores,
+                    "latency_p50_ms": percentile(latencies, 0.5),
+                    "top_blocks": [r.block_id for r in results[:5]],
+                })
+                print(f"  {item['id']:<28} recall@3={scores['recall@3']:.2f} rr={scores['rr']:.2f} "
+                      f"p50={percentile(latencies, 0.5):.1f}ms")
+
+        summary = {f"recall@{k}": sum(q[f"recall@{k}"] for q in per_query) / len(per_query) for k in K_VALUES}
+        summary["mrr"] = sum(q["rr"] for q in per_query) / len(per_query)
+        summary["latency"] = latency_summary(all_latencies)
+        summary["stages_p50_ms"] = {stage: percentile(v, 0.5) for stage, v in sorted(stage_samples.items())}
+        summary["memory"] = {
+            "rss_start_mb": rss_start,
+            "model_mb": rss_model - rss_start,
+            "index_mb": rss_index - rss_model,
+            "rss_end_mb": current_rss_mb(),
+            "peak_rss_mb": peak_rss_mb(),
+            "index_vectors_mb": sum(s.index.ntotal for s in searcher.shards.values())
+                                * searcher.embedder.embedding_dim * 4 / 2**20,
+        }
+
+        return {
+            "kind": "retrieval",
+            "label": args.label,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "setup": {
+                "eval_set": str(args.eval_set),
+                "queries": len(eval_set),
+                "repeat": args.repeat,
+                "config": str(args.config or CONFIG_DIR / "rag_config.yaml"),
+                "model": searcher.embedder.model_name,
+                "index_version": searcher.version,
+                "blocks": args.blocks,
+                "build_ms": build_ms,
+                "vectors": sum(s.index.ntotal for s in searcher.shards.values()),
+                "shards": searcher.shard_names,
+                "plan": plan,
+            },
+            "environment": environment(),
+            "summary": summary,
+            "queries": per_query,
+        }
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_summary(result: Dict[str, Any]):
+    s = result["summary"]
+    print("\n" + "=" * 30 + " RETRIEVAL BENCHMARK " + "=" * 30)
+    print(f"Model: {result['setup']['model']} | Index: {result['setup']['index_version']} "
+          f"({result['setup']['vectors']} vectors) | Queries: {result['setup']['queries']} x {result['setup']['repeat']}")
+    print("  ".join(f"recall@{k}={s[f'recall@{k}']:.3f}" for k in K_VALUES) + f"  MRR={s['mrr']:.3f}")
+    lat = s["latency"]
+    print(f"Latency: p50={lat['p50_ms']:.1f}ms p95={lat['p95_ms']:.1f}ms p99={lat['p99_ms']:.1f}ms")
+    print("Stages (p50): " + ", ".join(f"{k}={v:.1f}ms" for k, v in s["stages_p50_ms"].items()))
+    mem = s["memory"]
+    print(f"Memory: model +{mem['model_mb']:.0f}MB, index +{mem['index_mb']:.0f}MB, peak RSS {mem['peak_rss_mb']:.0f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval quality (recall@k, MRR) and latency/memory benchmark.")
+    parser.add_argument("--eval-set", default=str(EVAL_SET_PATH), help="JSONL evaluation set")
+    parser.add_argument("--config", default=None, help="rag_config.yaml variant (embedding / retrieval / rerank settings)")
+    parser.add_argument("--model", default=None, help="Override embedding.model_name (the index must use the same model)")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--version", default=None, help="Published index version (default: CURRENT)")
+    source.add_argument("--index", default=None, help="Unsharded .index file (with --meta)")
+    source.add_argument("--blocks", default=None,
+                        help="Processor output JSON to index into a temporary directory (e.g. another chunking config)")
+    parser.add_argument("--meta", default=None, help="Metadata JSON for --index")
+    parser.add_argument("--top-k", type=int, default=None, help=f"Results per query (default: {max(K_VALUES)})")
+    parser.add_argument("--mmr-lambda", type=float, default=None, help="Override retrieval.mmr_lambda")
+    parser.add_argument("--no-rerank", action="store_true", help="Skip the cross-encoder stage")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per query")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed warm-up queries")
+    parser.add_argument("--label", default="run", help="Name for the saved results file")
+    parser.add_argument("--compare", default=None, metavar="PATH|latest", help="Compare against a saved run")
+    parser.add_argument("--no-save", action="store_true", help="Don't write results to data/benchmarks/retrieval/")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    if args.index and not args.meta:
+        parser.error("--index requires --meta")
+
+    result = run(args)
+    print_summary(result)
+
+    saved = None
+    if not args.no_save:
+        saved = save_results("retrieval", args.label, result)
+        print(f"\n[Info] Results saved to {saved}")
+
+    if args.compare:
+        baseline_path = resolve_baseline("retrieval", args.compare, exclude=saved)
+        if baseline_path is None or not baseline_path.exists():
+            print(f"[Warning] No baseline found for '{args.compare}'")
+            return
+        print(f"[Info] Comparing with {baseline_path}")
+        regressions = compare(result, load_results(baseline_path), REGRESSION_CHECKS)
+        if regressions:
+            print(f"\n[Warning] {len(regressions)} regression(s): {', '.join(regressions)}")
+            if args.fail_on_regression:
+                sys.exit(1)
+        else:
+            print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,428 @@
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Add src to path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+
+from utils import metrics
+from utils.profiling import add_profile_arguments, profiled
+from retrieval import index_store
+from benchmark.common import (
+    BENCHMARK_DIR, current_rss_mb, latency_summary, environment, save_results, resolve_baseline,
+    load_results, compare, emit_result, run_child, lookup,
+)
+from benchmark.synthetic_corpus import SyntheticCorpus
+
+DEFAULT_SIZES = "10000,100000,1000000"
+# Time filter used for the "filtered" queries (about a twelfth of the dated blocks)
+FILTER = {"time_from": "2024-01-01", "time_to": "2024-03-31"}
+
+# (label, metric path under a size, unit, limit option or None)
+# A design "stops scaling" at the corpus size where its metric crosses the limit.
+TABLE_ROWS = [
+    ("build_index wall", "build.wall_sec", "s", "max_build_sec"),
+    ("  load blocks JSON", "build.stages_sec.load_blocks", "s", None),
+    ("  embed", "build.stages_sec.embed", "s", None),
+    ("  faiss add + write", "build.stages_sec.index", "s", None),
+    ("  write metadata JSON", "build.stages_sec.write_metadata", "s", None),
+    ("  build BM25", "build.stages_sec.build_lexical", "s", None),
+    ("build_index peak RSS", "build.peak_rss_mb", "MB", "max_rss_mb"),
+    ("disk: faiss index", "disk.index_mb", "MB", None),
+    ("disk: metadata JSON", "disk.metadata_mb", "MB", None),
+    ("disk: BM25 postings", "disk.lexical_mb", "MB", None),
+    ("searcher startup", "serve.startup_sec", "s", "max_startup_sec"),
+    ("  load faiss index", "serve.stages_sec.load_index", "s", None),
+    ("  load metadata JSON", "serve.stages_sec.load_metadata", "s", None),
+    ("  id / filter lookups", "serve.stages_sec.build_lookups", "s", None),
+    ("  open BM25 (mmap)", "serve.stages_sec.load_lexical", "s", None),
+    ("searcher RAM (loaded)", "serve.loaded_ram_mb", "MB", None),
+    ("  of which vectors", "serve.vectors_mb", "MB", None),
+    ("serving peak RSS", "serve.peak_rss_mb", "MB", "max_rss_mb"),
+    ("dense search p50", "serve.search.dense.p50_ms", "ms", None),
+    ("dense search p95", "serve.search.dense.p95_ms", "ms", "max_search_ms"),
+    ("hybrid search p95", "serve.search.hybrid.p95_ms", "ms", "max_search_ms"),
+    ("filtered search p95", "serve.search.filtered.p95_ms", "ms", "max_search_ms"),
+    ("lexical search p95", "serve.search.lexical.p95_ms", "ms", "max_search_ms"),
+]
+
+
+def _corpus(args) -> SyntheticCorpus:
+    return SyntheticCorpus(words=args.words, vocab=args.vocab, products=args.products, seed=args.seed)
+
+
+def _embedder(args):
+    """Synthetic (default) or the configured model."""
+    if args.embedder == "model":
+        from embedding.embedder import RAGEmbedder
+        embedder = RAGEmbedder(args.config)
+    else:
+        from benchmark.synthetic_corpus import SyntheticEmbedder
+        embedder = SyntheticEmbedder(args.config, dim=args.dim)
+    return embedder
+
+
+# --- Workers (a fresh interpreter per size and phase, so peak RSS is their own) ---
+
+def _work_build(args) -> Dict[str, Any]:
+    """Same steps as build_index.build for every shard, into a scratch version dir."""
+    from retrieval.build_index import build_full, group_by_shard
+
+    embedder = _embedder(args)
+    start_t = time.perf_counter()
+    with profiled("scale_build", args), metrics.trace("benchmark.scale.build") as t:
+        with metrics.span("load_blocks"):
+            with open(args.blocks_file, "r", encoding="utf-8") as f:
+                blocks = json.load(f)
+        shards = group_by_shard(blocks)
+        for name, shard_blocks in sorted(shards.items()):
+            index_file, meta_file = index_store.artifact_paths(index_store.shard_dir(Path(args.index_dir), name))
+            build_full(shard_blocks, index_file, meta_file, embedder=embedder)
+    stages = {name: ms / 1000 for name, ms in t.stage_ms().items()}
+    stages["index"] = stages.get("add_vectors", 0.0) + stages.get("write_index", 0.0)
+    return {"blocks": len(blocks), "shards": len(shards), "work_sec": time.perf_counter() - start_t,
+            "stages_sec": stages}
+
+
+def _timed(fn, items: List, warmup: int = 3) -> Dict[str, float]:
+    for item in items[:warmup]:
+        fn(item)
+    latencies = []
+    for item in items:
+        start_t = time.perf_counter()
+        fn(item)
+        latencies.append((time.perf_counter() - start_t) * 1000)
+    return latency_summary(latencies)
+
+
+def _work_serve(args) -> Dict[str, Any]:
+    from retrieval.search_engine import SimpleRAGSearcher
+
+    embedder = _embedder(args)
+    queries = _corpus(args).queries(args.queries)
+    lexical_queries = queries[3::4]
+    text_queries = [q for i, q in enumerate(queries) if i % 4 != 3]
+    vectors = embedder.encode(text_queries)
+    rss_before = current_rss_mb()
+
+    start_t = time.perf_counter()
+    with metrics.trace("benchmark.scale.load") as t:
+        # Reranking cost depends on the candidate count, not the corpus size (see retrieval_bench.py);
+        # the shadow candidate would share this process
+        searcher = SimpleRAGSearcher(shard_paths=index_store.shard_paths(Path(args.index_dir)),
+                                     version=f"scale-{args.size}", embedder=embedder, rerank=False, shadow=False)
+    startup_sec = time.perf_counter() - start_t
+    rss_loaded = current_rss_mb()
+    n_vectors = sum(s.index.ntotal for s in searcher.shards.values())
+    dim = next(iter(searcher.shards.values())).index.d
+
+    k = args.top_k
+    pairs = list(zip(vectors, text_queries))
+    runs = {
+        # Flat scan + cross-shard merge only
+        "dense": lambda p: searcher.search_vector(p[0][None, :], k, mmr_lambda=1.0, rerank=False),
+        # Default retrieval minus the encoder and reranker: dense + BM25 fusion + MMR
+        "hybrid": lambda p: searcher.search_vector(p[0][None, :], k, query_text=p[1], rerank=False),
+        # Metadata filter -> subset scan
+        "filtered": lambda p: searcher.search_vector(p[0][None, :], k, filters=FILTER, mmr_lambda=1.0, rerank=False),
+    }
+    search = {}
+    with profiled("scale_search", args):
+        for kind, fn in runs.items():
+            search[kind] = _timed(fn, pairs)
+        search["lexical"] = _timed(lambda q: searcher.search_lexical(q, k), lexical_queries)
+    return {
+        "vectors": n_vectors,
+        "startup_sec": startup_sec,
+        "stages_sec": {name: ms / 1000 for name, ms in t.stage_ms().items()},
+        "rss_before_mb": rss_before,
+        "loaded_ram_mb": rss_loaded - rss_before,
+        "vectors_mb": n_vectors * dim * 4 / 2**20,
+        "rss_after_queries_mb": current_rss_mb(),
+        "search": search,
+    }
+
+
+WORKERS = {"build": _work_build, "serve": _work_serve}
+
+
+def run_worker(args):
+    emit_result(WORKERS[args.worker](args))
+
+
+# --- Driver ---
+
+def _dir_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total / 2**20
+
+
+def disk_usage(index_dir: str) -> Dict[str, float]:
+    usage = {"index_mb": 0.0, "metadata_mb": 0.0, "lexical_mb": 0.0}
+    for index_file, meta_file in index_store.shard_paths(Path(index_dir)).values():
+        usage["index_mb"] += os.path.getsize(index_file) / 2**20
+        usage["metadata_mb"] += os.path.getsize(meta_file) / 2**20
+        usage["lexical_mb"] += _dir_mb(os.path.join(os.path.dirname(index_file), index_store.LEXICAL_DIRNAME))
+    usage["total_mb"] = sum(usage.values())
+    return usage
+
+
+def run_size(size: int, args, workdir: str) -> Dict[str, Any]:
+    size_dir = os.path.join(workdir, str(size))
+    blocks_file = os.path.join(size_dir, "blocks.json")
+    index_dir = os.path.join(size_dir, "index")
+    os.makedirs(index_dir, exist_ok=True)
+
+    print(f"[Info] {size} blocks: generating...")
+    start_t = time.perf_counter()
+    blocks_bytes = _corpus(args).write(blocks_file, size)
+    result = {"blocks": size, "generate_sec": time.perf_counter() - start_t, "blocks_file_mb": blocks_bytes / 2**20}
+
+    base = [sys.executable, os.path.abspath(__file__), "--size", str(size), "--blocks-file", blocks_file,
+            "--index-dir", index_dir, "--embedder", args.embedder, "--dim", str(args.dim),
+            "--words", str(args.words), "--vocab", str(args.vocab), "--products", str(args.products),
+            "--seed", str(args.seed), "--queries", str(args.queries), "--top-k", str(args.top_k)]
+    if args.config:
+        base += ["--config", args.config]
+    if args.profile:
+        base += ["--profile", args.profile, "--profile-top", str(args.profile_top),
+                 "--profile-interval-ms", str(args.profile_interval_ms),
+                 "--profile-dir", args.profile_dir or str(BENCHMARK_DIR / "scale" / "profiles")]
+        if args.profile_memory:
+            base.append("--profile-memory")
+    try:
+        for phase in ("build", "serve"):
+            print(f"[Info] {size} blocks: {phase}...")
+            result[phase] = run_child(base + ["--worker", phase], os.path.join(workdir, f"{size}_{phase}.log"),
+                                      timeout=args.timeout or None)
+            if phase == "build":
+                result["disk"] = disk_usage(index_dir)
+    except RuntimeError as e:
+        result["error"] = str(e).splitlines()[0]
+        print(f"[Warning] {size} blocks: {e}")
+    finally:
+        if not args.keep:
+            shutil.rmtree(size_dir, ignore_errors=True)
+    return result
+
+
+def growth_exponent(sizes: List[int], values: List[Optional[float]]) -> Optional[float]:
+    """Slope of log(value) over log(size) between the two largest measured sizes (1.0 = linear)."""
+    points = [(n, v) for n, v in zip(sizes, values) if v is not None and v > 0]
+    if len(points) < 2:
+        return None
+    (n1, v1), (n2, v2) = points[-2], points[-1]
+    return math.log(v2 / v1) / math.log(n2 / n1)
+
+
+def scaling_limits(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    For each limited metric: the first measured size over its limit, or the size
+    at which it is extrapolated to cross the limit from its growth exponent.
+    """
+    sizes = sorted(int(n) for n in result["sizes"])
+    verdicts = []
+    for label, path, unit, limit_name in TABLE_ROWS:
+        if limit_name is None:
+            continue
+        limit = result["limits"][limit_name]
+        values = [lookup(result["sizes"][str(n)], path) for n in sizes]
+        exponent = growth_exponent(sizes, values)
+        verdict = {"metric": label, "path": path, "limit": limit, "unit": unit, "exponent": exponent}
+        over = next((n for n, v in zip(sizes, values) if v is not None and v > limit), None)
+        measured = [(n, v) for n, v in zip(sizes, values) if v is not None and v > 0]
+        if over is not None:
+            verdict["exceeded_at"] = over
+        elif measured and exponent and exponent > 0.05:
+            n_last, v_last = measured[-1]
+            verdict["extrapolated_limit"] = int(n_last * (limit / v_last) ** (1 / exponent))
+        verdicts.append(verdict)
+    return verdicts
+
+
+def run(args) -> Dict[str, Any]:
+    sizes = sorted(int(s) for s in args.sizes.split(",") if s.strip())
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag-scale-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    print(f"[Info] Sizes {sizes}, {args.embedder} embeddings; work dir {workdir}")
+    per_size = {}
+    try:
+        for size in sizes:
+            per_size[str(size)] = run_size(size, args, workdir)
+            if "error" in per_size[str(size)]:
+                print("[Warning] Skipping larger sizes.")
+                break
+    finally:
+        if not args.workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {
+        "kind": "scale",
+        "label": args.label,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "setup": {
+            "embedder": args.embedder,
+            "dim": args.dim if args.embedder == "synthetic" else None,
+            "words": args.words,
+            "vocab": args.vocab,
+            "products": args.products,
+            "queries": args.queries,
+            "top_k": args.top_k,
+            "config": args.config,
+        },
+        "limits": {
+            "max_search_ms": args.max_search_ms,
+            "max_startup_sec": args.max_startup_sec,
+            "max_build_sec": args.max_build_sec,
+            "max_rss_mb": args.max_rss_mb,
+        },
+        "environment": environment(),
+        "sizes": per_size,
+    }
+    result["scaling"] = scaling_limits(result)
+    return result
+
+
+def _format(value: Optional[float], unit: str) -> str:
+    if value is None:
+        return "-"
+    if unit == "MB" or value >= 100:
+        return f"{value:.0f}"
+    return f"{value:.2f}" if value >= 1 or unit == "ms" else f"{value:.3f}"
+
+
+def print_summary(result: Dict[str, Any]):
+    sizes = [n for n in sorted(result["sizes"], key=int) if "error" not in result["sizes"][n]]
+    print("\n" + "=" * 30 + " SCALE BENCHMARK " + "=" * 30)
+    setup = result["setup"]
+    print(f"Synthetic corpus: ~{setup['words']} words/block, {setup['products']} shards, "
+          f"{setup['embedder']} embeddings; {setup['queries']} queries, top_k {setup['top_k']}")
+    header = f"{'metric':<26}{'unit':>5}" + "".join(f"{int(n):>12,}" for n in sizes) + f"{'growth':>9}"
+    print(header)
+    print("-" * len(header))
+    for label, path, unit, limit_name in TABLE_ROWS:
+        values = [lookup(result["sizes"][n], path) for n in sizes]
+        if all(v is None for v in values):
+            continue
+        limit = result["limits"][limit_name] if limit_name else None
+        cells = "".join(
+            f"{_format(v, unit) + ('!' if limit is not None and v is not None and v > limit else ''):>12}"
+            for v in values
+        )
+        exponent = growth_exponent([int(n) for n in sizes], values)
+        print(f"{label:<26}{unit:>5}{cells}{'n^%.2f' % exponent if exponent is not None else '-':>9}")
+    print("(! = over limit; growth = exponent between the two largest sizes, 1.00 = linear)")
+
+    print("\nWhere each design stops scaling:")
+    for v in result["scaling"]:
+        limit = f"{v['limit']:g} {v['unit']}"
+        if "exceeded_at" in v:
+            verdict = f"over {limit} at {v['exceeded_at']:,} blocks"
+        elif "extrapolated_limit" in v:
+            verdict = f"~{v['extrapolated_limit']:,} blocks to reach {limit} (extrapolated)"
+        elif v["exponent"] is None:
+            verdict = f"within {limit} (two sizes needed to extrapolate)"
+        else:
+            verdict = f"within {limit}, not growing with corpus size"
+        print(f"  {v['metric']:<24} {verdict}")
+    for n, r in result["sizes"].items():
+        if "error" in r:
+            print(f"  {int(n):,} blocks failed: {r['error']}")
+
+
+def regression_checks(result: Dict[str, Any]):
+    checks = []
+    for n, r in result["sizes"].items():
+        if "error" in r:
+            continue
+        checks += [
+            (f"sizes.{n}.build.wall_sec", "lower", 0.20, "rel"),
+            (f"sizes.{n}.build.peak_rss_mb", "lower", 0.10, "rel"),
+            (f"sizes.{n}.serve.startup_sec", "lower", 0.20, "rel"),
+            (f"sizes.{n}.serve.peak_rss_mb", "lower", 0.10, "rel"),
+            (f"sizes.{n}.serve.search.dense.p95_ms", "lower", 0.20, "rel"),
+            (f"sizes.{n}.serve.search.hybrid.p95_ms", "lower", 0.20, "rel"),
+        ]
+    return checks
+
+
+def _half_of_ram_mb() -> float:
+    try:
+        return float(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2**21)
+    except (ValueError, OSError, AttributeError):
+        return 8192.0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Builds, loads and searches synthetic corpora of growing size and reports where each part stops scaling.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"Comma-separated block counts (default {DEFAULT_SIZES})")
+    parser.add_argument("--words", type=int, default=120, help="Median words per block")
+    parser.add_argument("--vocab", type=int, default=50000, help="Vocabulary size of the synthetic text")
+    parser.add_argument("--products", type=int, default=8, help="Sources / index shards")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embedder", choices=["synthetic", "model"], default="synthetic",
+                        help="synthetic: random unit vectors (no model); model: the configured embedding model")
+    parser.add_argument("--dim", type=int, default=384, help="Vector dimension of synthetic embeddings")
+    parser.add_argument("--config", default=None, help="rag_config.yaml variant")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per size (a quarter are identifier lookups)")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=0, help="Seconds per build/serve worker (0 = none)")
+    parser.add_argument("--max-search-ms", type=float, default=100.0, help="Search latency limit (p95)")
+    parser.add_argument("--max-startup-sec", type=float, default=30.0, help="Searcher startup / reload limit")
+    parser.add_argument("--max-build-sec", type=float, default=1800.0, help="Full index rebuild limit")
+    parser.add_argument("--max-rss-mb", type=float, default=_half_of_ram_mb(),
+                        help="Memory limit for building and serving (default: half of this machine's RAM)")
+    parser.add_argument("--workdir", default=None, help="Keep corpora, indexes and logs here (default: temp dir)")
+    parser.add_argument("--keep", action="store_true", help="Don't delete generated corpora and indexes")
+    parser.add_argument("--label", default="run", help="Name for the saved results file")
+    parser.add_argument("--compare", default=None, metavar="PATH|latest", help="Compare against a saved run")
+    parser.add_argument("--no-save", action="store_true", help="Don't write results to data/benchmarks/scale/")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions")
+    add_profile_arguments(parser)
+    # Internal: run one phase for one size in this process
+    parser.add_argument("--worker", choices=list(WORKERS), help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--blocks-file", help=argparse.SUPPRESS)
+    parser.add_argument("--index-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    result = run(args)
+    print_summary(result)
+
+    saved = None
+    if not args.no_save:
+        saved = save_results("scale", args.label, result)
+        print(f"\n[Info] Results saved to {saved}")
+
+    if args.compare:
+        baseline_path = resolve_baseline("scale", args.compare, exclude=saved)
+        if baseline_path is None or not baseline_path.exists():
+            print(f"[Warning] No baseline found for '{args.compare}'")
+            return
+        print(f"[Info] Comparing with {baseline_path}")
+        regressions = compare(result, load_results(baseline_path), regression_checks(result))
+        if regressions:
+            print(f"\n[Warning] {len(regressions)} regression(s): {', '.join(regressions)}")
+            if args.fail_on_regression:
+                sys.exit(1)
+        else:
+            print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import itertools
+import numpy as np
+import yaml
+from typing import Dict, Iterator, List, Union
+
+# Add src to path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+
+from utils.paths import CONFIG_DIR
+from utils.metrics import span
+from benchmark.fixture_server import TOPICS, MONTHS
+
+PRODUCTS = [
+    ("ECS", "ecs"), ("VPC", "vpc"), ("CLB", "clb"), ("RDS for MySQL", "rds_mysql"),
+    ("TOS", "tos"), ("VKE", "vke"), ("CDN", "cdn"), ("Cloud Monitor", "cloud_monitor"),
+]
+# (block_type, subtype, dated, share) as produced by simple_rag_processor
+BLOCK_KINDS = [
+    ("release_version", "release_note", True, 0.40),
+    ("reference", "general_doc", False, 0.35),
+    ("concept", "general_doc", False, 0.15),
+    ("announcement_event", "announcement", True, 0.10),
+]
+SYLLABLES = ["ba", "ce", "di", "fo", "gu", "ka", "le", "mi", "no", "pu",
+             "ra", "se", "ti", "vo", "wu", "xa", "ye", "zi", "lo", "ne"]
+API_ACTIONS = ["Describe", "Create", "Modify", "Delete", "Attach", "Detach"]
+INSTANCE_SIZES = ["large", "xlarge", "2xlarge", "4xlarge", "8xlarge"]
+WORDS_PER_SENTENCE = 12
+
+
+class SyntheticCorpus:
+    """
+    Deterministic blocks in the simple_rag_processor schema, at any size.
+
+    Pages of `blocks_per_page` blocks are spread over `products` sources (one index
+    shard each). Content is drawn from a Zipf-distributed vocabulary of `vocab`
+    pseudo-words led by real docs words, so BM25 postings and the number of distinct
+    terms grow with the corpus like real text; each block also mentions a few
+    identifiers (instance types, API names, error codes) for the lexical fast path.
+    """
+
+    def __init__(self, words: int = 120, vocab: int = 50000, products: int = 8,
+                 blocks_per_page: int = 6, zipf_a: float = 1.1, seed: int = 0):
+        self.words = words
+        self.products = PRODUCTS[:max(1, min(products, len(PRODUCTS)))]
+        self.blocks_per_page = blocks_per_page
+        self.zipf_a = zipf_a
+        self.seed = seed
+        docs_words = []
+        for title, _, body in TOPICS:
+            for w in f"{title} {body}".lower().replace(",", "").replace(".", "").replace(";", "").split():
+                if w not in docs_words:
+                    docs_words.append(w)
+        made_up = ("".join(p) for n in itertools.count(2) for p in itertools.product(SYLLABLES, repeat=n))
+        self.vocab = (docs_words + [w for w in itertools.islice(made_up, vocab) if w not in docs_words])[:vocab]
+        nouns = [slug.replace("-", " ").title().replace(" ", "") for _, slug, _ in TOPICS]
+        self.identifiers = (
+            [f"ecs.g{g}i.{size}" for g in range(1, 5) for size in INSTANCE_SIZES]
+            + [f"{action}{noun}" for action in API_ACTIONS for noun in nouns]
+            + [f"InvalidParameter.{noun}" for noun in nouns] + [f"QuotaExceeded.{noun}" for noun in nouns]
+        )
+
+    def _word_ids(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        return (rng.zipf(self.zipf_a, n) - 1) % len(self.vocab)
+
+    def _text(self, rng: np.random.Generator, n_words: int) -> str:
+        words = [self.vocab[i] for i in self._word_ids(rng, n_words)]
+        for ident in rng.choice(len(self.identifiers), size=rng.integers(0, 3)):
+            words.insert(int(rng.integers(0, len(words))), self.identifiers[ident])
+        sentences = (" ".join(words[i:i + WORDS_PER_SENTENCE]) for i in range(0, len(words), WORDS_PER_SENTENCE))
+        return " ".join(s[:1].upper() + s[1:] + "." for s in sentences)
+
+    def blocks(self, n: int) -> Iterator[Dict]:
+        """Yields `n` blocks; the same (n, settings) always gives the same blocks."""
+        rng = np.random.default_rng(self.seed)
+        kind_shares = np.array([share for *_, share in BLOCK_KINDS])
+        for start in range(0, n, 1024):
+            # Per-block draws in chunks, the scalar numpy calls dominate otherwise
+            count = min(1024, n - start)
+            kinds = rng.choice(len(BLOCK_KINDS), size=count, p=kind_shares)
+            lengths = np.maximum(20, rng.lognormal(np.log(self.words), 0.5, size=count).astype(int))
+            for j in range(count):
+                yield self._block(rng, start + j, BLOCK_KINDS[kinds[j]], int(lengths[j]))
+
+    def _block(self, rng: np.random.Generator, i: int, kind, n_words: int) -> Dict:
+        page = i // self.blocks_per_page
+        product, slug = self.products[page % len(self.products)]
+        topic = TOPICS[page // len(self.products) % len(TOPICS)]
+        title = f"{topic[0]} {page}"
+        url = f"https://docs.byteplus.com/en/docs/{slug}/{topic[1]}-{page:07d}"
+        block_type, subtype, dated, _ = kind
+        content = self._text(rng, n_words)
+        time_str = time_iso = None
+        if dated:
+            year, month, day = int(rng.integers(2023, 2026)), int(rng.integers(1, 13)), int(rng.integers(1, 29))
+            time_str = f"{MONTHS[month - 1]} {day}, {year}"
+            time_iso = f"{year}-{month:02d}-{day:02d}"
+            content = f"{time_str}: {content}"
+        return {
+            "block_type": block_type,
+            "product": product,
+            "subtype": subtype,
+            "time": time_str,
+            "content": content,
+            "source_url": url,
+            "source_page_title": title,
+            # Same id scheme as simple_rag_processor.generate_block_id
+            "block_id": hashlib.md5(f"{url}|{content}".encode("utf-8")).hexdigest(),
+            "time_iso": time_iso,
+            "source_name": f"byteplus_{slug}",
+            "source_meta": {"title": title, "url": url},
+        }
+
+    def queries(self, n: int, seed: int = 1) -> List[str]:
+        """Question-style queries over the same vocabulary (a quarter are identifier lookups)."""
+        rng = np.random.default_rng(seed)
+        out = []
+        for i in range(n):
+            if i % 4 == 3:
+                out.append(self.identifiers[int(rng.integers(0, len(self.identifiers)))])
+                continue
+            topic = TOPICS[int(rng.integers(0, len(TOPICS)))][0].lower()
+            words = " ".join(self.vocab[w] for w in self._word_ids(rng, int(rng.integers(3, 8))))
+            out.append(f"How do I configure the {topic} {words}?")
+        return out
+
+    def write(self, path: str, n: int) -> int:
+        """
+        Streams `n` blocks to a JSON array file (the processor's output format)
+        without holding them in memory. Returns the file size in bytes.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("[")
+            for i, block in enumerate(self.blocks(n)):
+                f.write(",\n" if i else "\n")
+                f.write(json.dumps(block, ensure_ascii=False))
+            f.write("\n]\n")
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+
+class SyntheticEmbedder:
+    """
+    Drop-in for RAGEmbedder that returns a pseudo-random unit vector per text
+    (seeded by its hash, so repeated texts get the same vector) without a model.
+    Index build, load and search costs depend on the number of vectors and their
+    dimension, not on what they encode; embedding throughput is measured by
+    pipeline_bench.py.
+    """
+
+    def __init__(self, config_path: str = None, dim: int = 384):
+        with open(config_path or CONFIG_DIR / "rag_config.yaml", "r", encoding="utf-8") as f:
+            self.config = yaml.safe_load(f)
+        self.dim = dim
+        self.model_name = f"synthetic-{dim}d"
+
+    def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        with span("embed", texts=len(texts)):
+            vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+            for i, text in enumerate(texts):
+                seed = int.from_bytes(hashlib.md5(text.encode("utf-8")).digest()[:8], "little")
+                vectors[i] = np.random.default_rng(seed).standard_normal(self.dim, dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            return vectors
+
+    @property
+    def embedding_dim(self) -> int:
+        return self.dim
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic blocks file in the simple_rag_processor schema.")
+    parser.add_argument("--blocks", type=int, default=10000, help="Number of blocks")
+    parser.add_argument("--output", required=True, help="Output JSON file (usable with build_index.py --blocks)")
+    parser.add_argument("--words", type=int, default=120, help="Median words per block")
+    parser.add_argument("--vocab", type=int, default=50000, help="Vocabulary size")
+    parser.add_argument("--products", type=int, default=8, help=f"Sources / index shards (max {len(PRODUCTS)})")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = SyntheticCorpus(words=args.words, vocab=args.vocab, products=args.products, seed=args.seed)
+    size = corpus.write(args.output, args.blocks)
+    print(f"[Info] Wrote {args.blocks} blocks ({size / 2**20:.1f} MB) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
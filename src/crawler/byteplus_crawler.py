@@ -1,26 +1,36 @@
 import requests
 import json
 import os
+import sys
 import time
+import argparse
 import hashlib
 from datetime import datetime
-from typing import List, Dict, Set
+from typing import List, Dict, Set, Iterator
 from urllib.parse import urljoin, urlparse
 from bs4 import BeautifulSoup
 
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from utils.profiling import add_profile_arguments, profiled
+
 # This would be 800 for current ECS docs, here 10 is for test
 MAX_PAGES_PER_SOURCE = 800
+# Polite delay before each request (0 against the local fixture server)
+CRAWL_DELAY_SEC = 0.3
 
 def load_config(config_path: str) -> List[Dict]:
     with open(config_path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def fetch_page(url):
+def fetch_page(url, delay: float = CRAWL_DELAY_SEC):
     headers = {
         "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
     }
     try:
-        time.sleep(0.3) # Polite delay
+        if delay > 0:
+            time.sleep(delay) # Polite delay
         response = requests.get(url, headers=headers, timeout=15)
         response.raise_for_status()
         return response.text
@@ -102,14 +112,72 @@ def save_raw_page(url, html, source_name, source_dir):
     with open(save_path, "w", encoding="utf-8") as f:
         json.dump(raw_data, f, ensure_ascii=False, indent=2)
     print(f"  -> Saved {filename}")
+    return save_path
+
+def crawl_source(seed_url: str, source_name: str, raw_dir: str,
+                 max_pages: int = MAX_PAGES_PER_SOURCE, delay: float = CRAWL_DELAY_SEC) -> int:
+    """Crawls one seed page and its sidebar links into raw_dir/<source_name>/. Returns pages saved (incl. seed)."""
+    return sum(1 for _ in iter_crawl_source(seed_url, source_name, raw_dir, max_pages, delay))
+
+def iter_crawl_source(seed_url: str, source_name: str, raw_dir: str,
+                      max_pages: int = MAX_PAGES_PER_SOURCE, delay: float = CRAWL_DELAY_SEC) -> Iterator[str]:
+    """Like crawl_source, but yields the path of each raw page as soon as it is saved."""
+    source_dir = os.path.join(raw_dir, source_name)
+    os.makedirs(source_dir, exist_ok=True)
+    
+    # 1. Fetch Seed
+    print(f"Fetching seed: {seed_url}...")
+    seed_html = fetch_page(seed_url, delay)
+    
+    if not seed_html:
+        print("Failed to fetch seed. Skipping.")
+        return
+        
+    yield save_raw_page(seed_url, seed_html, source_name, source_dir)
+    
+    # 2. Discover Links
+    print("Discovering links from Sidebar...")
+    discovered_links = extract_links(seed_html, seed_url)
+    print(f"Found {len(discovered_links)} valid sidebar links.")
+    
+    # 3. Fetch Discovered (with limit)
+    count = 0
+    total_discovered = len(discovered_links)
+    
+    for link in discovered_links:
+        if count >= max_pages:
+            print("\n" + "!" * 60)
+            print(f"WARNING: Hit MAX_PAGES_PER_SOURCE limit ({max_pages}).")
+            print(f"There are {total_discovered - count} more pages skipped.")
+            print("RAG results might be incomplete due to missing data.")
+            print("!" * 60 + "\n")
+            break
+            
+        print(f"Fetching [{count+1}/{min(total_discovered, max_pages)}]: {link}")
+        html = fetch_page(link, delay)
+        if html:
+            yield save_raw_page(link, html, source_name, source_dir)
+            count += 1
 
 def main():
     # Setup paths
     current_dir = os.path.dirname(os.path.abspath(__file__))
     DATA_DIR = os.path.join(current_dir, "../../data")
     
-    config_path = os.path.join(DATA_DIR, "sources/urls.json")
-    raw_dir = os.path.join(DATA_DIR, "raw")
+    parser = argparse.ArgumentParser(description="Crawl BytePlus docs sources into raw JSON pages.")
+    parser.add_argument("--sources", default=os.path.join(DATA_DIR, "sources/urls.json"),
+                        help="Seed URL list (default: data/sources/urls.json)")
+    parser.add_argument("--raw-dir", default=os.path.join(DATA_DIR, "raw"),
+                        help="Output directory, one subdirectory per source (default: data/raw)")
+    parser.add_argument("--delay", type=float, default=CRAWL_DELAY_SEC,
+                        help=f"Seconds to wait before each request (default: {CRAWL_DELAY_SEC})")
+    parser.add_argument("--max-pages", type=int, default=MAX_PAGES_PER_SOURCE,
+                        help=f"Linked pages to fetch per source (default: {MAX_PAGES_PER_SOURCE})")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    
+    config_path = args.sources
+    raw_dir = args.raw_dir
     
     if not os.path.exists(config_path):
         print(f"Config not found at {config_path}")
@@ -118,48 +186,13 @@ def main():
     urls_config = load_config(config_path)
     print(f"Loaded {len(urls_config)} seed URLs.")    
     
-    for entry in urls_config:
-        seed_url = entry["url"]
-        source_name = entry["source_name"]
-        
-        print(f"\nProcessing Source: {source_name} (Seed: {seed_url})")
-        
-        source_dir = os.path.join(raw_dir, source_name)
-        os.makedirs(source_dir, exist_ok=True)
-        
-        # 1. Fetch Seed
-        print(f"Fetching seed: {seed_url}...")
-        seed_html = fetch_page(seed_url)
-        
-        if not seed_html:
-            print("Failed to fetch seed. Skipping.")
-            continue
-            
-        save_raw_page(seed_url, seed_html, source_name, source_dir)
-        
-        # 2. Discover Links
-        print("Discovering links from Sidebar...")
-        discovered_links = extract_links(seed_html, seed_url)
-        print(f"Found {len(discovered_links)} valid sidebar links.")
-        
-        # 3. Fetch Discovered (with limit)
-        count = 0
-        total_discovered = len(discovered_links)
-        
-        for link in discovered_links:
-            if count >= MAX_PAGES_PER_SOURCE:
-                print("\n" + "!" * 60)
-                print(f"WARNING: Hit MAX_PAGES_PER_SOURCE limit ({MAX_PAGES_PER_SOURCE}).")
-                print(f"There are {total_discovered - count} more pages skipped.")
-                print("RAG results might be incomplete due to missing data.")
-                print("!" * 60 + "\n")
-                break
-                
-            print(f"Fetching [{count+1}/{min(total_discovered, MAX_PAGES_PER_SOURCE)}]: {link}")
-            html = fetch_page(link)
-            if html:
-                save_raw_page(link, html, source_name, source_dir)
-                count += 1
+    with profiled("crawl", args, artifact_dir=raw_dir):
+        for entry in urls_config:
+            seed_url = entry["url"]
+            source_name = entry["source_name"]
+
+            print(f"\nProcessing Source: {source_name} (Seed: {seed_url})")
+            crawl_source(seed_url, source_name, raw_dir, args.max_pages, args.delay)
 
 if __name__ == "__main__":
     main()
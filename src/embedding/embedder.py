@@ -9,18 +9,36 @@ import numpy as np
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(current_dir, ".."))
 from utils.paths import CONFIG_DIR
+from utils.metrics import span
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def configured_model_name(config_path: str = None) -> str:
+    """embedding.model_name of the config (default: rag_config.yaml), without loading the model."""
+    with open(config_path or CONFIG_DIR / "rag_config.yaml", "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    return config.get("embedding", {}).get("model_name", DEFAULT_MODEL)
+
 
 class RAGEmbedder:
-    _instance = None
-    _model = None
+    """
+    Sentence-transformers query/document encoder configured from rag_config.yaml.
+    One shared instance per (config, model): repeated construction reuses the
+    loaded model, while a different config or `model_name` (e.g. in benchmarks)
+    gets its own instance.
+    """
+    _instances = {}
     
-    def __new__(cls, config_path: str = None):
-        if cls._instance is None:
-            cls._instance = super(RAGEmbedder, cls).__new__(cls)
-            cls._instance._initialize(config_path)
-        return cls._instance
+    def __new__(cls, config_path: str = None, model_name: str = None):
+        key = (str(config_path) if config_path else None, model_name)
+        if key not in cls._instances:
+            instance = super(RAGEmbedder, cls).__new__(cls)
+            instance._initialize(config_path, model_name)
+            cls._instances[key] = instance
+        return cls._instances[key]
     
-    def _initialize(self, config_path: str):
+    def _initialize(self, config_path: str, model_name: str = None):
         if not config_path:
              # Default path from centralized config
              config_path = str(CONFIG_DIR / "rag_config.yaml")
@@ -31,9 +49,9 @@ class RAGEmbedder:
         with open(config_path, "r", encoding="utf-8") as f:
             self.config = yaml.safe_load(f)
             
-        model_name = self.config.get("embedding", {}).get("model_name", "sentence-transformers/all-MiniLM-L6-v2")
-        print(f"[RAGEmbedder] Loading model: {model_name}...")
-        self._model = SentenceTransformer(model_name)
+        self.model_name = model_name or self.config.get("embedding", {}).get("model_name", DEFAULT_MODEL)
+        print(f"[RAGEmbedder] Loading model: {self.model_name}...")
+        self._model = SentenceTransformer(self.model_name)
         
     def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
         """
@@ -42,8 +60,9 @@ class RAGEmbedder:
         """
         if isinstance(texts, str):
             texts = [texts]
-        # normalize_embeddings=True ensures dot product equals cosine similarity
-        return self._model.encode(texts, normalize_embeddings=True)
+        with span("embed", texts=len(texts)):
+            # normalize_embeddings=True ensures dot product equals cosine similarity
+            return self._model.encode(texts, normalize_embeddings=True)
     
     @property
     def embedding_dim(self) -> int:
@@ -0,0 +1,97 @@
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, Optional
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache keyed by query embedding.
+
+    A stored answer is returned only when all of these hold:
+    - cosine similarity between the query vectors >= `similarity_threshold`
+    - the same set of retrieved block_ids (so the answer is grounded in the same context)
+    - the same index version
+
+    Entries are tagged with their index version rather than cleared on a new one,
+    so searchers on different versions (e.g. during a hot reload) don't evict each
+    other; stale versions age out. Entries expire after `ttl_sec`; the least
+    recently used entry is evicted once `max_entries` is reached.
+    Thread-safe, shared across UI sessions.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, max_entries: int = 512, ttl_sec: float = 3600):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+        # Stacked vectors of all entries, rebuilt lazily after inserts/evictions
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys = []
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def _expire(self, now: float):
+        expired = [k for k, e in self._entries.items() if now - e["created"] > self.ttl_sec]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._stats["expirations"] += len(expired)
+            self._matrix = None
+
+    def lookup(self, query_vector: np.ndarray, block_ids: Iterable[str], index_version: Optional[str]) -> Optional[str]:
+        """Returns a cached answer, or None on a miss."""
+        ids = frozenset(block_ids)
+        vector = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        with self._lock:
+            self._expire(time.time())
+            if self._entries:
+                if self._matrix is None:
+                    self._matrix_keys = list(self._entries.keys())
+                    self._matrix = np.vstack([self._entries[k]["vector"] for k in self._matrix_keys])
+                # Vectors are L2-normalised, so the dot product is the cosine similarity
+                sims = self._matrix @ vector
+                for i in np.argsort(-sims):
+                    if sims[i] < self.similarity_threshold:
+                        break
+                    key = self._matrix_keys[i]
+                    entry = self._entries[key]
+                    if entry["block_ids"] == ids and entry["index_version"] == index_version:
+                        self._entries.move_to_end(key)
+                        self._stats["hits"] += 1
+                        return entry["answer"]
+            self._stats["misses"] += 1
+            return None
+
+    def store(self, query_vector: np.ndarray, block_ids: Iterable[str], index_version: Optional[str], answer: str):
+        vector = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        with self._lock:
+            while len(self._entries) >= self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+            self._entries[self._next_key] = {
+                "vector": vector,
+                "block_ids": frozenset(block_ids),
+                "index_version": index_version,
+                "answer": answer,
+                "created": time.time(),
+            }
+            self._next_key += 1
+            self._matrix = None
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "size": len(self._entries),
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            }
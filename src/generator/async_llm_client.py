@@ -0,0 +1,287 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import httpx
+import openai
+from openai import AsyncOpenAI
+from typing import List, Dict, Optional, AsyncIterator
+
+# Add src to path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+
+from utils.metrics import span, observe_stage
+from .llm_client import load_env, load_config, resolve_provider
+from .token_budget import get_accountant
+
+# Transient failures worth retrying (or failing over) on
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+
+class LLMUnavailableError(Exception):
+    """Raised when no provider produced an answer within the request deadline."""
+
+
+class AsyncLLMClient:
+    """
+    Async LLM client with pooled connections, deadlines, retries and failover.
+
+    - One pooled `AsyncOpenAI` client per provider (primary = `provider`,
+      secondary = `llm.fallback_provider` in rag_config.yaml).
+    - Every call has a total deadline; each attempt is capped by the per-request timeout.
+    - Retryable errors are retried with full-jitter exponential backoff.
+    - If the primary hasn't answered after `llm.hedge_after_sec`, a hedged request is
+      sent to the secondary and the first answer wins. If the primary fails outright,
+      the secondary is tried immediately.
+    """
+
+    def __init__(self, config_path: str):
+        # Same .env / YAML resolution as the sync LLMClient
+        load_env()
+        self.config = load_config(config_path)
+        self.accountant = get_accountant(self.config)
+
+        llm_conf = self.config.get("llm", {})
+        self.request_timeout = llm_conf.get("request_timeout_sec", 60)
+        self.total_deadline = llm_conf.get("total_deadline_sec", 90)
+        self.max_retries = llm_conf.get("max_retries", 2)
+        self.retry_base_delay = llm_conf.get("retry_base_delay_sec", 0.5)
+        self.hedge_after = llm_conf.get("hedge_after_sec", 0)
+        limits = httpx.Limits(
+            max_connections=llm_conf.get("max_connections", 20),
+            max_keepalive_connections=llm_conf.get("max_keepalive_connections", 10),
+        )
+
+        primary = self.config.get("provider", "doubao")
+        fallback = llm_conf.get("fallback_provider")
+        self.providers: List[Dict] = []
+        for name in [primary, fallback]:
+            if not name or any(p["name"] == name for p in self.providers):
+                continue
+            settings = resolve_provider(self.config, name)
+            if not settings["api_key"]:
+                print(f"[Warning] {settings['api_key_env']} not set. Provider '{name}' disabled.")
+                continue
+            settings["client"] = AsyncOpenAI(
+                api_key=settings["api_key"],
+                base_url=settings["base_url"],
+                # Retries and timeouts are handled here, per attempt
+                max_retries=0,
+                http_client=httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(self.request_timeout)),
+            )
+            self.providers.append(settings)
+
+    def _params(self, provider: Dict, max_tokens: Optional[int]) -> Dict:
+        return {
+            "model": provider["model"],
+            "temperature": provider["temperature"],
+            "max_tokens": max_tokens or provider["max_tokens"],
+        }
+
+    async def _backoff(self, attempt: int, deadline: float):
+        delay = random.uniform(0, self.retry_base_delay * (2 ** attempt))
+        await asyncio.sleep(max(0.0, min(delay, deadline - time.monotonic())))
+
+    async def _call_provider(self, provider: Dict, messages: List[Dict], deadline: float,
+                             max_tokens: Optional[int], usage: Dict) -> str:
+        """One provider with retries, bounded by the overall deadline. Fills `usage`."""
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                with span("llm_generate", provider=provider["name"], attempt=attempt + 1):
+                    response = await asyncio.wait_for(
+                        provider["client"].chat.completions.create(
+                            messages=messages, **self._params(provider, max_tokens)
+                        ),
+                        timeout=min(self.request_timeout, remaining),
+                    )
+                content = response.choices[0].message.content
+                if response.usage is not None:
+                    self.accountant.record(provider["name"], response.usage.prompt_tokens,
+                                           response.usage.completion_tokens, usage)
+                else:
+                    self.accountant.record_estimate(provider["name"], messages, content or "", usage)
+                return content
+            except RETRYABLE_ERRORS as e:
+                last_error = e
+                print(f"[AsyncLLM] {provider['name']} attempt {attempt + 1} failed: {type(e).__name__}")
+                if attempt < self.max_retries:
+                    await self._backoff(attempt, deadline)
+        raise LLMUnavailableError(f"{provider['name']}: {last_error or 'deadline exceeded'}")
+
+    async def generate(self, messages: List[Dict], max_tokens: Optional[int] = None,
+                       deadline_sec: Optional[float] = None, usage: Optional[Dict] = None) -> str:
+        """
+        Generates a completion, hedging/failing over to the secondary provider.
+        Raises LLMUnavailableError if no provider answers before the deadline.
+        `usage` is filled with the winning call's token usage (a losing hedged
+        call that also completed is still accounted for).
+        """
+        if not self.providers:
+            raise LLMUnavailableError("No LLM provider configured with an API key.")
+        deadline = time.monotonic() + (deadline_sec or self.total_deadline)
+
+        usages = {}
+
+        def start(provider: Dict) -> asyncio.Task:
+            call_usage = {}
+            task = asyncio.create_task(self._call_provider(provider, messages, deadline, max_tokens, call_usage))
+            usages[task] = call_usage
+            return task
+
+        pending = {start(self.providers[0])}
+        secondary_started = len(self.providers) < 2
+        errors = []
+
+        def start_secondary():
+            nonlocal secondary_started
+            secondary_started = True
+            pending.add(start(self.providers[1]))
+
+        try:
+            while pending:
+                timeout = None
+                if not secondary_started and self.hedge_after:
+                    timeout = self.hedge_after
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Primary is slow: hedge
+                    print(f"[AsyncLLM] {self.providers[0]['name']} slow, hedging to {self.providers[1]['name']}")
+                    start_secondary()
+                    continue
+                for task in done:
+                    pending.discard(task)
+                    if task.exception() is None:
+                        if usage is not None:
+                            usage.update(usages[task])
+                        return task.result()
+                    errors.append(str(task.exception()))
+                if not pending and not secondary_started:
+                    # Primary failed: fail over
+                    start_secondary()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise LLMUnavailableError("; ".join(errors))
+
+    async def _open_stream(self, provider: Dict, messages: List[Dict], deadline: float,
+                           max_tokens: Optional[int]):
+        """Opens a stream and waits for its first chunk, with retries."""
+        last_error: Optional[Exception] = None
+        extra = {}
+        if self.config.get("llm", {}).get("stream_include_usage", True):
+            extra["stream_options"] = {"include_usage": True}
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                stream = await asyncio.wait_for(
+                    provider["client"].chat.completions.create(
+                        messages=messages, stream=True, **self._params(provider, max_tokens), **extra
+                    ),
+                    timeout=min(self.request_timeout, remaining),
+                )
+                iterator = stream.__aiter__()
+                first = await asyncio.wait_for(iterator.__anext__(), timeout=min(self.request_timeout, remaining))
+                return first, iterator
+            except StopAsyncIteration:
+                return None, None
+            except RETRYABLE_ERRORS as e:
+                last_error = e
+                print(f"[AsyncLLM] {provider['name']} stream attempt {attempt + 1} failed: {type(e).__name__}")
+                if attempt < self.max_retries:
+                    await self._backoff(attempt, deadline)
+        raise LLMUnavailableError(f"{provider['name']}: {last_error or 'deadline exceeded'}")
+
+    async def generate_stream(self, messages: List[Dict], max_tokens: Optional[int] = None,
+                              deadline_sec: Optional[float] = None,
+                              usage: Optional[Dict] = None) -> AsyncIterator[str]:
+        """
+        Streams text deltas. Retries, failover and hedging (`hedge_after_sec` without a
+        first token) happen only before the first token; the first provider to produce
+        one wins, and once output has started the stream is not switched mid-answer.
+        `usage` is filled once the stream has ended (estimated if the provider sent none).
+        """
+        if not self.providers:
+            raise LLMUnavailableError("No LLM provider configured with an API key.")
+        deadline = time.monotonic() + (deadline_sec or self.total_deadline)
+
+        errors = []
+        start_t = time.perf_counter()
+        tasks: Dict[asyncio.Task, Dict] = {}
+
+        def start(provider: Dict):
+            tasks[asyncio.create_task(self._open_stream(provider, messages, deadline, max_tokens))] = provider
+
+        start(self.providers[0])
+        secondary_started = len(self.providers) < 2
+        opened = None
+        try:
+            while tasks and opened is None:
+                timeout = self.hedge_after if not secondary_started and self.hedge_after else None
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # No first token from the primary yet: hedge
+                    print(f"[AsyncLLM] {self.providers[0]['name']} slow, hedging to {self.providers[1]['name']}")
+                    secondary_started = True
+                    start(self.providers[1])
+                    continue
+                for task in done:
+                    provider = tasks.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        opened = provider, task.result()
+                        break
+                    if not isinstance(error, (LLMUnavailableError, openai.OpenAIError)):
+                        raise error
+                    # Non-retryable errors (auth, bad request) also fail over to the next provider
+                    errors.append(str(error))
+                if not tasks and not secondary_started:
+                    # Primary failed: fail over
+                    secondary_started = True
+                    start(self.providers[1])
+        finally:
+            for task in tasks:
+                task.cancel()
+        if opened is None:
+            raise LLMUnavailableError("; ".join(errors))
+
+        provider, (first, iterator) = opened
+        if first is None:
+            return
+        observe_stage("llm_ttft", (time.perf_counter() - start_t) * 1000, provider=provider["name"])
+        chunk = first
+        parts = []
+        recorded = False
+        while True:
+            if getattr(chunk, "usage", None) is not None:
+                self.accountant.record(provider["name"], chunk.usage.prompt_tokens,
+                                       chunk.usage.completion_tokens, usage)
+                recorded = True
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+            try:
+                chunk = await asyncio.wait_for(
+                    iterator.__anext__(), timeout=max(0.0, deadline - time.monotonic())
+                )
+            except StopAsyncIteration:
+                if not recorded:
+                    self.accountant.record_estimate(provider["name"], messages, "".join(parts), usage)
+                return
+
+    async def aclose(self):
+        for provider in self.providers:
+            await provider["client"].close()
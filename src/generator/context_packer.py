@@ -0,0 +1,183 @@
+import re
+from typing import List, Dict, Any, Tuple, Optional
+
+# tiktoken is optional; without it a character-based estimate is used
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+_CJK = re.compile(r"[㐀-鿿豈-﫿]")
+_WORD = re.compile(r"[A-Za-z0-9_\-\.]+")
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?。！？；;])\s+|\n+")
+_STOPWORDS = {
+    "the", "a", "an", "is", "are", "was", "were", "to", "of", "in", "on", "for", "and", "or",
+    "how", "what", "why", "when", "can", "do", "does", "i", "my", "me", "it", "this", "that",
+    "with", "be", "there", "any", "your", "you", "from", "by", "as", "at", "about",
+}
+GAP_MARKER = "[...]"
+
+
+def count_tokens(text: str) -> int:
+    """Token count (exact with tiktoken, otherwise ~4 chars/token for Latin text and 1 token per CJK char)."""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_message_tokens(messages: List[Dict]) -> int:
+    # ~4 tokens of framing per chat message
+    return sum(count_tokens(m.get("content", "")) + 4 for m in messages)
+
+
+def _query_terms(question: str) -> set:
+    terms = {w.lower().strip(".-") for w in _WORD.findall(question)}
+    terms = {t for t in terms if len(t) > 1 and t not in _STOPWORDS}
+    # CJK has no spaces: use character bigrams
+    cjk = "".join(_CJK.findall(question))
+    terms.update(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return terms
+
+
+def _sentence_score(sentence: str, terms: set) -> int:
+    lower = sentence.lower()
+    return sum(1 for t in terms if t in lower)
+
+
+def _truncate_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of `text` within `max_tokens` (by `count_tokens`, so CJK and Latin text alike)."""
+    if max_tokens <= 0:
+        return ""
+    if _ENCODING is not None:
+        tokens = _ENCODING.encode(text, disallowed_special=())
+        # A cut inside a multi-byte character decodes to U+FFFD; drop it
+        return text if len(tokens) <= max_tokens else _ENCODING.decode(tokens[:max_tokens]).rstrip("\ufffd")
+    # Binary search on the prefix length; count_tokens grows monotonically with it
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+def trim_to_relevant(content: str, question: str, max_tokens: int) -> str:
+    """
+    Shrinks `content` to at most ~max_tokens by keeping the sentences that
+    mention query terms plus their immediate neighbours, in original order.
+    Falls back to the leading sentences if nothing matches.
+    """
+    if count_tokens(content) <= max_tokens:
+        return content
+
+    sentences = [s.strip() for s in _SENTENCE_SPLIT.split(content) if s and s.strip()]
+    if not sentences:
+        return content
+    terms = _query_terms(question)
+    scores = [_sentence_score(s, terms) for s in sentences]
+    sizes = [count_tokens(s) for s in sentences]
+
+    # Seed with matching sentences (best first), each with one sentence of context either side
+    order = sorted((i for i, sc in enumerate(scores) if sc > 0), key=lambda i: -scores[i])
+    if not order:
+        order = list(range(len(sentences)))
+    selected, used = set(), 0
+    for i in order:
+        for j in (i, i - 1, i + 1):
+            if 0 <= j < len(sentences) and j not in selected and used + sizes[j] <= max_tokens:
+                selected.add(j)
+                used += sizes[j]
+        if used >= max_tokens:
+            break
+    if not selected:
+        # A single sentence is larger than the budget: hard cut to the token budget
+        return _truncate_tokens(sentences[order[0]], max_tokens)
+
+    parts, prev = [], None
+    for j in sorted(selected):
+        if prev is not None and j != prev + 1:
+            parts.append(GAP_MARKER)
+        parts.append(sentences[j])
+        prev = j
+    return "\n".join(parts)
+
+
+def _merge_by_url(chunks: List[Any]) -> List[Dict[str, Any]]:
+    """Groups chunks from the same page (kept in first-seen, i.e. retrieval, order) and drops duplicate content."""
+    groups: Dict[str, Dict[str, Any]] = {}
+    for chunk in chunks:
+        meta = chunk.get("source_meta", {}) or {}
+        url = meta.get("url") or chunk.get("block_id")
+        content = (chunk.get("content") or "").strip()
+        group = groups.get(url)
+        if group is None:
+            groups[url] = {
+                "source_meta": meta,
+                "block_id": chunk.get("block_id"),
+                "block_ids": [chunk.get("block_id")],
+                "score": chunk.get("score", 0.0),
+                "contents": [content],
+            }
+            continue
+        group["block_ids"].append(chunk.get("block_id"))
+        if content and not any(content in c or c in content for c in group["contents"]):
+            group["contents"].append(content)
+    return list(groups.values())
+
+
+def pack_context(question: str, chunks: List[Any], token_budget: int,
+                 max_chunk_tokens: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Fits retrieved chunks into a token budget.
+
+    1. Chunks are taken in the order given, i.e. the retriever's final ranking (after
+       MMR that is not score order); chunks from the same URL are merged and
+       duplicate passages dropped.
+    2. Each merged chunk is trimmed to query-relevant passages (at most `max_chunk_tokens`).
+    3. Chunks are added until `token_budget` is reached; the last one is trimmed to fit.
+
+    Returns (packed_chunks, stats). Packed chunks are plain dicts accepted by `build_rag_prompt`.
+    """
+    groups = _merge_by_url(chunks)
+    input_tokens = sum(count_tokens(c.get("content") or "") for c in chunks)
+
+    packed, used, trimmed = [], 0, 0
+    for group in groups:
+        remaining = token_budget - used
+        if remaining <= 0:
+            break
+        content = "\n\n".join(group["contents"])
+        cap = min(remaining, max_chunk_tokens) if max_chunk_tokens else remaining
+        new_content = trim_to_relevant(content, question, cap)
+        if new_content != content:
+            trimmed += 1
+        tokens = count_tokens(new_content)
+        if tokens == 0:
+            continue
+        packed.append({
+            "block_id": group["block_id"],
+            "block_ids": group["block_ids"],
+            "score": group["score"],
+            "source_meta": group["source_meta"],
+            "content": new_content,
+        })
+        used += tokens
+
+    stats = {
+        "input_chunks": len(chunks),
+        "packed_chunks": len(packed),
+        "merged_chunks": len(chunks) - len(groups),
+        "trimmed_chunks": trimmed,
+        "dropped_chunks": len(groups) - len(packed),
+        "input_context_tokens": input_tokens,
+        "context_tokens": used,
+        "token_budget": token_budget,
+        "exact_token_count": _ENCODING is not None,
+    }
+    return packed, stats
@@ -1,14 +1,89 @@
 import os
 import sys
-from typing import List, Dict, Any
+import time
+import asyncio
+import threading
+import numpy as np
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator, Callable, Union
 
 # Add src to path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(current_dir, ".."))
 from utils.paths import CONFIG_DIR
+from utils.metrics import REGISTRY, span
 
-from .llm_client import LLMClient
+from .llm_client import LLMClient, resolve_provider
 from .prompt_builder import build_rag_prompt
+from .context_packer import pack_context, count_tokens, count_message_tokens
+from .answer_cache import SemanticAnswerCache
+from .async_llm_client import AsyncLLMClient, LLMUnavailableError
+from .scheduler import get_scheduler, SchedulerRejectedError, SchedulerTimeoutError
+from .query_rewriter import QueryRewriter
+from .token_budget import get_accountant
+
+# Degraded response when the LLM queue is full or the wait deadline passed
+BUSY_MESSAGE = (
+    "The assistant is handling a lot of requests right now and couldn't answer in time. "
+    "Please try again in a moment; the retrieved source documents are listed below."
+)
+
+class AnswerStream:
+    """
+    Iterable of answer text deltas returned by `RAGGenerator.answer_stream`
+    (async iterable when returned by `answer_stream_async`).
+    Once fully consumed, `answer` holds the full text and `debug` the
+    timings: 'ttft_ms' (time to first token) and 'generation_ms' (total).
+    `on_complete` only runs for streams that finished cleanly: not when the
+    producer set 'error' (failed mid-stream) or 'degraded' in `debug`.
+    """
+
+    def __init__(self, deltas: Union[Iterator[str], AsyncIterator[str]], messages: List[Dict], cache_hit: bool,
+                 on_complete: Optional[Callable[[str], None]] = None, debug: Optional[Dict] = None):
+        self._deltas = deltas
+        self._on_complete = on_complete
+        self.answer = ""
+        # `debug` may be shared with the delta producer so it can add fields (e.g. 'degraded')
+        self.debug = debug if debug is not None else {}
+        self.debug.update({
+            "final_messages": messages,
+            "cache_hit": cache_hit,
+            "ttft_ms": None,
+            "generation_ms": None
+        })
+
+    def _first_token(self, start_t: float):
+        if self.debug["ttft_ms"] is None:
+            self.debug["ttft_ms"] = (time.time() - start_t) * 1000
+
+    def _finish(self, parts: List[str], start_t: float):
+        self.debug["generation_ms"] = (time.time() - start_t) * 1000
+        self.answer = "".join(parts)
+        if self._on_complete is not None and not (self.debug.get("error") or self.debug.get("degraded")):
+            self._on_complete(self.answer)
+
+    def __iter__(self) -> Iterator[str]:
+        start_t = time.time()
+        parts = []
+        for delta in self._deltas:
+            self._first_token(start_t)
+            parts.append(delta)
+            yield delta
+        self._finish(parts, start_t)
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        start_t = time.time()
+        parts = []
+        async for delta in self._deltas:
+            self._first_token(start_t)
+            parts.append(delta)
+            yield delta
+        self._finish(parts, start_t)
+
+
+async def _aiter(items: List[str]) -> AsyncIterator[str]:
+    for item in items:
+        yield item
+
 
 class RAGGenerator:
     def __init__(self, config_path: str = None):
@@ -16,25 +91,243 @@ class RAGGenerator:
             # Default from centralized config
             config_path = str(CONFIG_DIR / "rag_config.yaml")
             
+        self.config_path = config_path
         self.client = LLMClient(config_path)
+        self._async_client = None
+        # Event loop thread (and its own AsyncLLMClient) driving the sync `answer_stream`
+        self._loop = None
+        self._loop_client = None
+        self._loop_lock = threading.Lock()
+        
+        # Shared by all generators in this process (see scheduler.get_scheduler)
+        self.scheduler = get_scheduler(self.client.config)
+        
+        cache_conf = self.client.config.get("answer_cache", {})
+        self.cache = None
+        if cache_conf.get("enabled", False):
+            self.cache = SemanticAnswerCache(
+                similarity_threshold=cache_conf.get("similarity_threshold", 0.95),
+                max_entries=cache_conf.get("max_entries", 512),
+                ttl_sec=cache_conf.get("ttl_sec", 3600),
+            )
+        
+        # Token / cost accounting and budgets, shared like the scheduler
+        self.accountant = get_accountant(self.client.config)
+        
+        # Optional query expansion / translation, run concurrently with retrieval by the caller
+        self.rewriter = QueryRewriter.from_config(self.client, self.scheduler, self.client.config)
+        
+        # Existing stats() are exported as gauges on the metrics endpoint
+        REGISTRY.register_collector("rag_llm_scheduler", self.scheduler.stats)
+        REGISTRY.register_collector("rag_llm_usage", self.accountant.stats)
+        if self.cache is not None:
+            REGISTRY.register_collector("rag_answer_cache", self.cache.stats)
+        if self.rewriter is not None:
+            REGISTRY.register_collector("rag_query_rewrite", self.rewriter.stats)
+        
+    def _budget(self) -> Dict[str, Any]:
+        """
+        Limits for the next request under the current usage budgets: 'max_tokens',
+        'context_token_budget', 'pressure' and 'scale' (< 1 when capped).
+        """
+        config = self.client.config
+        max_tokens = resolve_provider(config, config.get("provider", "doubao"))["max_tokens"]
+        return self.accountant.caps(max_tokens, config.get("prompt", {}).get("context_token_budget"))
+
+    @staticmethod
+    def _max_tokens(budget: Dict[str, Any]) -> Optional[int]:
+        # Uncapped requests keep each provider's own configured limit
+        return budget["max_tokens"] if budget["scale"] < 1 else None
+
+    def _build_messages(self, question: str, retrieved_chunks: List[Dict], budget: Optional[int] = None):
+        """Packs the retrieved chunks into the context token budget and builds the prompt."""
+        prompt_conf = self.client.config.get("prompt", {})
+        if budget is None:
+            budget = prompt_conf.get("context_token_budget")
+        with span("context_pack", chunks=len(retrieved_chunks)):
+            if budget:
+                chunks, context_stats = pack_context(
+                    question, retrieved_chunks, budget, prompt_conf.get("max_chunk_tokens")
+                )
+            else:
+                chunks = retrieved_chunks
+                context_stats = {"context_tokens": sum(count_tokens(c.get("content") or "") for c in chunks)}
+        with span("prompt_build"):
+            messages = build_rag_prompt(question, chunks)
+            context_stats["prompt_tokens"] = count_message_tokens(messages)
+        return messages, context_stats
+
+    def _prepare(self, question: str, retrieved_chunks: List[Dict],
+                 query_vector: Optional[np.ndarray], index_version: Optional[str]):
+        """
+        Builds the prompt within the current budget caps and checks the answer cache.
+        Returns (messages, context_stats, budget, cache_key, cached_answer).
+        """
+        budget = self._budget()
+        messages, context_stats = self._build_messages(question, retrieved_chunks, budget["context_token_budget"])
+        if self.cache is None or query_vector is None:
+            return messages, context_stats, budget, None, None
+        cache_key = (query_vector, [chunk.get("block_id") for chunk in retrieved_chunks], index_version)
+        return messages, context_stats, budget, cache_key, self.cache.lookup(*cache_key)
+
+    def _store(self, cache_key, answer_text: str):
+        # Error strings and degraded responses must not be served from cache
+        if cache_key is not None and not answer_text.startswith("Error") and answer_text != BUSY_MESSAGE:
+            self.cache.store(*cache_key, answer_text)
+
+    def _result(self, answer_text: str, messages: List[Dict], context_stats: Dict, budget: Dict,
+                cache_hit: bool = False, degraded: Optional[str] = None,
+                usage: Optional[Dict] = None) -> Dict[str, Any]:
+        debug = {"final_messages": messages, "context": context_stats, "cache_hit": cache_hit, "budget": budget}
+        if usage:
+            debug["usage"] = usage
+        if degraded:
+            debug["degraded"] = degraded
+        return {"answer": answer_text, "debug": debug}
         
-    def answer(self, question: str, retrieved_chunks: List[Dict]) -> Dict[str, Any]:
+    def answer(self, question: str, retrieved_chunks: List[Dict],
+               query_vector: Optional[np.ndarray] = None, index_version: Optional[str] = None) -> Dict[str, Any]:
         """
-        End-to-end generation: Prompt Build -> LLM Call -> Answer
+        End-to-end generation: Prompt Build -> (Cache) -> Scheduler -> LLM Call -> Answer
+        Pass the query embedding and index version to enable the semantic answer cache.
         Returns:
             Dict containing:
             - 'answer': str
-            - 'debug': Dict containing 'final_messages'
+            - 'debug': Dict containing 'final_messages', 'context' (token counts), 'cache_hit',
+              'budget' (caps applied), 'usage' (tokens and cost, when the LLM was called) and,
+              when the LLM was not called due to load, 'degraded'
         """
         # 1. Build Prompt
-        messages = build_rag_prompt(question, retrieved_chunks)
+        messages, context_stats, budget, cache_key, cached = self._prepare(
+            question, retrieved_chunks, query_vector, index_version)
+        if cached is not None:
+            return self._result(cached, messages, context_stats, budget, cache_hit=True)
+        
+        # 2. Call LLM (admission controlled)
+        usage = {}
+        try:
+            with self.scheduler.slot():
+                answer_text = self.client.generate(messages, max_tokens=self._max_tokens(budget), usage=usage)
+        except (SchedulerRejectedError, SchedulerTimeoutError) as e:
+            return self._result(BUSY_MESSAGE, messages, context_stats, budget, degraded=str(e))
+        
+        self._store(cache_key, answer_text)
+        return self._result(answer_text, messages, context_stats, budget, usage=usage)
+
+    @property
+    def async_client(self) -> AsyncLLMClient:
+        """Lazily created; the pooled connections must live on the caller's event loop."""
+        if self._async_client is None:
+            self._async_client = AsyncLLMClient(self.config_path)
+        return self._async_client
+
+    async def answer_async(self, question: str, retrieved_chunks: List[Dict],
+                           query_vector: Optional[np.ndarray] = None, index_version: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Async variant of `answer` using AsyncLLMClient (deadlines, retries, failover).
+        Returns the same structure as `answer`. Prompt packing and the cache lookup
+        run in a worker thread.
+        """
+        messages, context_stats, budget, cache_key, cached = await asyncio.to_thread(
+            self._prepare, question, retrieved_chunks, query_vector, index_version)
+        if cached is not None:
+            return self._result(cached, messages, context_stats, budget, cache_hit=True)
         
-        # 2. Call LLM
-        answer_text = self.client.generate(messages)
+        usage = {}
+        try:
+            async with self.scheduler.async_slot():
+                answer_text = await self.async_client.generate(
+                    messages, max_tokens=self._max_tokens(budget), usage=usage)
+        except (SchedulerRejectedError, SchedulerTimeoutError) as e:
+            return self._result(BUSY_MESSAGE, messages, context_stats, budget, degraded=str(e))
+        except LLMUnavailableError as e:
+            return self._result(f"Error calling LLM: {e}", messages, context_stats, budget)
         
-        return {
-            "answer": answer_text,
-            "debug": {
-                "final_messages": messages
-            }
-        }
+        self._store(cache_key, answer_text)
+        return self._result(answer_text, messages, context_stats, budget, usage=usage)
+
+    def _stream_loop(self) -> asyncio.AbstractEventLoop:
+        """Background event loop for sync streams, started on first use; its client's connections stay on it."""
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-stream-loop", daemon=True).start()
+                self._loop = loop
+            if self._loop_client is None:
+                self._loop_client = AsyncLLMClient(self.config_path)
+            return self._loop
+
+    def _scheduled_stream(self, messages: List[Dict], debug: Dict) -> Iterator[str]:
+        """
+        Sync `_scheduled_stream_async`, run on the background loop: the same failover,
+        hedging and deadlines as async callers. Closing it early releases the slot.
+        """
+        loop = self._stream_loop()
+        deltas = self._scheduled_stream_async(messages, debug, self._loop_client)
+        try:
+            while True:
+                try:
+                    yield asyncio.run_coroutine_threadsafe(deltas.__anext__(), loop).result()
+                except StopAsyncIteration:
+                    return
+        finally:
+            asyncio.run_coroutine_threadsafe(deltas.aclose(), loop).result()
+
+    def answer_stream(self, question: str, retrieved_chunks: List[Dict],
+                      query_vector: Optional[np.ndarray] = None, index_version: Optional[str] = None) -> AnswerStream:
+        """
+        Streaming variant of `answer`. Iterate the returned AnswerStream for text
+        deltas; timings and the final text are available on it afterwards.
+        A cache hit (or a busy rejection) is emitted as a single delta. The LLM call
+        goes through AsyncLLMClient on a background event loop (see `_scheduled_stream`).
+        """
+        messages, context_stats, budget, cache_key, cached = self._prepare(
+            question, retrieved_chunks, query_vector, index_version)
+        if cached is not None:
+            return AnswerStream(iter([cached]), messages, cache_hit=True,
+                                debug={"context": context_stats, "budget": budget})
+        
+        debug = {"context": context_stats, "budget": budget}
+        return AnswerStream(self._scheduled_stream(messages, debug), messages, cache_hit=False,
+                            on_complete=lambda text: self._store(cache_key, text), debug=debug)
+
+    async def _scheduled_stream_async(self, messages: List[Dict], debug: Dict,
+                                      client: Optional[AsyncLLMClient] = None) -> AsyncIterator[str]:
+        """
+        Holds a scheduler slot for the whole stream; yields the busy message if not admitted.
+        Streams through AsyncLLMClient (retries, failover and hedging before the first token).
+        Adds 'usage' to `debug` once the stream has ended, and 'error' if it failed.
+        """
+        client = client or self.async_client
+        usage = {}
+        try:
+            async with self.scheduler.async_slot():
+                async for delta in client.generate_stream(
+                        messages, max_tokens=self._max_tokens(debug["budget"]), usage=usage):
+                    yield delta
+        except (SchedulerRejectedError, SchedulerTimeoutError) as e:
+            debug["degraded"] = str(e)
+            yield BUSY_MESSAGE
+        except Exception as e:
+            # No provider answered, or the stream broke after output had started
+            debug["error"] = str(e) or type(e).__name__
+            yield f"Error calling LLM: {debug['error']}"
+        if usage:
+            debug["usage"] = usage
+
+    async def answer_stream_async(self, question: str, retrieved_chunks: List[Dict],
+                                  query_vector: Optional[np.ndarray] = None,
+                                  index_version: Optional[str] = None) -> AnswerStream:
+        """
+        Async variant of `answer_stream` using AsyncLLMClient; iterate the returned
+        AnswerStream with `async for`. Prompt packing and the cache lookup run in a worker thread.
+        """
+        messages, context_stats, budget, cache_key, cached = await asyncio.to_thread(
+            self._prepare, question, retrieved_chunks, query_vector, index_version)
+        if cached is not None:
+            return AnswerStream(_aiter([cached]), messages, cache_hit=True,
+                                debug={"context": context_stats, "budget": budget})
+
+        debug = {"context": context_stats, "budget": budget}
+        return AnswerStream(self._scheduled_stream_async(messages, debug), messages, cache_hit=False,
+                            on_complete=lambda text: self._store(cache_key, text), debug=debug)
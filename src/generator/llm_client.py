@@ -1,89 +1,173 @@
 import os
+import time
 import yaml
 import sys
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterator
 from openai import OpenAI
 
 # Add src to path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(current_dir, ".."))
 from utils.paths import ROOT_DIR
+from utils.metrics import span, observe_stage
+from .token_budget import get_accountant
+
+def load_env():
+    """Simple .env loader to avoid extra dependencies"""
+    # Look for .env in the project root
+    env_path = ROOT_DIR / ".env"
+    
+    if env_path.exists():
+        print(f"[Info] Loading environment variables from {env_path}")
+        with open(env_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if "=" in line:
+                    key, value = line.split("=", 1)
+                    # Only set if not already set (allow override via shell)
+                    if key.strip() not in os.environ:
+                        os.environ[key.strip()] = value.strip().strip('"').strip("'")
+
+def load_config(path: str) -> Dict:
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"LLM config not found at {path}")
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+def resolve_provider(config: Dict, provider: str) -> Dict:
+    """
+    Resolves connection and request settings for a provider section of rag_config.yaml.
+    Priority: Environment Variable > Config File > Default
+    Env var naming convention: {PROVIDER}_MODEL / {PROVIDER}_BASE_URL (e.g. DEEPSEEK_MODEL)
+    """
+    conf = config.get(provider)
+    if not conf:
+        raise ValueError(f"Configuration for provider '{provider}' not found in rag_config.yaml")
+    
+    api_key_env = conf.get("api_key_env")
+    return {
+        "name": provider,
+        "api_key_env": api_key_env,
+        "api_key": os.environ.get(api_key_env) if api_key_env else None,
+        # Allows local override via .env for public repos
+        "base_url": os.environ.get(f"{provider.upper()}_BASE_URL", conf.get("base_url")),
+        "model": os.environ.get(f"{provider.upper()}_MODEL", conf.get("model")),
+        "temperature": conf.get("temperature", 0.1),
+        "max_tokens": conf.get("max_tokens", 512),
+    }
 
 class LLMClient:
     def __init__(self, config_path: str):
         self._load_env()
         self.config = self._load_config(config_path)
         self.client = self._init_client()
+        self.accountant = get_accountant(self.config)
     
     def _load_env(self):
-        """Simple .env loader to avoid extra dependencies"""
-        # Look for .env in the project root
-        env_path = ROOT_DIR / ".env"
-        
-        if env_path.exists():
-            print(f"[Info] Loading environment variables from {env_path}")
-            with open(env_path, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line or line.startswith("#"):
-                        continue
-                    if "=" in line:
-                        key, value = line.split("=", 1)
-                        # Only set if not already set (allow override via shell)
-                        if key.strip() not in os.environ:
-                            os.environ[key.strip()] = value.strip().strip('"').strip("'")
+        load_env()
 
     def _load_config(self, path: str) -> Dict:
-        if not os.path.exists(path):
-            raise FileNotFoundError(f"LLM config not found at {path}")
-        with open(path, "r", encoding="utf-8") as f:
-            return yaml.safe_load(f)
+        return load_config(path)
             
     def _init_client(self) -> OpenAI:
         provider = self.config.get("provider", "doubao")
-        conf = self.config.get(provider)
-        
-        if not conf:
-             raise ValueError(f"Configuration for provider '{provider}' not found in rag_config.yaml")
-            
-        api_key_env = conf.get("api_key_env")
-        api_key = os.environ.get(api_key_env)
+        settings = resolve_provider(self.config, provider)
         
-        # Priority: Env Var > Config
-        # Allows local override via .env for public repos
-        env_base_url_key = f"{provider.upper()}_BASE_URL"
-        base_url = os.environ.get(env_base_url_key, conf.get("base_url"))
-        
-        if not api_key:
-            print(f"[Warning] {api_key_env} not set. LLM calls will fail.")
+        if not settings["api_key"]:
+            print(f"[Warning] {settings['api_key_env']} not set. LLM calls will fail.")
             
-        return OpenAI(api_key=api_key, base_url=base_url)
+        llm_conf = self.config.get("llm", {})
+        return OpenAI(
+            api_key=settings["api_key"],
+            base_url=settings["base_url"],
+            timeout=llm_conf.get("request_timeout_sec", 60),
+            max_retries=llm_conf.get("max_retries", 2)
+        )
+
+    def _request_params(self, max_tokens: Optional[int] = None) -> Dict:
+        settings = resolve_provider(self.config, self.config.get("provider", "doubao"))
+        return {
+            "model": settings["model"],
+            "temperature": settings["temperature"],
+            "max_tokens": max_tokens or settings["max_tokens"],
+        }
 
-    def generate(self, messages: List[Dict]) -> str:
+    def generate(self, messages: List[Dict], max_tokens: Optional[int] = None,
+                 usage: Optional[Dict] = None) -> str:
         """
         Calls the LLM API to generate a response.
+        `max_tokens` overrides the provider's configured limit for this call.
+        `usage`, if given, is filled with the call's token usage and estimated cost.
         """
         if not self.client.api_key:
              return "Error: API Key missing. Please set environment variable."
 
         provider = self.config.get("provider", "doubao")
-        conf = self.config.get(provider, {})
-        
-        # Priority: Environment Variable > Config File > Default
-        # Env var naming convention: {PROVIDER}_MODEL (e.g. DEEPSEEK_MODEL)
-        env_model_key = f"{provider.upper()}_MODEL"
-        model = os.environ.get(env_model_key, conf.get("model"))
-        
-        temp = conf.get("temperature", 0.1)
-        max_tokens = conf.get("max_tokens", 512)
-        
         try:
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=temp,
-                max_tokens=max_tokens
-            )
-            return response.choices[0].message.content
+            with span("llm_generate", provider=provider):
+                response = self.client.chat.completions.create(
+                    messages=messages,
+                    **self._request_params(max_tokens)
+                )
+            content = response.choices[0].message.content
+            if response.usage is not None:
+                self.accountant.record(provider, response.usage.prompt_tokens,
+                                       response.usage.completion_tokens, usage)
+            else:
+                self.accountant.record_estimate(provider, messages, content or "", usage)
+            return content
         except Exception as e:
             return f"Error calling LLM: {str(e)}"
+
+    def generate_stream(self, messages: List[Dict], max_tokens: Optional[int] = None,
+                        usage: Optional[Dict] = None, status: Optional[Dict] = None) -> Iterator[str]:
+        """
+        Streaming variant of `generate`: yields text deltas as they arrive.
+        `usage` is filled once the stream has ended (estimated if the provider sent none).
+        Errors are yielded as a final "Error calling LLM: ..." delta, like `generate` returns them,
+        possibly after partial output; `status`, if given, then gets the error as 'error'.
+        """
+        status = status if status is not None else {}
+        if not self.client.api_key:
+            status["error"] = "API key missing"
+            yield "Error: API Key missing. Please set environment variable."
+            return
+
+        provider = self.config.get("provider", "doubao")
+        extra = {}
+        if self.config.get("llm", {}).get("stream_include_usage", True):
+            # Final chunk then carries token usage (and no choices)
+            extra["stream_options"] = {"include_usage": True}
+        try:
+            start_t = time.perf_counter()
+            first = True
+            parts = []
+            recorded = False
+            with span("llm_stream", provider=provider):
+                stream = self.client.chat.completions.create(
+                    messages=messages,
+                    stream=True,
+                    **self._request_params(max_tokens),
+                    **extra
+                )
+                for chunk in stream:
+                    if getattr(chunk, "usage", None) is not None:
+                        self.accountant.record(provider, chunk.usage.prompt_tokens,
+                                               chunk.usage.completion_tokens, usage)
+                        recorded = True
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if first:
+                            first = False
+                            observe_stage("llm_ttft", (time.perf_counter() - start_t) * 1000, provider=provider)
+                        parts.append(delta)
+                        yield delta
+            if not recorded:
+                self.accountant.record_estimate(provider, messages, "".join(parts), usage)
+        except Exception as e:
+            status["error"] = str(e)
+            yield f"Error calling LLM: {str(e)}"
@@ -1,16 +1,24 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
 
-def build_rag_prompt(question: str, chunks: List[Dict]) -> List[Dict]:
+from .context_packer import pack_context
+
+def build_rag_prompt(question: str, chunks: List[Dict], token_budget: Optional[int] = None,
+                     max_chunk_tokens: Optional[int] = None) -> List[Dict]:
     """
     Constructs a chat prompt for the LLM using retrieved chunks.
     
     Args:
         question: User's question.
         chunks: List of retrieved blocks (metadata + content).
+        token_budget: If set, chunks are packed into this many context tokens
+            first (see `context_packer.pack_context`).
+        max_chunk_tokens: Per-chunk cap used when packing.
         
     Returns:
         A list of message dictionaries for the chat completion API.
     """
+    if token_budget:
+        chunks, _ = pack_context(question, chunks, token_budget, max_chunk_tokens)
     
     system_prompt = (
         "You are a helpful documentation assistant for BytePlus ECS (Elastic Compute Service).\n"
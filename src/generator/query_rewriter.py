@@ -0,0 +1,160 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Optional
+
+from .llm_client import LLMClient
+from .scheduler import LLMScheduler, SchedulerRejectedError, SchedulerTimeoutError
+
+REWRITE_SYSTEM_PROMPT = (
+    "You rewrite user questions into search queries for the BytePlus ECS documentation, which is in English.\n"
+    "Reply with exactly two lines and nothing else:\n"
+    "TRANSLATION: <the question translated to English, or NONE if it is already English>\n"
+    "EXPANDED: <an English search query using precise ECS product terminology "
+    "(e.g. snapshot, instance type, security group, ModifyInstanceSpec)>"
+)
+
+_LINE = re.compile(r"^\s*(TRANSLATION|EXPANDED)\s*[:：]\s*(.+?)\s*$", re.IGNORECASE | re.MULTILINE)
+
+
+class PendingRewrite:
+    """A submitted rewrite: the shared future plus this caller's start time."""
+    __slots__ = ("future", "started")
+
+    def __init__(self, future: Future, started: float):
+        self.future = future
+        self.started = started
+
+
+class QueryRewriter:
+    """
+    LLM query expansion + Chinese->English translation that runs beside retrieval.
+
+    `submit` starts the rewrite on a worker thread and returns at once, so the
+    original query can be searched in the meantime; `wait` gives the rewrites
+    only if they arrive within `deadline_ms` of submission, otherwise []. A late
+    rewrite still finishes in the background and is cached, so asking again is free.
+    Calls go through the shared LLM scheduler and are skipped when it is saturated.
+    """
+
+    def __init__(self, client: LLMClient, scheduler: LLMScheduler, deadline_ms: float = 1200,
+                 max_tokens: int = 128, cache_size: int = 1024, ttl_sec: float = 86400, max_workers: int = 4):
+        self.client = client
+        self.scheduler = scheduler
+        self.deadline_ms = deadline_ms
+        self.max_tokens = max_tokens
+        self.cache_size = cache_size
+        self.ttl_sec = ttl_sec
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="query-rewrite")
+        self._stats = {"requests": 0, "cache_hits": 0, "late": 0, "failed": 0}
+
+    @classmethod
+    def from_config(cls, client: LLMClient, scheduler: LLMScheduler, config: Dict) -> Optional["QueryRewriter"]:
+        conf = config.get("query_rewrite", {})
+        if not conf.get("enabled"):
+            return None
+        return cls(
+            client,
+            scheduler,
+            deadline_ms=conf.get("deadline_ms", 1200),
+            max_tokens=conf.get("max_tokens", 128),
+            cache_size=conf.get("cache_size", 1024),
+            ttl_sec=conf.get("ttl_sec", 86400),
+        )
+
+    @staticmethod
+    def _key(question: str) -> str:
+        return " ".join(question.lower().split())
+
+    @staticmethod
+    def parse(question: str, text: str) -> List[str]:
+        """Extracts the distinct rewrites (translation first) that differ from the question."""
+        seen = {QueryRewriter._key(question)}
+        rewrites = []
+        fields = {label.upper(): value for label, value in _LINE.findall(text or "")}
+        for label in ("TRANSLATION", "EXPANDED"):
+            value = fields.get(label, "").strip().strip('"')
+            if not value or value.upper() == "NONE" or QueryRewriter._key(value) in seen:
+                continue
+            seen.add(QueryRewriter._key(value))
+            rewrites.append(value)
+        return rewrites
+
+    def _cached(self, key: str) -> Optional[List[str]]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry["created"] > self.ttl_sec:
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return entry["rewrites"]
+
+    def _call_llm(self, question: str) -> Optional[List[str]]:
+        messages = [
+            {"role": "system", "content": REWRITE_SYSTEM_PROMPT},
+            {"role": "user", "content": question},
+        ]
+        try:
+            # Rewrites are optional: never wait longer for a slot than we'd wait for the rewrite
+            with self.scheduler.slot(timeout=self.deadline_ms / 1000):
+                text = self.client.generate(messages, max_tokens=self.max_tokens)
+        except (SchedulerRejectedError, SchedulerTimeoutError):
+            return None
+        if not text or text.startswith("Error"):
+            return None
+        return self.parse(question, text)
+
+    def _rewrite(self, question: str, key: str) -> List[str]:
+        rewrites = self._call_llm(question)
+        with self._lock:
+            if rewrites is None:
+                self._stats["failed"] += 1
+            else:
+                self._cache[key] = {"rewrites": rewrites, "created": time.time()}
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            self._inflight.pop(key, None)
+        return rewrites or []
+
+    def submit(self, question: str) -> "PendingRewrite":
+        """Starts (or reuses) the rewrite of `question`; returns immediately."""
+        started = time.monotonic()
+        key = self._key(question)
+        with self._lock:
+            self._stats["requests"] += 1
+        cached = self._cached(key)
+        if cached is not None:
+            with self._lock:
+                self._stats["cache_hits"] += 1
+            future = Future()
+            future.set_result(cached)
+        else:
+            with self._lock:
+                # Concurrent identical questions share one LLM call
+                future = self._inflight.get(key)
+                if future is None:
+                    future = self._pool.submit(self._rewrite, question, key)
+                    self._inflight[key] = future
+        return PendingRewrite(future, started)
+
+    def wait(self, pending: "PendingRewrite") -> List[str]:
+        """Rewrites if ready before the deadline (counted from `submit`), else []."""
+        remaining = self.deadline_ms / 1000 - (time.monotonic() - pending.started)
+        try:
+            return pending.future.result(timeout=max(0.0, remaining))
+        except FutureTimeoutError:
+            with self._lock:
+                self._stats["late"] += 1
+            return []
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "cache_size": len(self._cache)}
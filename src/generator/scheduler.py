@@ -0,0 +1,276 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, Any, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: cross-process slots unavailable
+    fcntl = None
+
+
+class SchedulerRejectedError(Exception):
+    """Raised when the LLM wait queue is full (fast rejection)."""
+
+
+class SchedulerTimeoutError(Exception):
+    """Raised when a request waited longer than its queue deadline."""
+
+
+class _FileSlots:
+    """
+    Cross-process slot pool: one lock file per slot, held with flock.
+    Locks are released by the OS if a process dies, so slots never leak.
+    """
+
+    def __init__(self, directory: str, slots: int):
+        if fcntl is None:
+            raise RuntimeError("Cross-process LLM slots require fcntl (POSIX).")
+        os.makedirs(directory, exist_ok=True)
+        self.paths = [os.path.join(directory, f"slot_{i}.lock") for i in range(slots)]
+
+    def try_acquire(self) -> Optional[int]:
+        for path in self.paths:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except OSError:
+                os.close(fd)
+        return None
+
+    def release(self, fd: int):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+class LLMScheduler:
+    """
+    Process-wide admission control for LLM calls.
+
+    - At most `max_in_flight` calls run at once; further callers wait FIFO.
+    - At most `max_queue` callers may wait; beyond that requests are rejected
+      immediately (SchedulerRejectedError) so the caller can degrade.
+    - A waiting caller gives up after `queue_timeout_sec` (SchedulerTimeoutError).
+    - With `cross_process_dir` set, the in-flight limit is also enforced across
+      processes (e.g. several Streamlit / API workers on one host) via lock files.
+
+    Queue wait times are recorded for `stats()`. Threads wait with `acquire`;
+    coroutines wait with `acquire_async` / `async_slot` in the same FIFO queue
+    without tying up an executor thread.
+    """
+
+    def __init__(self, max_in_flight: int = 4, max_queue: int = 16, queue_timeout_sec: float = 10.0,
+                 cross_process_dir: Optional[str] = None, poll_interval: float = 0.05):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout_sec = queue_timeout_sec
+        self.poll_interval = poll_interval
+        self._file_slots = _FileSlots(cross_process_dir, max_in_flight) if cross_process_dir else None
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._waiters = deque()  # FIFO tickets
+        # Tickets of coroutine waiters -> (their loop, wake-up event)
+        self._async_waiters: Dict[object, Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = {}
+        self._waits_ms = deque(maxlen=1000)
+        self._counters = {"admitted": 0, "rejected": 0, "timed_out": 0}
+
+    def _record_wait(self, waited_ms: float):
+        self._waits_ms.append(waited_ms)
+
+    def _notify(self):
+        """Wakes all waiting threads and coroutines. Caller holds `_cond`."""
+        self._cond.notify_all()
+        for loop, event in self._async_waiters.values():
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:  # loop already closed
+                pass
+
+    def _enqueue(self) -> Optional[object]:
+        """
+        Takes a free slot (returns None) or queues a FIFO ticket. Raises
+        SchedulerRejectedError when the queue is full. Caller holds `_cond`.
+        """
+        if self._in_flight < self.max_in_flight and not self._waiters:
+            self._in_flight += 1
+            return None
+        if len(self._waiters) >= self.max_queue:
+            self._counters["rejected"] += 1
+            raise SchedulerRejectedError(f"LLM queue full ({self.max_queue} waiting)")
+        ticket = object()
+        self._waiters.append(ticket)
+        return ticket
+
+    def _try_take(self, ticket: object) -> bool:
+        """Takes the slot if `ticket` is first in line and one is free. Caller holds `_cond`."""
+        if self._waiters[0] is ticket and self._in_flight < self.max_in_flight:
+            self._in_flight += 1
+            return True
+        return False
+
+    def _dequeue(self, ticket: object):
+        self._waiters.remove(ticket)
+        self._async_waiters.pop(ticket, None)
+        self._notify()
+
+    def _admitted(self, start_t: float):
+        with self._cond:
+            self._counters["admitted"] += 1
+            self._record_wait((time.monotonic() - start_t) * 1000)
+
+    def _timed_out(self, timeout: float, what: str = "an LLM slot") -> SchedulerTimeoutError:
+        with self._cond:
+            self._counters["timed_out"] += 1
+        return SchedulerTimeoutError(f"Waited more than {timeout:.1f}s for {what}")
+
+    def acquire(self, timeout: Optional[float] = None) -> Optional[int]:
+        """
+        Blocks until a slot is free. Returns an opaque token for `release`.
+        Raises SchedulerRejectedError / SchedulerTimeoutError.
+        """
+        timeout = self.queue_timeout_sec if timeout is None else timeout
+        start_t = time.monotonic()
+        deadline = start_t + timeout
+
+        with self._cond:
+            ticket = self._enqueue()
+            if ticket is not None:
+                try:
+                    while not self._try_take(ticket):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._counters["timed_out"] += 1
+                            raise SchedulerTimeoutError(f"Waited more than {timeout:.1f}s for an LLM slot")
+                        self._cond.wait(remaining)
+                finally:
+                    self._dequeue(ticket)
+
+        token = None
+        if self._file_slots is not None:
+            # Second stage: a host-wide slot shared with other processes
+            while True:
+                token = self._file_slots.try_acquire()
+                if token is not None:
+                    break
+                if time.monotonic() >= deadline:
+                    self._release_local()
+                    raise self._timed_out(timeout, "a host-wide LLM slot")
+                time.sleep(self.poll_interval)
+
+        self._admitted(start_t)
+        return token
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> Optional[int]:
+        """
+        `acquire` for coroutines: waits on the event loop (woken by releases, no
+        executor thread held), in the same FIFO queue and under the same limits.
+        """
+        timeout = self.queue_timeout_sec if timeout is None else timeout
+        start_t = time.monotonic()
+        deadline = start_t + timeout
+
+        with self._cond:
+            ticket = self._enqueue()
+            if ticket is not None:
+                event = asyncio.Event()
+                self._async_waiters[ticket] = (asyncio.get_running_loop(), event)
+        if ticket is not None:
+            try:
+                while True:
+                    with self._cond:
+                        if self._try_take(ticket):
+                            break
+                        event.clear()
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._timed_out(timeout)
+                    try:
+                        await asyncio.wait_for(event.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                with self._cond:
+                    self._dequeue(ticket)
+
+        token = None
+        if self._file_slots is not None:
+            # Host-wide slot: flock has no async wait, so poll without blocking the loop
+            try:
+                while True:
+                    token = self._file_slots.try_acquire()
+                    if token is not None:
+                        break
+                    if time.monotonic() >= deadline:
+                        raise self._timed_out(timeout, "a host-wide LLM slot")
+                    await asyncio.sleep(self.poll_interval)
+            except BaseException:
+                self._release_local()
+                raise
+
+        self._admitted(start_t)
+        return token
+
+    def _release_local(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._notify()
+
+    def release(self, token: Optional[int] = None):
+        if token is not None and self._file_slots is not None:
+            self._file_slots.release(token)
+        self._release_local()
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None):
+        token = self.acquire(timeout)
+        try:
+            yield
+        finally:
+            self.release(token)
+
+    @asynccontextmanager
+    async def async_slot(self, timeout: Optional[float] = None):
+        """Async variant of `slot` (see `acquire_async`)."""
+        token = await self.acquire_async(timeout)
+        try:
+            yield
+        finally:
+            self.release(token)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            waits = sorted(self._waits_ms)
+            pct = lambda q: waits[min(len(waits) - 1, int(q * len(waits)))] if waits else 0.0
+            return {
+                **self._counters,
+                "in_flight": self._in_flight,
+                "queued": len(self._waiters),
+                "max_in_flight": self.max_in_flight,
+                "queue_wait_p50_ms": pct(0.50),
+                "queue_wait_p95_ms": pct(0.95),
+                "queue_wait_max_ms": waits[-1] if waits else 0.0,
+            }
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(config: Dict) -> LLMScheduler:
+    """Returns the process-wide scheduler, created from the `scheduler` config section on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            conf = config.get("scheduler", {})
+            _scheduler = LLMScheduler(
+                max_in_flight=conf.get("max_in_flight", 4),
+                max_queue=conf.get("max_queue", 16),
+                queue_timeout_sec=conf.get("queue_timeout_sec", 10.0),
+                cross_process_dir=conf.get("cross_process_dir") or None,
+            )
+        return _scheduler
@@ -0,0 +1,194 @@
+import os
+import sys
+import time
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+from utils.metrics import REGISTRY, record_tokens
+
+from .context_packer import count_tokens, count_message_tokens
+
+LLM_COST = REGISTRY.counter("rag_llm_cost_total", "Estimated LLM cost (usage.currency) by provider")
+
+# Spend is aggregated in buckets of this many seconds
+BUCKET_SEC = 10
+
+
+def window_label(seconds: int) -> str:
+    if seconds % 3600 == 0:
+        return f"{seconds // 3600}h"
+    if seconds % 60 == 0:
+        return f"{seconds // 60}m"
+    return f"{seconds}s"
+
+
+class TokenAccountant:
+    """
+    Process-wide accounting of LLM token usage and estimated cost, with budgets.
+
+    - Every LLM response's `usage` (prompt / completion tokens) is recorded per
+      provider and priced with `usage.prices` (per 1M tokens). Responses without
+      usage are estimated from the prompt and answer text (`estimated: True`).
+    - Spend is aggregated over sliding windows (`usage.windows_sec`).
+    - Budgets cap spend per window in tokens and/or cost. Once a window passes
+      `soft_limit` of its budget, `caps()` scales `max_tokens` and the context
+      token budget of new requests down linearly, reaching the floors
+      (`min_max_tokens`, `min_context_tokens`) at 100%. Requests are never rejected.
+    """
+
+    def __init__(self, prices: Optional[Dict[str, Dict[str, float]]] = None, currency: str = "USD",
+                 windows_sec: Optional[List[int]] = None, budgets: Optional[List[Dict[str, float]]] = None,
+                 soft_limit: float = 0.8, min_max_tokens: int = 256, min_context_tokens: int = 800):
+        self.prices = prices or {}
+        self.currency = currency
+        self.windows_sec = sorted(windows_sec or [60, 3600, 86400])
+        self.budgets = [b for b in budgets or [] if b.get("max_tokens") or b.get("max_cost")]
+        self.soft_limit = soft_limit
+        self.min_max_tokens = min_max_tokens
+        self.min_context_tokens = min_context_tokens
+        self._horizon = max(self.windows_sec + [b["window_sec"] for b in self.budgets])
+        self._lock = threading.Lock()
+        # [bucket start, requests, prompt tokens, completion tokens, cost]
+        self._buckets = deque()
+        self._providers: Dict[str, Dict[str, float]] = {}
+        self._capped = 0
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "TokenAccountant":
+        conf = config.get("usage", {})
+        return cls(
+            prices=conf.get("prices"),
+            currency=conf.get("currency", "USD"),
+            windows_sec=conf.get("windows_sec"),
+            budgets=conf.get("budgets"),
+            soft_limit=conf.get("soft_limit", 0.8),
+            min_max_tokens=conf.get("min_max_tokens", 256),
+            min_context_tokens=conf.get("min_context_tokens", 800),
+        )
+
+    def cost(self, provider: str, prompt_tokens: int, completion_tokens: int) -> float:
+        price = self.prices.get(provider) or {}
+        return (prompt_tokens * price.get("prompt", 0.0) + completion_tokens * price.get("completion", 0.0)) / 1e6
+
+    def record(self, provider: str, prompt_tokens: Optional[int], completion_tokens: Optional[int],
+               out: Optional[Dict[str, Any]] = None, estimated: bool = False) -> Dict[str, Any]:
+        """
+        Records one LLM response (also in the Prometheus token counters and the active trace).
+        Fills and returns `out` with this request's usage and cost.
+        """
+        prompt_tokens, completion_tokens = prompt_tokens or 0, completion_tokens or 0
+        record_tokens(prompt_tokens, completion_tokens, provider)
+        cost = self.cost(provider, prompt_tokens, completion_tokens)
+        if cost:
+            LLM_COST.inc(cost, provider=provider)
+        now = time.time()
+        with self._lock:
+            start = now - now % BUCKET_SEC
+            if not self._buckets or self._buckets[-1][0] != start:
+                self._buckets.append([start, 0, 0, 0, 0.0])
+            bucket = self._buckets[-1]
+            bucket[1] += 1
+            bucket[2] += prompt_tokens
+            bucket[3] += completion_tokens
+            bucket[4] += cost
+            totals = self._providers.setdefault(
+                provider, {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0})
+            totals["requests"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+            totals["cost"] += cost
+            self._prune(now)
+        out = out if out is not None else {}
+        out.update({
+            "provider": provider,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "cost": cost,
+            "estimated": estimated,
+        })
+        return out
+
+    def record_estimate(self, provider: str, messages: List[Dict], answer: str,
+                        out: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """For responses without a `usage` block (e.g. providers that ignore stream_options)."""
+        return self.record(provider, count_message_tokens(messages), count_tokens(answer), out, estimated=True)
+
+    def _prune(self, now: float):
+        while self._buckets and self._buckets[0][0] < now - self._horizon - BUCKET_SEC:
+            self._buckets.popleft()
+
+    def window(self, seconds: int) -> Dict[str, float]:
+        """Spend over the last `seconds` (at bucket granularity)."""
+        since = time.time() - seconds
+        totals = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+        with self._lock:
+            for start, requests, prompt_tokens, completion_tokens, cost in reversed(self._buckets):
+                if start + BUCKET_SEC <= since:
+                    break
+                totals["requests"] += requests
+                totals["prompt_tokens"] += prompt_tokens
+                totals["completion_tokens"] += completion_tokens
+                totals["cost"] += cost
+        totals["total_tokens"] = totals["prompt_tokens"] + totals["completion_tokens"]
+        return totals
+
+    def pressure(self) -> float:
+        """Highest used share of any budget (0 without budgets)."""
+        usage = 0.0
+        for budget in self.budgets:
+            spent = self.window(budget["window_sec"])
+            if budget.get("max_tokens"):
+                usage = max(usage, spent["total_tokens"] / budget["max_tokens"])
+            if budget.get("max_cost"):
+                usage = max(usage, spent["cost"] / budget["max_cost"])
+        return usage
+
+    def caps(self, max_tokens: int, context_budget: Optional[int]) -> Dict[str, Any]:
+        """
+        Per-request limits under the current budget pressure: `max_tokens` and
+        `context_token_budget` (None = no context budget configured), plus `pressure`.
+        """
+        pressure = self.pressure()
+        scale = 1.0
+        if pressure > self.soft_limit:
+            scale = max(0.0, (1.0 - pressure) / (1.0 - self.soft_limit)) if self.soft_limit < 1 else 0.0
+        caps = {"pressure": pressure, "scale": scale, "max_tokens": max_tokens, "context_token_budget": context_budget}
+        if scale < 1.0:
+            caps["max_tokens"] = max(min(self.min_max_tokens, max_tokens), int(max_tokens * scale))
+            if context_budget:
+                caps["context_token_budget"] = max(min(self.min_context_tokens, context_budget),
+                                                   int(context_budget * scale))
+            with self._lock:
+                self._capped += 1
+        return caps
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {"capped_requests": self._capped, "budget_pressure": self.pressure()}
+        for seconds in self.windows_sec:
+            label = window_label(seconds)
+            spent = self.window(seconds)
+            stats[f"requests_{label}"] = spent["requests"]
+            stats[f"prompt_tokens_{label}"] = spent["prompt_tokens"]
+            stats[f"completion_tokens_{label}"] = spent["completion_tokens"]
+            stats[f"cost_{label}"] = spent["cost"]
+        with self._lock:
+            stats["providers"] = {name: dict(totals) for name, totals in self._providers.items()}
+        stats["currency"] = self.currency
+        return stats
+
+
+_accountant: Optional[TokenAccountant] = None
+_accountant_lock = threading.Lock()
+
+
+def get_accountant(config: Dict) -> TokenAccountant:
+    """Returns the process-wide accountant, created from the `usage` config section on first use."""
+    global _accountant
+    with _accountant_lock:
+        if _accountant is None:
+            _accountant = TokenAccountant.from_config(config)
+        return _accountant
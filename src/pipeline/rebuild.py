@@ -0,0 +1,498 @@
+import os
+import sys
+import glob
+import json
+import time
+import queue
+import hashlib
+import argparse
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+import faiss
+import numpy as np
+import yaml
+
+# Add src to path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+# The processor imports its parser as a top-level module
+sys.path.append(os.path.join(current_dir, "..", "processor"))
+
+from utils.paths import DATA_DIR, CONFIG_DIR, SRC_DIR
+from utils.profiling import add_profile_arguments, profiled
+from crawler.byteplus_crawler import iter_crawl_source, load_config as load_sources, MAX_PAGES_PER_SOURCE, CRAWL_DELAY_SEC
+from processor.simple_rag_processor import process_raw_page
+from embedding.embedder import DEFAULT_MODEL, RAGEmbedder
+from retrieval import index_store
+from retrieval.build_index import new_id_mapped_index, load_id_mapped_index, save_artifacts, group_by_shard, _write_json_atomic
+
+STAGES = ("crawl", "process", "embed", "index")
+CRAWL_MODES = ("auto", "always", "never")
+
+# Fingerprints of the last run (per raw page, processor code, embedding model), next to the blocks file
+STATE_FILENAME = "pipeline_state.json"
+# A change to any of these invalidates all cached processor output
+PROCESSOR_SOURCES = [
+    SRC_DIR / "processor" / "simple_rag_processor.py",
+    SRC_DIR / "processor" / "byteplus_parser.py",
+    SRC_DIR / "utils" / "dates.py",
+]
+
+# End-of-stream marker passed down the queues
+_DONE = object()
+
+
+class _Aborted(Exception):
+    """Another stage failed; unwinds the remaining stages."""
+
+
+class StageStats:
+    """Counters and timings of one stage for the report."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.cached = 0
+        self.wall_sec = 0.0
+        # Waiting for the upstream stage / for room in the downstream queue (backpressure)
+        self.starved_sec = 0.0
+        self.blocked_sec = 0.0
+        self.skipped = False
+
+    @property
+    def busy_sec(self) -> float:
+        return max(0.0, self.wall_sec - self.starved_sec - self.blocked_sec)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"items": self.items, "cached": self.cached, "busy_sec": self.busy_sec,
+                "starved_sec": self.starved_sec, "blocked_sec": self.blocked_sec,
+                "wall_sec": self.wall_sec, "skipped": self.skipped}
+
+
+class _Pipe:
+    """Bounded queue between two stages; gives up waiting once the run is aborted."""
+
+    def __init__(self, maxsize: int, abort: threading.Event):
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._abort = abort
+
+    def put(self, item, stats: StageStats):
+        start_t = time.perf_counter()
+        while True:
+            if self._abort.is_set():
+                raise _Aborted()
+            try:
+                self._queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stats.blocked_sec += time.perf_counter() - start_t
+
+    def get(self, stats: StageStats):
+        start_t = time.perf_counter()
+        while True:
+            if self._abort.is_set():
+                raise _Aborted()
+            try:
+                item = self._queue.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        stats.starved_sec += time.perf_counter() - start_t
+        return item
+
+    def empty(self) -> bool:
+        return self._queue.empty()
+
+
+def _file_md5(path) -> Optional[str]:
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def processor_fingerprint() -> str:
+    return hashlib.md5("".join(_file_md5(p) or "" for p in PROCESSOR_SOURCES).encode("utf-8")).hexdigest()
+
+
+def page_fingerprint(raw_data: Dict) -> str:
+    """Hash of what the processor reads from a raw page (crawl_time changes on every re-crawl, so it's left out)."""
+    key = "\x00".join(str(raw_data.get(k) or "") for k in ("url", "source_name", "category", "raw_content"))
+    return hashlib.md5(key.encode("utf-8")).hexdigest()
+
+
+class RebuildPipeline:
+    """
+    Crawl -> process -> embed -> index as a streaming pipeline: each stage runs in
+    its own thread and hands items to the next through a bounded queue, so pages are
+    parsed while the crawler is still fetching and blocks are embedded while pages
+    are still being parsed. The index is assembled and published once the stream ends.
+
+    Unchanged inputs are skipped: sources crawled recently are read from disk
+    (`--crawl auto`), pages whose content and processor code are unchanged reuse
+    their previous blocks, blocks already in the live index reuse their vectors,
+    and shards with identical blocks are carried over without rebuilding.
+    """
+
+    def __init__(self, sources: List[Dict], raw_dir: str, blocks_file: str, crawl: str = "auto",
+                 config_path: Optional[str] = None, max_pages: int = MAX_PAGES_PER_SOURCE,
+                 delay: float = CRAWL_DELAY_SEC, force: bool = False, keep_versions: int = 3):
+        if crawl not in CRAWL_MODES:
+            raise ValueError(f"Unknown crawl mode '{crawl}' (expected one of {', '.join(CRAWL_MODES)})")
+        self.sources = sources
+        self.raw_dir = raw_dir
+        self.blocks_file = blocks_file
+        self.crawl_mode = crawl
+        self.config_path = str(config_path or CONFIG_DIR / "rag_config.yaml")
+        self.max_pages = max_pages
+        self.delay = delay
+        self.force = force
+        self.keep_versions = keep_versions
+        self.state_file = os.path.join(os.path.dirname(os.path.abspath(blocks_file)), STATE_FILENAME)
+
+        with open(self.config_path, "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+        conf = config.get("pipeline", {})
+        self.queue_size = conf.get("queue_size", 64)
+        self.embed_batch_size = conf.get("embed_batch_size", 64)
+        self.recrawl_after_hours = conf.get("recrawl_after_hours", 24)
+        self.model_name = config.get("embedding", {}).get("model_name") or DEFAULT_MODEL
+
+        self.stats = {name: StageStats(name) for name in STAGES}
+        self.model_load_sec = 0.0
+        self._abort = threading.Event()
+        self._errors: List[tuple] = []
+
+        # Results, filled by the stages
+        self.pages: Dict[str, Dict] = {}        # raw path (relative) -> {"fingerprint", "block_ids"}
+        self.page_blocks: Dict[str, List[Dict]] = {}
+        self.vectors: Dict[str, np.ndarray] = {}
+        self.embedding_dim: Optional[int] = None
+        self._embedder: Optional[RAGEmbedder] = None
+
+        self._load_state()
+
+    # --- Cache state of the previous run ---
+
+    def _load_state(self):
+        self.state: Dict[str, Any] = {}
+        self.prev_blocks: Dict[str, Dict] = {}
+        if self.force or not os.path.exists(self.state_file):
+            return
+        with open(self.state_file, "r", encoding="utf-8") as f:
+            self.state = json.load(f)
+        # Page cache is only valid for the same processor code and the blocks file that run wrote
+        if (self.state.get("processor") == processor_fingerprint()
+                and self.state.get("blocks_md5") == _file_md5(self.blocks_file)):
+            with open(self.blocks_file, "r", encoding="utf-8") as f:
+                self.prev_blocks = {b["block_id"]: b for b in json.load(f)}
+        else:
+            print("[Info] Processor code or blocks file changed since the last run; reprocessing all pages.")
+
+    def _save_state(self, index_version: Optional[str]):
+        self.state = {
+            "updated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "processor": processor_fingerprint(),
+            "embedding_model": self.model_name,
+            "blocks_md5": _file_md5(self.blocks_file),
+            "index_version": index_version,
+            "pages": self.pages,
+        }
+        _write_json_atomic(self.state_file, self.state)
+
+    # --- Stages ---
+
+    def _should_crawl(self, source_dir: str) -> bool:
+        if self.crawl_mode != "auto":
+            return self.crawl_mode == "always"
+        pages = glob.glob(os.path.join(source_dir, "*.json"))
+        if not pages:
+            return True
+        if self.recrawl_after_hours:
+            age_hours = (time.time() - max(os.path.getmtime(p) for p in pages)) / 3600
+            return age_hours > self.recrawl_after_hours
+        return False
+
+    def _crawl(self, out: _Pipe):
+        stats = self.stats["crawl"]
+        seen: Set[str] = set()
+
+        def emit(path: str):
+            if path not in seen:
+                seen.add(path)
+                out.put(path, stats)
+
+        to_crawl = []
+        # Sources with fresh raw pages go first, so downstream stages start right away
+        for entry in self.sources:
+            source_dir = os.path.join(self.raw_dir, entry["source_name"])
+            if self._should_crawl(source_dir):
+                to_crawl.append(entry)
+                continue
+            print(f"[Info] Using existing raw pages of {entry['source_name']} (crawl skipped)")
+            for path in sorted(glob.glob(os.path.join(source_dir, "*.json"))):
+                stats.cached += 1
+                emit(path)
+        for entry in to_crawl:
+            print(f"\nProcessing Source: {entry['source_name']} (Seed: {entry['url']})")
+            for path in iter_crawl_source(entry["url"], entry["source_name"], self.raw_dir, self.max_pages, self.delay):
+                stats.items += 1
+                emit(path)
+        # Everything else under raw_dir (pages of earlier crawls, other sources), as simple_rag_processor does
+        for path in sorted(glob.glob(os.path.join(self.raw_dir, "**/*.json"), recursive=True)):
+            if path not in seen:
+                stats.cached += 1
+            emit(path)
+        out.put(_DONE, stats)
+
+    def _process(self, inp: _Pipe, out: _Pipe):
+        stats = self.stats["process"]
+        prev_pages = self.state.get("pages", {}) if self.prev_blocks else {}
+        while True:
+            path = inp.get(stats)
+            if path is _DONE:
+                break
+            key = os.path.relpath(path, self.raw_dir)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    raw_data = json.load(f)
+                fingerprint = page_fingerprint(raw_data)
+                prev = prev_pages.get(key)
+                if prev and prev["fingerprint"] == fingerprint and all(b in self.prev_blocks for b in prev["block_ids"]):
+                    blocks = [self.prev_blocks[b] for b in prev["block_ids"]]
+                    stats.cached += 1
+                else:
+                    blocks = process_raw_page(raw_data, path)
+                    stats.items += 1
+            except Exception as e:
+                print(f"Error processing {path}: {e}")
+                continue
+            self.pages[key] = {"fingerprint": fingerprint, "block_ids": [b["block_id"] for b in blocks]}
+            out.put((key, blocks), stats)
+        out.put(_DONE, stats)
+
+    def _live_vectors(self) -> Dict[str, tuple]:
+        """(content, vector) per block_id of the live index, if it was embedded with the configured model."""
+        if self.force or self.state.get("embedding_model") != self.model_name:
+            return {}
+        live_dir = index_store.current_version_dir()
+        if live_dir is not None and not self._built_with_model(live_dir):
+            return {}
+        known = {}
+        for index_file, meta_file in (index_store.shard_paths(live_dir) if live_dir else {}).values():
+            index = load_id_mapped_index(index_file)
+            with open(meta_file, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            ids = faiss.vector_to_array(index.id_map)
+            vectors = index.index.reconstruct_n(0, index.ntotal)
+            for pos, vector in zip(ids, vectors):
+                block = meta[pos]
+                if block is not None:
+                    known[block["block_id"]] = (block["content"], vector)
+            self.embedding_dim = index.d
+        return known
+
+    def _built_with_model(self, version_dir) -> bool:
+        # Versions built before the model was recorded are trusted to the state file's embedding_model
+        return index_store.version_model(version_dir) in (None, self.model_name)
+
+    def _embedder_instance(self) -> RAGEmbedder:
+        # Loaded on first use: a run where every vector is reused never loads the model
+        if self._embedder is None:
+            start_t = time.perf_counter()
+            self._embedder = RAGEmbedder(self.config_path)
+            self.model_load_sec = time.perf_counter() - start_t
+            self.embedding_dim = self._embedder.embedding_dim
+        return self._embedder
+
+    def _embed(self, inp: _Pipe):
+        stats = self.stats["embed"]
+        known = self._live_vectors()
+        pending: List[Dict] = []
+        pending_ids: Set[str] = set()
+
+        def flush():
+            vectors = self._embedder_instance().encode([b["content"] for b in pending])
+            for block, vector in zip(pending, vectors):
+                self.vectors[block["block_id"]] = vector
+            stats.items += len(pending)
+            pending.clear()
+            pending_ids.clear()
+
+        while True:
+            item = inp.get(stats)
+            if item is _DONE:
+                break
+            key, blocks = item
+            self.page_blocks[key] = blocks
+            for block in blocks:
+                block_id = block["block_id"]
+                if block_id in self.vectors or block_id in pending_ids:
+                    continue
+                reuse = known.get(block_id)
+                if reuse is not None and reuse[0] == block["content"]:
+                    self.vectors[block_id] = reuse[1]
+                    stats.cached += 1
+                else:
+                    pending.append(block)
+                    pending_ids.add(block_id)
+            # Full batch, or nothing else ready yet: don't keep blocks waiting
+            if len(pending) >= self.embed_batch_size or (pending and inp.empty()):
+                flush()
+        if pending:
+            flush()
+
+    def _same_blocks(self, meta_file: str, blocks: List[Dict]) -> bool:
+        with open(meta_file, "r", encoding="utf-8") as f:
+            live = [b for b in json.load(f) if b is not None]
+        return live == blocks
+
+    def _index(self, blocks: List[Dict]) -> Optional[str]:
+        """Builds changed shards into a new version and publishes it; returns the live version."""
+        stats = self.stats["index"]
+        new_shards = group_by_shard(blocks)
+        live_dir = index_store.current_version_dir()
+        live_shards = index_store.shard_paths(live_dir) if live_dir else {}
+        unchanged = set() if self.force or (live_dir and not self._built_with_model(live_dir)) else {
+            name for name, shard_blocks in new_shards.items()
+            if name in live_shards and self._same_blocks(live_shards[name][1], shard_blocks)
+        }
+        if unchanged == set(new_shards) == set(live_shards):
+            print(f"[Info] Index unchanged, keeping version {live_dir.name}.")
+            stats.skipped = True
+            stats.cached = len(blocks)
+            return live_dir.name
+
+        version_dir = index_store.new_version_dir()
+        index_store.write_model(version_dir, self.model_name)
+        for name, shard_blocks in sorted(new_shards.items()):
+            if name in unchanged:
+                index_store.link_shard(live_dir, version_dir, name)
+                print(f"[{name}] Unchanged, carried over from {live_dir.name}.")
+                stats.cached += len(shard_blocks)
+                continue
+            print(f"[{name}] Indexing {len(shard_blocks)} blocks...")
+            index = new_id_mapped_index(self.embedding_dim)
+            index.add_with_ids(np.vstack([self.vectors[b["block_id"]] for b in shard_blocks]),
+                               np.arange(len(shard_blocks), dtype=np.int64))
+            index_file, meta_file = index_store.artifact_paths(index_store.shard_dir(version_dir, name))
+            save_artifacts(index, shard_blocks, index_file, meta_file)
+            stats.items += len(shard_blocks)
+        index_store.publish(version_dir, model_name=self.model_name)
+        index_store.gc_versions(keep=self.keep_versions)
+        return version_dir.name
+
+    # --- Driver ---
+
+    def _run_stage(self, name: str, fn, *args):
+        stats = self.stats[name]
+        start_t = time.perf_counter()
+        try:
+            fn(*args)
+        except _Aborted:
+            pass
+        except Exception as e:
+            print(f"[Error] Stage {name} failed: {e}")
+            self._errors.append((name, e))
+            self._abort.set()
+        finally:
+            stats.wall_sec = time.perf_counter() - start_t
+
+    def run(self) -> Dict[str, Any]:
+        start_t = time.perf_counter()
+        pages_q = _Pipe(self.queue_size, self._abort)
+        blocks_q = _Pipe(self.queue_size, self._abort)
+        threads = [
+            threading.Thread(target=self._run_stage, name="pipeline-crawl", args=("crawl", self._crawl, pages_q)),
+            threading.Thread(target=self._run_stage, name="pipeline-process",
+                             args=("process", self._process, pages_q, blocks_q)),
+            threading.Thread(target=self._run_stage, name="pipeline-embed", args=("embed", self._embed, blocks_q)),
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if self._errors:
+            name, error = self._errors[0]
+            raise RuntimeError(f"Pipeline stage '{name}' failed") from error
+
+        blocks = [b for key in sorted(self.page_blocks) for b in self.page_blocks[key]]
+        if not blocks:
+            raise RuntimeError(f"No blocks produced from {self.raw_dir}; nothing to index.")
+
+        # Blocks file for build_index.py --update / retrieval_bench --blocks; rewritten only if it changed
+        process = self.stats["process"]
+        if process.items or set(self.pages) != set(self.state.get("pages", {})) or not self.prev_blocks:
+            os.makedirs(os.path.dirname(os.path.abspath(self.blocks_file)), exist_ok=True)
+            _write_json_atomic(self.blocks_file, blocks)
+            print(f"[Info] Saved {len(blocks)} blocks to {self.blocks_file}")
+
+        index_start = time.perf_counter()
+        if self.embedding_dim is None:
+            self._embedder_instance()
+        version = self._index(blocks)
+        self.stats["index"].wall_sec = time.perf_counter() - index_start
+        self._save_state(version)
+
+        return {
+            "index_version": version,
+            "pages": len(self.pages),
+            "blocks": len(blocks),
+            "model_load_sec": self.model_load_sec,
+            "total_wall_sec": time.perf_counter() - start_t,
+            "stages": {name: s.to_dict() for name, s in self.stats.items()},
+        }
+
+
+def print_report(result: Dict[str, Any]):
+    labels = {"crawl": ("fetched", "on disk"), "process": ("parsed", "reused"),
+              "embed": ("embedded", "reused"), "index": ("indexed", "carried")}
+    print("\n" + "=" * 30 + " PIPELINE REPORT " + "=" * 30)
+    print(f"{'stage':<10}{'done':>18}{'cached':>18}{'busy s':>10}{'starved s':>11}{'blocked s':>11}{'wall s':>10}")
+    for name, s in result["stages"].items():
+        done, cached = labels[name]
+        print(f"{name:<10}{s['items']:>9} {done:<8}{s['cached']:>9} {cached:<8}{s['busy_sec']:>10.2f}"
+              f"{s['starved_sec']:>11.2f}{s['blocked_sec']:>11.2f}{s['wall_sec']:>10.2f}"
+              + ("  (skipped)" if s["skipped"] else ""))
+    busy = sum(s["busy_sec"] for s in result["stages"].values())
+    print(f"Total wall {result['total_wall_sec']:.2f}s (sum of stage busy time {busy:.2f}s); "
+          f"embedding model load {result['model_load_sec']:.2f}s")
+    print(f"{result['pages']} pages, {result['blocks']} blocks, index version {result['index_version']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Non-interactive data rebuild: crawl -> process -> embed -> index as a streaming pipeline.")
+    parser.add_argument("--sources", default=str(DATA_DIR / "sources/urls.json"),
+                        help="Seed URL list (default: data/sources/urls.json)")
+    parser.add_argument("--raw-dir", default=str(DATA_DIR / "raw"), help="Crawler output (default: data/raw)")
+    parser.add_argument("--blocks", default=str(DATA_DIR / "processed/simple_rag_blocks.json"),
+                        help="Blocks file (default: data/processed/simple_rag_blocks.json)")
+    parser.add_argument("--crawl", choices=CRAWL_MODES, default="auto",
+                        help="auto: only sources without raw pages or older than pipeline.recrawl_after_hours")
+    parser.add_argument("--max-pages", type=int, default=MAX_PAGES_PER_SOURCE, help="Linked pages to fetch per source")
+    parser.add_argument("--delay", type=float, default=CRAWL_DELAY_SEC, help="Seconds to wait before each request")
+    parser.add_argument("--config", default=None, help="rag_config.yaml to use")
+    parser.add_argument("--force", action="store_true", help="Ignore caches: reprocess, re-embed and publish")
+    parser.add_argument("--keep-versions", type=int, default=3,
+                        help="Number of index versions to keep on disk after publishing")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    sources = load_sources(args.sources) if os.path.exists(args.sources) else []
+    pipeline = RebuildPipeline(sources, args.raw_dir, args.blocks, crawl=args.crawl, config_path=args.config,
+                               max_pages=args.max_pages, delay=args.delay, force=args.force,
+                               keep_versions=args.keep_versions)
+    # Stages run in threads, so cProfile would only see the waiting main thread
+    with profiled("rebuild", args, artifact_dir=DATA_DIR, service=True):
+        result = pipeline.run()
+    print_report(result)
+
+
+if __name__ == "__main__":
+    main()
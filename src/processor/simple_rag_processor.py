@@ -4,6 +4,7 @@ import os
 import sys
 import hashlib
 import glob
+import argparse
 from typing import List, Dict, Optional
 from bs4 import BeautifulSoup
 from byteplus_parser import extract_data, parse_delta_ops
@@ -12,6 +13,8 @@ from byteplus_parser import extract_data, parse_delta_ops
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(current_dir, ".."))
 from utils.paths import DATA_DIR
+from utils.dates import normalize_time
+from utils.profiling import add_profile_arguments, profiled
 
 # --- Configuration & Regex ---
 MONTHS = r"(?:January|February|March|April|May|June|July|August|September|October|November|December)"
@@ -79,10 +82,15 @@ def process_raw_file(file_path: str) -> List[Dict]:
     """Reads a raw JSON file, parses HTML, and splits into blocks."""
     with open(file_path, "r", encoding="utf-8") as f:
         raw_data = json.load(f)
-        
+    return process_raw_page(raw_data, file_path)
+
+def process_raw_page(raw_data: Dict, file_path: str) -> List[Dict]:
+    """Parses one already-loaded raw page (crawler JSON) into blocks."""
     html = raw_data.get("raw_content", "")
     url = raw_data.get("url", "")
     category = raw_data.get("category", "unknown")
+    # Older raw files lack source_name; the crawler stores them under data/raw/<source_name>/
+    source_name = raw_data.get("source_name") or os.path.basename(os.path.dirname(file_path))
     
     # 1. Parse HTML to Text using byteplus_parser logic
     data = extract_data(html)
@@ -237,6 +245,10 @@ def process_raw_file(file_path: str) -> List[Dict]:
     # 3. Enrich Blocks with IDs
     for block in blocks:
         block["block_id"] = generate_block_id(block["content"], url)
+        # ISO date (YYYY-MM-DD) for range filtering at search time
+        block["time_iso"] = normalize_time(block["time"])
+        # Index shard key (one shard per source in data/sources/urls.json)
+        block["source_name"] = source_name
         # Ensure source_meta field exists for backward compatibility or clarity if needed
         # But per requirements, we have flat fields now.
         # Let's add a nested source_meta just in case the embedder expects it (it does!)
@@ -247,17 +259,14 @@ def process_raw_file(file_path: str) -> List[Dict]:
         
     return blocks
 
-def main():
-    # Setup paths
-    raw_dir = DATA_DIR / "raw"
-    output_file = DATA_DIR / "processed/simple_rag_blocks.json"
-    
+def process_directory(raw_dir: str, output_file: str) -> List[Dict]:
+    """Processes every raw page under `raw_dir` and writes all blocks to `output_file`."""
     # Find all JSON files in raw subdirectories
     raw_files = glob.glob(os.path.join(raw_dir, "**/*.json"), recursive=True)
     
     if not raw_files:
         print(f"No raw files found in {raw_dir}. Please run crawler first.")
-        return
+        return []
         
     print(f"Found {len(raw_files)} raw files to process.")
     
@@ -271,12 +280,25 @@ def main():
             print(f"Error processing {file_path}: {e}")
             
     # Save output
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
     with open(output_file, "w", encoding="utf-8") as f:
         json.dump(all_blocks, f, ensure_ascii=False, indent=2)
         
     print(f"\nProcessing complete!")
     print(f"Generated {len(all_blocks)} structured blocks.")
     print(f"Output saved to: {output_file}")
+    return all_blocks
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse raw crawled pages into structured RAG blocks.")
+    parser.add_argument("--raw-dir", default=str(DATA_DIR / "raw"), help="Crawler output (default: data/raw)")
+    parser.add_argument("--output", default=str(DATA_DIR / "processed/simple_rag_blocks.json"),
+                        help="Blocks file (default: data/processed/simple_rag_blocks.json)")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    
+    with profiled("process", args, artifact_dir=os.path.dirname(os.path.abspath(args.output))):
+        all_blocks = process_directory(args.raw_dir, args.output)
     
     # Preview
     print("\n" + "="*30 + " BLOCK PREVIEW " + "="*30)
@@ -12,22 +12,18 @@ from retrieval.search_engine import SimpleRAGSearcher
 from generator.generate import RAGGenerator
 
 def main():
-    # 1. Setup Paths
-    DATA_DIR = os.path.join(current_dir, "../data")
-    index_path = os.path.join(DATA_DIR, "byteplus.index")
-    meta_path = os.path.join(DATA_DIR, "byteplus_meta.json")
-    
-    # 2. Initialize Modules
+    # 1. Initialize Modules
+    # (Index paths are resolved from the live version in data/index/CURRENT)
     print(">>> Initializing RAG System...")
     try:
-        searcher = SimpleRAGSearcher(index_path, meta_path)
+        searcher = SimpleRAGSearcher()
         generator = RAGGenerator() # Automatically finds config
         print(">>> Initialization Complete.")
     except Exception as e:
         print(f"Initialization failed: {e}")
         return
 
-    # 3. Test Queries
+    # 2. Test Queries
     test_queries = [
         "What happened in October 2025?",
         "Is there any announcement about monitoring plugin upgrade?",
@@ -35,7 +31,7 @@ def main():
         "什么是 ECS?",          # Pure Chinese
     ]
     
-    # 4. Run RAG Loop
+    # 3. Run RAG Loop
     print("\n" + "="*50)
     print("STARTING RAG END-TO-END TEST")
     print("="*50)
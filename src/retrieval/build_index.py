@@ -1,57 +1,308 @@
 import os
 import sys
 import json
+import time
+import argparse
 import faiss
 import numpy as np
+from typing import List, Dict, Iterable, Optional
 
 # Add src to path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(current_dir, ".."))
 
 from utils.paths import DATA_DIR
-from embedding.embedder import RAGEmbedder
+from embedding.embedder import RAGEmbedder, configured_model_name
+from retrieval import index_store
+from retrieval.lexical import BM25Index, lexical_dir
+from utils.metrics import span
+from utils.profiling import add_profile_arguments, profiled
 
-def main():
-    # Setup Paths
-    processed_file = DATA_DIR / "processed/simple_rag_blocks.json"
-    index_file = DATA_DIR / "byteplus.index"
-    meta_file = DATA_DIR / "byteplus_meta.json"
-    
-    # Load Blocks
-    print(f"Loading blocks from {processed_file.name}...")
-    with open(processed_file, "r", encoding="utf-8") as f:
+# Compact (renumber ids, drop tombstones) once this share of metadata slots is dead
+COMPACT_THRESHOLD = 0.2
+
+
+def _write_json_atomic(path: str, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def save_artifacts(index, blocks: List[Optional[Dict]], index_file: str, meta_file: str):
+    """
+    Writes index, metadata and the BM25 lexical index via temp files + rename
+    so none of them is ever half-written.
+    """
+    tmp_index = f"{index_file}.tmp"
+    with span("write_index"):
+        faiss.write_index(index, tmp_index)
+        os.replace(tmp_index, index_file)
+    with span("write_metadata"):
+        _write_json_atomic(meta_file, blocks)
+    with span("build_lexical"):
+        BM25Index.build(blocks, lexical_dir(index_file))
+
+
+def new_id_mapped_index(dimension: int):
+    """
+    Flat inner-product index wrapped in an id map.
+    FAISS ids are positions in the metadata list, which lets single vectors
+    be removed and added later without rebuilding.
+    """
+    # Use IndexFlatIP for Cosine Similarity (since vectors are normalized)
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+
+
+def load_id_mapped_index(index_file: str):
+    """Loads an index; legacy plain flat indexes are re-wrapped with identity ids."""
+    index = faiss.read_index(index_file)
+    if isinstance(index, faiss.IndexIDMap2):
+        return index
+    print("[Info] Converting legacy index to an id-mapped index...")
+    vectors = index.reconstruct_n(0, index.ntotal)
+    wrapped = new_id_mapped_index(index.d)
+    wrapped.add_with_ids(vectors, np.arange(index.ntotal, dtype=np.int64))
+    return wrapped
+
+
+def compact(index, blocks: List[Optional[Dict]]):
+    """Drops tombstoned metadata slots and renumbers ids to be contiguous again."""
+    live = [pos for pos, b in enumerate(blocks) if b is not None]
+    vectors = np.vstack([index.reconstruct(pos) for pos in live]) if live else np.empty((0, index.d), dtype=np.float32)
+    compacted = new_id_mapped_index(index.d)
+    if live:
+        compacted.add_with_ids(vectors, np.arange(len(live), dtype=np.int64))
+    return compacted, [blocks[pos] for pos in live]
+
+
+def update_index(
+    added: Iterable[Dict],
+    changed: Iterable[Dict],
+    removed_ids: Iterable[str],
+    index_file: str,
+    meta_file: str,
+    out_index_file: str = None,
+    out_meta_file: str = None,
+    compact_threshold: float = COMPACT_THRESHOLD,
+) -> Dict[str, int]:
+    """
+    Applies an incremental update to an existing index.
+    Results are written to `out_*_file` (default: in place), so a new
+    version can be produced without touching the live one.
+
+    Args:
+        added: New blocks (embedded and appended).
+        changed: Blocks whose block_id already exists. Metadata is replaced;
+                 the vector is only recomputed if the content differs.
+        removed_ids: block_ids to delete.
+
+    Removed slots are tombstoned (None) in the metadata list so that the
+    remaining ids stay valid; the list is compacted once the share of
+    tombstones exceeds `compact_threshold`.
+    """
+    index = load_id_mapped_index(index_file)
+    with open(meta_file, "r", encoding="utf-8") as f:
         blocks = json.load(f)
-    print(f"Loaded {len(blocks)} blocks.")
-    
+    id_to_pos = {b["block_id"]: pos for pos, b in enumerate(blocks) if b is not None}
+
+    added = list(added)
+    to_embed = []  # (position, block)
+    to_remove = []
+    stats = {"added": 0, "changed": 0, "removed": 0, "reembedded": 0}
+
+    for block_id in removed_ids:
+        pos = id_to_pos.pop(block_id, None)
+        if pos is None:
+            continue
+        to_remove.append(pos)
+        blocks[pos] = None
+        stats["removed"] += 1
+
+    for block in changed:
+        pos = id_to_pos.get(block["block_id"])
+        if pos is None:
+            # Unknown id: treat as an addition
+            added.append(block)
+            continue
+        if blocks[pos].get("content") != block.get("content"):
+            to_remove.append(pos)
+            to_embed.append((pos, block))
+            stats["reembedded"] += 1
+        blocks[pos] = block
+        stats["changed"] += 1
+
+    for block in added:
+        if block["block_id"] in id_to_pos:
+            continue
+        pos = len(blocks)
+        blocks.append(block)
+        id_to_pos[block["block_id"]] = pos
+        to_embed.append((pos, block))
+        stats["added"] += 1
+
+    if to_remove:
+        index.remove_ids(np.asarray(to_remove, dtype=np.int64))
+
+    if to_embed:
+        embedder = RAGEmbedder()
+        embeddings = embedder.encode([b["content"] for _, b in to_embed])
+        index.add_with_ids(embeddings, np.asarray([pos for pos, _ in to_embed], dtype=np.int64))
+
+    dead = sum(1 for b in blocks if b is None)
+    if blocks and dead / len(blocks) > compact_threshold:
+        print(f"[Info] Compacting index ({dead}/{len(blocks)} tombstones)...")
+        index, blocks = compact(index, blocks)
+        stats["compacted"] = 1
+
+    save_artifacts(index, blocks, out_index_file or index_file, out_meta_file or meta_file)
+    return stats
+
+
+def diff_blocks(old_blocks: List[Optional[Dict]], new_blocks: List[Dict]):
+    """Computes (added, changed, removed_ids) between stored metadata and a fresh processor output."""
+    old_by_id = {b["block_id"]: b for b in old_blocks if b is not None}
+    new_by_id = {b["block_id"]: b for b in new_blocks}
+    added = [b for bid, b in new_by_id.items() if bid not in old_by_id]
+    changed = [b for bid, b in new_by_id.items() if bid in old_by_id and old_by_id[bid] != b]
+    removed_ids = [bid for bid in old_by_id if bid not in new_by_id]
+    return added, changed, removed_ids
+
+
+def build_full(blocks: List[Dict], index_file: str, meta_file: str, embedder: Optional[RAGEmbedder] = None):
     # Initialize Embedder
-    embedder = RAGEmbedder() # Loads from rag_config.yaml
-    
+    embedder = embedder or RAGEmbedder() # Loads from rag_config.yaml
+
     # Generate Embeddings
     print("Generating embeddings...")
     contents = [b["content"] for b in blocks]
     # Note: SentenceTransformer handles batching automatically
     embeddings = embedder.encode(contents)
-    
+
     # Create FAISS Index
     dimension = embedder.embedding_dim
     print(f"Embedding dimension: {dimension}")
-    
-    # Use IndexFlatIP for Cosine Similarity (since vectors are normalized)
-    index = faiss.IndexFlatIP(dimension)
-    index.add(embeddings)
-    
+
+    index = new_id_mapped_index(dimension)
+    with span("add_vectors"):
+        index.add_with_ids(embeddings, np.arange(len(blocks), dtype=np.int64))
+
     print(f"Indexed {index.ntotal} vectors.")
-    
+
     # Save Index and Metadata
     print("Saving artifacts...")
-    faiss.write_index(index, str(index_file))
-    
     # Save metadata (same as blocks for now, but could be lighter)
-    with open(meta_file, "w", encoding="utf-8") as f:
-        json.dump(blocks, f, ensure_ascii=False, indent=2)
-        
-    print(f"\nIndex saved successfully to {index_file}")
-    print(f"Metadata saved successfully to {meta_file}")
+    save_artifacts(index, blocks, index_file, meta_file)
+
+
+def group_by_shard(blocks: List[Dict]) -> Dict[str, List[Dict]]:
+    """Splits blocks into one list per index shard (keyed by source_name)."""
+    shards: Dict[str, List[Dict]] = {}
+    for block in blocks:
+        shards.setdefault(block.get("source_name") or index_store.DEFAULT_SHARD, []).append(block)
+    return shards
+
+
+def build(args):
+    """
+    Builds (or with args.update, incrementally updates) a new index version and publishes it.
+    With args.no_publish the version is only built (and kept from gc), e.g. as a shadow candidate.
+    """
+    # Setup Paths
+    processed_file = args.blocks or DATA_DIR / "processed/simple_rag_blocks.json"
+    live_dir = index_store.current_version_dir()
+    live_shards = index_store.shard_paths(live_dir) if live_dir else {}
+    if index_store.DEFAULT_SHARD in live_shards and len(live_shards) == 1:
+        # Unsharded (pre-sharding) version: can't be updated per source
+        live_shards = {}
+
+    # Load Blocks
+    print(f"Loading blocks from {os.path.basename(str(processed_file))}...")
+    with open(processed_file, "r", encoding="utf-8") as f:
+        blocks = json.load(f)
+    print(f"Loaded {len(blocks)} blocks.")
+    new_shards = group_by_shard(blocks)
+    targets = set(args.shard) if args.shard else set(new_shards) | set(live_shards)
+
+    serving_model = configured_model_name()
+    model_name = args.model or serving_model
+    if live_dir is not None and (args.update or args.shard):
+        # Updated and carried-over shards keep the live vectors
+        index_store.check_model(live_dir, model_name)
+
+    # Every build goes to a fresh version directory; the live one is never modified
+    version_dir = index_store.new_version_dir()
+    index_store.write_model(version_dir, model_name)
+    embedder = RAGEmbedder(model_name=args.model) if args.model else None
+
+    for name in sorted(set(new_shards) | set(live_shards)):
+        shard_blocks = new_shards.get(name, [])
+        if name not in targets:
+            if name in live_shards:
+                index_store.link_shard(live_dir, version_dir, name)
+                print(f"[{name}] Unchanged, carried over from {live_dir.name}.")
+            continue
+        if not shard_blocks:
+            print(f"[{name}] No blocks left, dropping shard.")
+            continue
+
+        index_file, meta_file = index_store.artifact_paths(index_store.shard_dir(version_dir, name))
+        if args.update and name in live_shards:
+            start_t = time.time()
+            live_index, live_meta = live_shards[name]
+            with open(live_meta, "r", encoding="utf-8") as f:
+                old_blocks = json.load(f)
+            added, changed, removed_ids = diff_blocks(old_blocks, shard_blocks)
+            print(f"[{name}] Diff: {len(added)} added, {len(changed)} changed, {len(removed_ids)} removed.")
+            if not (added or changed or removed_ids):
+                index_store.link_shard(live_dir, version_dir, name)
+                continue
+            stats = update_index(added, changed, removed_ids, live_index, live_meta, index_file, meta_file)
+            print(f"[{name}] Index updated in {time.time() - start_t:.2f}s: {stats}")
+        else:
+            if args.update:
+                print(f"[{name}] No existing shard found, falling back to full build.")
+            print(f"[{name}] Building {len(shard_blocks)} blocks...")
+            build_full(shard_blocks, index_file, meta_file, embedder)
+
+    if args.no_publish:
+        index_store.keep(version_dir)
+        print(f"[Info] Built version {version_dir.name} without publishing it "
+              f"(compare it on live traffic with shadow.version: \"{version_dir.name}\").")
+        return
+    index_store.publish(version_dir, model_name=serving_model)
+    index_store.gc_versions(keep=args.keep_versions)
+
+    print(f"\nIndex version saved successfully to {version_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or incrementally update the FAISS index shards.")
+    parser.add_argument("--update", action="store_true",
+                        help="Apply only the added/changed/removed blocks instead of rebuilding")
+    parser.add_argument("--shard", action="append", default=None,
+                        help="Only rebuild/update this shard (source_name); repeatable. Other shards are carried over.")
+    parser.add_argument("--blocks", default=None,
+                        help="Processed blocks file (default: data/processed/simple_rag_blocks.json)")
+    parser.add_argument("--keep-versions", type=int, default=3,
+                        help="Number of index versions to keep on disk after publishing")
+    parser.add_argument("--model", default=None,
+                        help="Embedding model to build with (default: embedding.model_name), e.g. for a shadow candidate")
+    parser.add_argument("--no-publish", action="store_true",
+                        help="Build the version but leave CURRENT unchanged (kept from garbage collection)")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    if args.model and (args.update or args.shard):
+        # Carried-over or updated shards hold vectors of the live model
+        parser.error("--model needs a full build of all shards (no --update / --shard)")
+    if args.model and not args.no_publish and args.model != configured_model_name():
+        # Served queries are encoded with embedding.model_name
+        parser.error("--model other than embedding.model_name needs --no-publish (e.g. a shadow candidate); "
+                     "change embedding.model_name to publish it")
+
+    with profiled("build_index", args, artifact_dir=index_store.INDEX_ROOT):
+        build(args)
+
 
 if __name__ == "__main__":
     main()
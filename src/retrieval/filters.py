@@ -0,0 +1,102 @@
+import os
+import sys
+import numpy as np
+from datetime import date
+from typing import List, Dict, Any, Optional
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+
+from utils.dates import normalize_time
+
+# Block fields that support equality / membership filters
+FILTER_FIELDS = ("block_type", "subtype", "product", "source_name")
+
+
+class MetadataFilterIndex:
+    """
+    Inverted index over block metadata, used to resolve search filters to
+    candidate vector positions before the vector search runs.
+
+    - Categorical fields map each value to a sorted array of positions.
+    - Times are normalised to ISO dates and kept in a sorted array so that
+      range predicates are two binary searches.
+
+    Supported filter keys:
+        block_type / subtype / product / source_name: str or list of str
+        time_from / time_to: any date string understood by `normalize_time` (inclusive)
+    """
+
+    def __init__(self, blocks: List[Dict[str, Any]]):
+        self.size = len(blocks)
+        postings: Dict[str, Dict[str, List[int]]] = {f: {} for f in FILTER_FIELDS}
+        timed_pos, timed_ord = [], []
+
+        for pos, block in enumerate(blocks):
+            if block is None:
+                continue
+            for field in FILTER_FIELDS:
+                value = block.get(field)
+                if value is not None:
+                    postings[field].setdefault(value, []).append(pos)
+            iso = block.get("time_iso") or normalize_time(block.get("time"))
+            if iso:
+                timed_pos.append(pos)
+                timed_ord.append(date.fromisoformat(iso).toordinal())
+
+        self.postings = {
+            field: {value: np.asarray(ids, dtype=np.int64) for value, ids in values.items()}
+            for field, values in postings.items()
+        }
+
+        order = np.argsort(np.asarray(timed_ord, dtype=np.int64), kind="stable")
+        self.time_ords = np.asarray(timed_ord, dtype=np.int64)[order]
+        self.time_pos = np.asarray(timed_pos, dtype=np.int64)[order]
+
+    def values(self, field: str) -> List[str]:
+        """Distinct values seen for a filterable field (for UI pickers)."""
+        return sorted(self.postings.get(field, {}).keys())
+
+    def _time_range(self, time_from: Optional[str], time_to: Optional[str]) -> np.ndarray:
+        lo, hi = 0, len(self.time_ords)
+        if time_from:
+            iso = normalize_time(time_from)
+            if iso is None:
+                raise ValueError(f"Unrecognised time_from filter: {time_from!r}")
+            lo = int(np.searchsorted(self.time_ords, date.fromisoformat(iso).toordinal(), side="left"))
+        if time_to:
+            iso = normalize_time(time_to, end=True)
+            if iso is None:
+                raise ValueError(f"Unrecognised time_to filter: {time_to!r}")
+            hi = int(np.searchsorted(self.time_ords, date.fromisoformat(iso).toordinal(), side="right"))
+        if hi <= lo:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(self.time_pos[lo:hi])
+
+    def candidates(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        Resolves filters to a sorted array of matching positions.
+        Returns None when no filter is active (i.e. search the whole index).
+        """
+        if not filters:
+            return None
+
+        selected: Optional[np.ndarray] = None
+
+        def narrow(ids: np.ndarray):
+            nonlocal selected
+            selected = ids if selected is None else np.intersect1d(selected, ids, assume_unique=True)
+
+        for field in FILTER_FIELDS:
+            wanted = filters.get(field)
+            if not wanted:
+                continue
+            if isinstance(wanted, str):
+                wanted = [wanted]
+            parts = [self.postings[field][v] for v in wanted if v in self.postings[field]]
+            narrow(np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64))
+
+        if filters.get("time_from") or filters.get("time_to"):
+            narrow(self._time_range(filters.get("time_from"), filters.get("time_to")))
+
+        return selected
@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import threading
+from typing import Optional
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+
+from retrieval import index_store
+from retrieval.search_engine import SimpleRAGSearcher
+
+
+class HotReloadingSearcher:
+    """
+    Keeps a live SimpleRAGSearcher and swaps in newly published index versions.
+
+    A daemon thread polls data/index/CURRENT. When it points at a new version,
+    the new searcher is fully loaded in the background and then swapped in with
+    a single reference assignment. Callers grab `.current` once per request, so
+    in-flight requests finish on the version they started with. The replaced
+    searcher's threads are shut down; the embedder and reranker models are
+    shared and stay loaded.
+    """
+
+    def __init__(self, poll_interval: float = 10.0):
+        self.poll_interval = poll_interval
+        self._searcher = SimpleRAGSearcher()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def current(self) -> SimpleRAGSearcher:
+        return self._searcher
+
+    @property
+    def version(self) -> str:
+        return self._searcher.version
+
+    def check_for_update(self) -> bool:
+        """Loads and swaps in the published version if it changed. Returns True on swap."""
+        shard_paths, version = index_store.current_shard_paths()
+        if version == self._searcher.version:
+            return False
+        print(f"[HotReload] New index version {version} detected, loading...")
+        start_t = time.time()
+        try:
+            searcher = SimpleRAGSearcher(version=version, shard_paths=shard_paths)
+        except Exception as e:
+            # Keep serving the old version; retry on the next poll
+            self.last_error = f"Failed to load version {version}: {e}"
+            print(f"[HotReload] {self.last_error}")
+            return False
+        previous, self._searcher = self._searcher, searcher
+        previous.close()
+        self.last_error = None
+        print(f"[HotReload] Swapped to version {version} in {time.time() - start_t:.2f}s")
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            self.check_for_update()
+
+    def start(self) -> "HotReloadingSearcher":
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="index-hot-reload", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,185 @@
+import os
+import sys
+import shutil
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+
+from utils.paths import DATA_DIR
+
+# Layout:
+#   data/index/versions/<version>/shards/<source_name>/byteplus.index
+#   data/index/versions/<version>/shards/<source_name>/byteplus_meta.json
+#   data/index/versions/<version>/shards/<source_name>/byteplus_lexical/   (BM25 postings)
+#   data/index/versions/<version>/MODEL                                    (embedding model of the vectors)
+#   data/index/versions/<version>/KEEP                                     (optional, never garbage-collected)
+#   data/index/CURRENT            -> text file holding the live <version>
+# Versions built before sharding keep a single byteplus.index at the version root.
+INDEX_ROOT = DATA_DIR / "index"
+VERSIONS_DIR = INDEX_ROOT / "versions"
+CURRENT_FILE = INDEX_ROOT / "CURRENT"
+
+INDEX_FILENAME = "byteplus.index"
+META_FILENAME = "byteplus_meta.json"
+LEXICAL_DIRNAME = "byteplus_lexical"
+SHARDS_DIRNAME = "shards"
+# Shard name for blocks without a source_name and for unsharded indexes
+DEFAULT_SHARD = "default"
+# Marker file of versions gc_versions must keep (unpublished builds, e.g. shadow candidates)
+KEEP_FILENAME = "KEEP"
+# Embedding model the version's vectors were built with; only queries encoded by it may search them
+MODEL_FILENAME = "MODEL"
+
+# Pre-versioning artifacts, still used when no version has been published
+LEGACY_INDEX = DATA_DIR / INDEX_FILENAME
+LEGACY_META = DATA_DIR / META_FILENAME
+LEGACY_VERSION = "legacy"
+
+
+def new_version_dir() -> Path:
+    """Creates an empty, uniquely named version directory (not yet live)."""
+    version = datetime.now().strftime("%Y%m%d-%H%M%S-%f") + "-" + uuid.uuid4().hex[:4]
+    path = VERSIONS_DIR / version
+    path.mkdir(parents=True, exist_ok=False)
+    return path
+
+
+def artifact_paths(version_dir: Path) -> Tuple[str, str]:
+    """Paths of an unsharded index at the version root."""
+    return str(version_dir / INDEX_FILENAME), str(version_dir / META_FILENAME)
+
+
+def shard_dir(version_dir: Path, name: str) -> Path:
+    path = version_dir / SHARDS_DIRNAME / name
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def shard_paths(version_dir: Path) -> Dict[str, Tuple[str, str]]:
+    """Returns {shard_name: (index_path, meta_path)} for a version directory."""
+    shards_root = version_dir / SHARDS_DIRNAME
+    if shards_root.is_dir():
+        return {
+            p.name: (str(p / INDEX_FILENAME), str(p / META_FILENAME))
+            for p in sorted(shards_root.iterdir()) if p.is_dir()
+        }
+    index_path, meta_path = artifact_paths(version_dir)
+    if os.path.exists(index_path):
+        return {DEFAULT_SHARD: (index_path, meta_path)}
+    return {}
+
+
+def link_shard(src_version_dir: Path, dst_version_dir: Path, name: str):
+    """
+    Carries an unchanged shard over to a new version.
+    Hard links avoid copying; artifacts are never modified in place, so sharing inodes is safe.
+    """
+    src_index, src_meta = shard_paths(src_version_dir)[name]
+    dst = shard_dir(dst_version_dir, name)
+    sources = [(src, dst / os.path.basename(src)) for src in (src_index, src_meta)]
+    lexical_src = Path(src_index).parent / LEXICAL_DIRNAME
+    if lexical_src.is_dir():
+        (dst / LEXICAL_DIRNAME).mkdir(exist_ok=True)
+        sources += [(str(p), dst / LEXICAL_DIRNAME / p.name) for p in lexical_src.iterdir()]
+    for src, target in sources:
+        try:
+            os.link(src, target)
+        except OSError:
+            shutil.copy2(src, target)
+
+
+def write_model(version_dir: Path, model_name: str):
+    (version_dir / MODEL_FILENAME).write_text(model_name, encoding="utf-8")
+
+
+def version_model(version_dir: Path) -> Optional[str]:
+    """Embedding model recorded for a version; None for versions built before it was recorded."""
+    try:
+        return (version_dir / MODEL_FILENAME).read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def check_model(version_dir: Path, model_name: str):
+    """Raises ValueError if `version_dir` was built with another embedding model than `model_name`."""
+    recorded = version_model(version_dir)
+    if recorded is not None and recorded != model_name:
+        raise ValueError(f"Index version {version_dir.name} was built with {recorded}, not {model_name}")
+
+
+def publish(version_dir: Path, model_name: Optional[str] = None):
+    """
+    Atomically points CURRENT at `version_dir`.
+    Readers either see the old or the new version, never a mix of files.
+    With `model_name` (the serving embedding model) a version built with another model is refused.
+    """
+    shards = shard_paths(version_dir)
+    if not shards or not all(os.path.exists(i) and os.path.exists(m) for i, m in shards.values()):
+        raise FileNotFoundError(f"Refusing to publish incomplete version at {version_dir}")
+    if model_name is not None:
+        check_model(version_dir, model_name)
+    tmp_path = CURRENT_FILE.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version_dir.name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, CURRENT_FILE)
+    print(f"[Info] Published index version {version_dir.name} ({len(shards)} shard(s))")
+
+
+def keep(version_dir: Path):
+    """Excludes a version from gc_versions (delete the KEEP file or the directory to release it)."""
+    (version_dir / KEEP_FILENAME).touch()
+
+
+def current_version() -> Optional[str]:
+    try:
+        with open(CURRENT_FILE, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def current_version_dir() -> Optional[Path]:
+    version = current_version()
+    return VERSIONS_DIR / version if version else None
+
+
+def current_shard_paths() -> Tuple[Dict[str, Tuple[str, str]], str]:
+    """Returns ({shard_name: (index_path, meta_path)}, version) of the live index."""
+    version_dir = current_version_dir()
+    if version_dir is not None:
+        return shard_paths(version_dir), version_dir.name
+    if LEGACY_INDEX.exists():
+        return {DEFAULT_SHARD: (str(LEGACY_INDEX), str(LEGACY_META))}, LEGACY_VERSION
+    return {}, LEGACY_VERSION
+
+
+def list_versions() -> List[str]:
+    if not VERSIONS_DIR.exists():
+        return []
+    # Version names start with a timestamp, so lexical order is age order
+    return sorted(p.name for p in VERSIONS_DIR.iterdir() if p.is_dir())
+
+
+def gc_versions(keep: int = 3) -> List[str]:
+    """
+    Deletes all but the `keep` newest versions. The live version and versions
+    marked with a KEEP file are never removed.
+    Running services hold their index in memory, so deleting files they loaded from is safe.
+    """
+    live = current_version()
+    versions = list_versions()
+    removed = []
+    for version in versions[:-keep] if keep > 0 else versions:
+        if version == live or (VERSIONS_DIR / version / KEEP_FILENAME).exists():
+            continue
+        shutil.rmtree(VERSIONS_DIR / version, ignore_errors=True)
+        removed.append(version)
+    if removed:
+        print(f"[Info] Removed {len(removed)} old index versions.")
+    return removed
@@ -0,0 +1,161 @@
+import os
+import re
+import sys
+import json
+import shutil
+import numpy as np
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+
+from retrieval.index_store import LEXICAL_DIRNAME
+
+_TOKEN = re.compile(r"[A-Za-z0-9]+(?:[._\-:][A-Za-z0-9]+)*")
+_CJK = re.compile(r"[㐀-鿿豈-﫿]+")
+_SEPARATORS = re.compile(r"[._\-:]")
+# Characters an identifier lookup may consist of (ASCII only: CJK letters are alphabetic too)
+_IDENTIFIER = re.compile(r"[A-Za-z0-9._:/\-]+")
+
+VOCAB_FILE = "vocab.json"
+ARRAY_FILES = ("offsets", "doc_ids", "weights", "idf")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased terms for BM25.
+    Identifiers are kept whole (`modifyinstancespec`, `ecs.g3i.large`,
+    `invalidparameter.notfound`) and additionally split on `.`, `_`, `-`, `:`
+    so their parts match too. CJK runs become character bigrams.
+    """
+    if not text:
+        return []
+    terms = []
+    for match in _TOKEN.findall(text):
+        term = match.lower()
+        terms.append(term)
+        if _SEPARATORS.search(term):
+            terms.extend(p for p in _SEPARATORS.split(term) if p)
+    for run in _CJK.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def _looks_like_identifier(token: str) -> bool:
+    if not _IDENTIFIER.fullmatch(token):
+        return False
+    has_alpha = any(c.isalpha() for c in token)
+    return has_alpha and bool(
+        re.search(r"[a-z][A-Z]", token)           # CamelCase API names: ModifyInstanceSpec
+        or re.search(r"[._:/\-]", token)          # ecs.g3i.large, InvalidParameter.NotFound
+        or any(c.isdigit() for c in token)        # g3i, c3a
+        or (token.isupper() and len(token) >= 3)  # QUOTA_EXCEEDED, VPC
+    )
+
+
+def is_lexical_query(query: str, max_terms: int = 3) -> bool:
+    """
+    True for short queries made only of ASCII identifiers, which the embedder matches poorly.
+    Questions (ending in "?") and anything containing CJK go through the embedder (and rewriting).
+    """
+    if _CJK.search(query) or query.rstrip().endswith(("?", "？")):
+        return False
+    tokens = [t.strip("`'\"?,;()") for t in query.split()]
+    tokens = [t for t in tokens if t]
+    return 0 < len(tokens) <= max_terms and all(_looks_like_identifier(t) for t in tokens)
+
+
+def lexical_dir(index_path: str) -> str:
+    """Directory of the BM25 index stored next to a FAISS index file."""
+    return os.path.join(os.path.dirname(str(index_path)), LEXICAL_DIRNAME)
+
+
+class BM25Index:
+    """
+    BM25 inverted index over block contents, addressed by metadata position
+    (the same ids as the FAISS index).
+
+    Stored as CSR postings in .npy files that are memory-mapped on load:
+        offsets[t]:offsets[t+1]  -> slice of doc_ids / weights for term t
+        weights                  -> precomputed tf saturation incl. length norm,
+                                    so a query is a sum of idf[t] * weights
+    The term -> id mapping lives in vocab.json.
+    """
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, VOCAB_FILE), "r", encoding="utf-8") as f:
+            vocab = json.load(f)
+        self.size = vocab["size"]
+        self.terms = {t: i for i, t in enumerate(vocab["terms"])}
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in ARRAY_FILES}
+        self.offsets = arrays["offsets"]
+        self.doc_ids = arrays["doc_ids"]
+        self.weights = arrays["weights"]
+        self.idf = arrays["idf"]
+
+    @staticmethod
+    def build(blocks: List[Optional[Dict[str, Any]]], directory: str, k1: float = 1.2, b: float = 0.75):
+        """Builds the index for `blocks` (None tombstones are skipped) and writes it to `directory`."""
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        doc_len = np.zeros(len(blocks), dtype=np.float32)
+        for pos, block in enumerate(blocks):
+            if block is None:
+                continue
+            title = (block.get("source_meta") or {}).get("title", "")
+            counts = Counter(tokenize(f"{title}\n{block.get('content', '')}"))
+            doc_len[pos] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((pos, tf))
+
+        live = sum(1 for b_ in blocks if b_ is not None)
+        avgdl = float(doc_len.sum() / live) if live else 1.0
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            offsets[i + 1] = offsets[i] + len(postings[term])
+        doc_ids = np.empty(offsets[-1], dtype=np.int32)
+        tfs = np.empty(offsets[-1], dtype=np.float32)
+        idf = np.empty(len(terms), dtype=np.float32)
+        for i, term in enumerate(terms):
+            plist = postings[term]
+            doc_ids[offsets[i]:offsets[i + 1]] = [p for p, _ in plist]
+            tfs[offsets[i]:offsets[i + 1]] = [tf for _, tf in plist]
+            df = len(plist)
+            idf[i] = np.log(1.0 + (live - df + 0.5) / (df + 0.5))
+        norm = k1 * (1.0 - b + b * doc_len[doc_ids] / avgdl) if len(doc_ids) else np.empty(0, dtype=np.float32)
+        weights = (tfs * (k1 + 1.0) / (tfs + norm)).astype(np.float32)
+
+        # Write to a sibling temp dir and swap it in, so readers never see a partial index
+        tmp_dir = f"{directory}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name, array in zip(ARRAY_FILES, (offsets, doc_ids, weights, idf)):
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+        with open(os.path.join(tmp_dir, VOCAB_FILE), "w", encoding="utf-8") as f:
+            json.dump({"size": len(blocks), "k1": k1, "b": b, "avgdl": avgdl, "terms": terms}, f, ensure_ascii=False)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp_dir, directory)
+        print(f"[Info] Lexical index: {len(terms)} terms, {len(doc_ids)} postings.")
+
+    def search(self, query: str, top_k: int, candidates: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (scores, positions) of the best `top_k` blocks containing any query term."""
+        term_ids = {self.terms[t] for t in tokenize(query) if t in self.terms}
+        if not term_ids or top_k <= 0:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+
+        scores = np.zeros(self.size, dtype=np.float32)
+        for t in term_ids:
+            start, end = self.offsets[t], self.offsets[t + 1]
+            # doc_ids are unique within one postings list, so fancy-index += is safe
+            scores[self.doc_ids[start:end]] += self.idf[t] * self.weights[start:end]
+
+        positions = candidates if candidates is not None else np.arange(self.size, dtype=np.int64)
+        positions = positions[scores[positions] > 0]
+        if len(positions) > top_k:
+            top = np.argpartition(-scores[positions], top_k - 1)[:top_k]
+            positions = positions[top]
+        positions = positions[np.argsort(-scores[positions], kind="stable")]
+        return scores[positions], positions.astype(np.int64)
@@ -0,0 +1,43 @@
+import numpy as np
+from typing import List
+
+
+def mmr_select(query_vector: np.ndarray, vectors: np.ndarray, k: int, lambda_mult: float = 0.7,
+               relevance: np.ndarray = None) -> List[int]:
+    """
+    Maximal Marginal Relevance over a candidate set.
+
+    Picks `k` rows of `vectors` (n, d), each maximising
+        lambda_mult * sim(query, c) - (1 - lambda_mult) * max(sim(c, already selected))
+    so near-duplicates of an already chosen candidate are pushed down.
+    lambda_mult = 1.0 is plain relevance order; lower values favour diversity.
+
+    Vectors must be L2-normalised (dot product = cosine). Each selection step is one
+    matrix-vector product against the newly selected vector plus a vectorised O(n)
+    update, i.e. O(k * n * d) overall instead of the full n x n similarity matrix.
+
+    Returns the selected row indices, in selection order.
+    """
+    n = len(vectors)
+    k = min(k, n)
+    if k <= 0:
+        return []
+    if relevance is None:
+        relevance = vectors @ np.asarray(query_vector, dtype=np.float32).reshape(-1)
+    relevance = np.asarray(relevance, dtype=np.float32)
+
+    first = int(np.argmax(relevance))
+    selected = [first]
+    # Highest similarity of each candidate to anything selected so far
+    max_sim = vectors @ vectors[first]
+    taken = np.zeros(n, dtype=bool)
+    taken[first] = True
+
+    for _ in range(k - 1):
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * max_sim
+        scores[taken] = -np.inf
+        nxt = int(np.argmax(scores))
+        selected.append(nxt)
+        taken[nxt] = True
+        np.maximum(max_sim, vectors @ vectors[nxt], out=max_sim)
+    return selected
@@ -1,35 +1,27 @@
-import json
-import faiss
-import numpy as np
-from sentence_transformers import SentenceTransformer
 import sys
 import os
+import argparse
 
-def load_blocks(filename):
-    with open(filename, "r", encoding="utf-8") as f:
-        return json.load(f)
+# Add src to path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+
+from retrieval.search_engine import SimpleRAGSearcher
+from utils.profiling import add_profile_arguments, profiled
 
 def main():
-    # Use robust path handling
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    DATA_DIR = os.path.join(current_dir, "../../data")
-    
-    index_file = os.path.join(DATA_DIR, "byteplus.index")
-    meta_file = os.path.join(DATA_DIR, "byteplus_meta.json")
-    
-    if not os.path.exists(index_file) or not os.path.exists(meta_file):
-        print("Error: Index or Metadata not found. Please run build_index.py first.")
-        return
+    parser = argparse.ArgumentParser(description="Run test queries against the live index.")
+    parser.add_argument("queries", nargs="*", help="Queries to run (default: the built-in test queries)")
+    parser.add_argument("--top-k", type=int, default=3)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
 
-    print("Loading model (all-MiniLM-L6-v2)...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    
-    print("Loading index and metadata...")
-    index = faiss.read_index(index_file)
-    blocks = load_blocks(meta_file)
-    
-    print(f"Index loaded with {index.ntotal} vectors.")
-    print(f"Metadata loaded with {len(blocks)} blocks.")
+    # Loads all shards of the live index version with the configured embedder
+    try:
+        searcher = SimpleRAGSearcher()
+    except FileNotFoundError as e:
+        print(f"Error: {e}. Please run build_index.py first.")
+        return
     
     print("\n" + "="*30 + " QUERY TEST " + "="*30)
     
@@ -43,31 +35,24 @@ def main():
         "What is TOS in Byteplus?",
         "Is AWS a competitor of GCP?",
     ]
+    if args.queries:
+        test_queries = args.queries
     
-    for query in test_queries:
-        print(f"\nQuery: {query}")
-        
-        # Embed query
-        query_vector = model.encode([query])
-        
-        # Search index
-        k = 3
-        D, I = index.search(query_vector, k)
-        
-        for i in range(k):
-            idx = I[0][i]
-            score = D[0][i]
-            
-            if idx < 0 or idx >= len(blocks):
-                continue
-                
-            block = blocks[idx]
-            title = block['source_meta']['title']
-            time_val = block.get('time', 'N/A')
-            
-            print(f"  [{i+1}] Score: {score:.4f} | Title: {title} | Time: {time_val}")
-            preview = block['content'][:100].replace('\n', ' ')
-            print(f"      Preview: {preview}...")
+    # Profiles the searches only, not the model/index loading above
+    with profiled("search", args):
+        for query in test_queries:
+            print(f"\nQuery: {query}")
+
+            # Search index
+            results = searcher.search(query, top_k=args.top_k)
+
+            for i, res in enumerate(results):
+                title = res.source_meta.get('title', 'Unknown')
+                time_val = res.get('time') or 'N/A'
+
+                print(f"  [{i+1}] Score: {res.score:.4f} | Title: {title} | Time: {time_val} | Shard: {res.shard}")
+                preview = res.content[:100].replace('\n', ' ')
+                print(f"      Preview: {preview}...")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,161 @@
+import time
+import threading
+import numpy as np
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Optional, Tuple
+
+
+class CrossEncoderReranker:
+    """
+    Second-stage reranker: scores (query, block) pairs with a small cross-encoder.
+
+    - Pairs are scored in batches of `batch_size` on a worker thread.
+    - Each query has a hard `time_budget_ms`. If scoring isn't finished in time the
+      caller gets the first-stage order back; the worker stops after its current
+      batch, and whatever it scored still lands in the cache. Work still queued
+      when its deadline passes is dropped unscored, so a slow query doesn't eat
+      into the budget of the ones behind it.
+    - Scores are cached per (query, block_id), LRU-bounded by `cache_size`,
+      so repeated and refined questions only score new candidates.
+    - `from_config` shares one instance per settings, so reloaded searchers
+      reuse the loaded model and worker thread.
+    """
+    _instances: Dict[Tuple, "CrossEncoderReranker"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size: int = 16,
+                 time_budget_ms: float = 300, cache_size: int = 4096, max_length: int = 512, workers: int = 1):
+        from sentence_transformers import CrossEncoder
+
+        print(f"[Reranker] Loading model: {model_name}...")
+        self.model = CrossEncoder(model_name, max_length=max_length)
+        self.batch_size = batch_size
+        self.time_budget_ms = time_budget_ms
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rerank")
+        self._latencies_ms = deque(maxlen=1000)
+        self._stats = {"queries": 0, "fallbacks": 0, "pairs_scored": 0, "cache_hits": 0, "dropped": 0}
+
+    @classmethod
+    def from_config(cls, config: Dict, shared: bool = True) -> Optional["CrossEncoderReranker"]:
+        """
+        Builds the reranker from the `rerank` config section; None if disabled or unavailable.
+        With `shared` (default) equal settings return the same process-wide instance.
+        """
+        conf = config.get("rerank", {})
+        if not conf.get("enabled"):
+            return None
+        kwargs = dict(
+            model_name=conf.get("model_name", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+            batch_size=conf.get("batch_size", 16),
+            time_budget_ms=conf.get("time_budget_ms", 300),
+            cache_size=conf.get("cache_size", 4096),
+            max_length=conf.get("max_length", 512),
+            workers=conf.get("workers", 1),
+        )
+        key = tuple(sorted(kwargs.items()))
+        with cls._instances_lock:
+            if shared and key in cls._instances:
+                return cls._instances[key]
+            try:
+                reranker = cls(**kwargs)
+            except Exception as e:
+                print(f"[Warning] Reranker disabled, model could not be loaded: {e}")
+                return None
+            if shared:
+                cls._instances[key] = reranker
+            return reranker
+
+    @staticmethod
+    def _passage(result) -> str:
+        title = result.source_meta.get("title", "")
+        return f"{title}\n{result.content}" if title else result.content
+
+    def _cache_get(self, query: str, block_id: str) -> Optional[float]:
+        key = (query, block_id)
+        with self._lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _cache_put(self, query: str, block_ids: List[str], scores: np.ndarray):
+        with self._lock:
+            for block_id, score in zip(block_ids, scores):
+                self._cache[(query, block_id)] = float(score)
+                self._cache.move_to_end((query, block_id))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _score_batches(self, query: str, pending: List[Tuple[int, Any]], scores: Dict[int, float],
+                       cancelled: threading.Event, deadline: float):
+        for start in range(0, len(pending), self.batch_size):
+            if cancelled.is_set() or time.perf_counter() >= deadline:
+                if start == 0:
+                    with self._lock:
+                        self._stats["dropped"] += 1
+                return
+            batch = pending[start:start + self.batch_size]
+            batch_scores = self.model.predict([(query, self._passage(r)) for _, r in batch],
+                                              batch_size=self.batch_size, show_progress_bar=False)
+            self._cache_put(query, [r.block_id for _, r in batch], batch_scores)
+            for (i, _), score in zip(batch, batch_scores):
+                scores[i] = float(score)
+            with self._lock:
+                self._stats["pairs_scored"] += len(batch)
+
+    def rerank(self, query: str, candidates: List[Any], top_k: int) -> Tuple[List[Any], Optional[np.ndarray]]:
+        """
+        Reorders `candidates` (SearchResults in first-stage order) by cross-encoder score.
+        Returns (results, scores) for the best `top_k`; on budget overrun returns
+        (first-stage top_k, None).
+        """
+        start_t = time.perf_counter()
+        query = query.strip()
+        scores: Dict[int, float] = {}
+        pending = []
+        for i, r in enumerate(candidates):
+            cached = self._cache_get(query, r.block_id)
+            if cached is None:
+                pending.append((i, r))
+            else:
+                scores[i] = cached
+        with self._lock:
+            self._stats["queries"] += 1
+            self._stats["cache_hits"] += len(candidates) - len(pending)
+
+        if pending:
+            cancelled = threading.Event()
+            deadline = start_t + self.time_budget_ms / 1000
+            future = self._pool.submit(self._score_batches, query, pending, scores, cancelled, deadline)
+            try:
+                future.result(timeout=max(0.0, deadline - time.perf_counter()))
+            except Exception as e:
+                cancelled.set()
+                if future.cancel():
+                    with self._lock:
+                        self._stats["dropped"] += 1
+                if not isinstance(e, FutureTimeoutError):
+                    print(f"[Reranker] Scoring failed, keeping first-stage order: {e}")
+                with self._lock:
+                    self._stats["fallbacks"] += 1
+                    self._latencies_ms.append((time.perf_counter() - start_t) * 1000)
+                return candidates[:top_k], None
+
+        order = sorted(range(len(candidates)), key=lambda i: -scores[i])[:top_k]
+        with self._lock:
+            self._latencies_ms.append((time.perf_counter() - start_t) * 1000)
+        return [candidates[i] for i in order], np.array([scores[i] for i in order], dtype=np.float32)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies_ms)
+            return {
+                **self._stats,
+                "cache_size": len(self._cache),
+                "latency_p50_ms": latencies[len(latencies) // 2] if latencies else 0.0,
+                "latency_p95_ms": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else 0.0,
+            }
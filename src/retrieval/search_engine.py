@@ -2,62 +2,554 @@ import faiss
 import json
 import os
 import sys
+import time
+import heapq
 import numpy as np
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Iterable
 
 # Add src to path if not already (for relative imports from different contexts)
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(current_dir, ".."))
 
-from utils.paths import DATA_DIR
 from embedding.embedder import RAGEmbedder
+from retrieval.filters import MetadataFilterIndex
+from retrieval.mmr import mmr_select
+from retrieval.lexical import BM25Index, is_lexical_query, lexical_dir
+from retrieval.reranker import CrossEncoderReranker
+from retrieval import index_store
+from retrieval.shadow import get_shadow
+from utils.metrics import REGISTRY, span
 
-class SimpleRAGSearcher:
-    def __init__(self, index_path: str = None, meta_path: str = None):
-        """
-        Initializes the searcher with FAISS index and metadata.
-        Uses RAGEmbedder for query encoding.
-        """
-        if index_path is None:
-            index_path = str(DATA_DIR / "byteplus.index")
-        if meta_path is None:
-            meta_path = str(DATA_DIR / "byteplus_meta.json")
+class SearchResult:
+    """
+    Compact handle for a single search hit.
+    Holds the block id, score and a reference into the searcher's block list;
+    content and metadata are only read from the shared block when accessed.
+    Supports dict-style access (`res["content"]`, `res.get("source_meta")`)
+    so existing consumers such as `build_rag_prompt` work unchanged.
+    """
+    __slots__ = ("block_id", "score", "shard", "_blocks", "_idx")
+
+    def __init__(self, block_id: str, score: float, blocks: List[Dict], idx: int, shard: str = None):
+        self.block_id = block_id
+        self.score = score
+        self.shard = shard
+        self._blocks = blocks
+        self._idx = idx
+
+    @property
+    def block(self) -> Dict[str, Any]:
+        return self._blocks[self._idx]
+
+    @property
+    def content(self) -> str:
+        return self.block.get("content", "")
+
+    @property
+    def source_meta(self) -> Dict[str, Any]:
+        return self.block.get("source_meta", {})
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key == "score":
+            return self.score
+        if key == "block_id":
+            return self.block_id
+        return self.block.get(key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "score":
+            return self.score
+        return self.block[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key == "score" or key in self.block
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Materialises a full copy of the block with the 'score' field added."""
+        block = self.block.copy()
+        block["score"] = self.score
+        return block
+
+    def __repr__(self) -> str:
+        return f"SearchResult(block_id={self.block_id!r}, score={self.score:.4f})"
 
+
+class IndexShard:
+    """
+    One FAISS index plus its metadata list (one per `source_name`).
+    FAISS ids are positions in `blocks`; removed blocks are tombstoned as None
+    by incremental updates (see build_index.update_index).
+    """
+
+    def __init__(self, name: str, index_path: str, meta_path: str):
         if not os.path.exists(index_path) or not os.path.exists(meta_path):
             raise FileNotFoundError(f"Index or Metadata not found at {index_path} / {meta_path}")
-            
-        print("Loading embedder...")
-        self.embedder = RAGEmbedder() # Loads from config
-        
-        print("Loading index and metadata...")
-        self.index = faiss.read_index(index_path)
-        self.blocks = self._load_blocks(meta_path)
-        
-        print(f"Searcher ready. Index: {self.index.ntotal} vectors.")
+        self.name = name
+        with span("load_index"):
+            self.index = faiss.read_index(index_path)
+        with span("load_metadata"):
+            self.blocks = self._load_blocks(meta_path)
+        with span("build_lookups"):
+            self._id_to_pos = {b.get("block_id"): i for i, b in enumerate(self.blocks) if b is not None}
+            self.filter_index = MetadataFilterIndex(self.blocks)
+            self._pos_to_row = self._build_row_map()
+        # BM25 index built alongside the FAISS index (absent for older builds)
+        lex_dir = lexical_dir(index_path)
+        with span("load_lexical"):
+            self.lexical = BM25Index(lex_dir) if os.path.isdir(lex_dir) else None
 
     def _load_blocks(self, filename):
         with open(filename, "r", encoding="utf-8") as f:
             return json.load(f)
 
-    def search(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
+    def get_block(self, block_id: str) -> Optional[Dict[str, Any]]:
+        pos = self._id_to_pos.get(block_id)
+        if pos is None:
+            return None
+        return self.blocks[pos]
+
+    def _build_row_map(self) -> Optional[np.ndarray]:
         """
-        Searches the index for the given query.
-        Returns a list of block dictionaries with an added 'score' field.
+        For id-mapped indexes, maps metadata position (FAISS id) -> storage row.
+        Returns None when ids and rows coincide (plain flat index).
         """
-        # Use centralized embedder
-        query_vector = self.embedder.encode(query)
-        D, I = self.index.search(query_vector, top_k)
-        
+        index = faiss.downcast_index(self.index)
+        if not isinstance(index, faiss.IndexIDMap):
+            return None
+        ids = faiss.vector_to_array(index.id_map)
+        pos_to_row = np.full(len(self.blocks), -1, dtype=np.int64)
+        pos_to_row[ids] = np.arange(len(ids), dtype=np.int64)
+        return pos_to_row
+
+    def _flat_vectors(self) -> Optional[np.ndarray]:
+        """
+        Zero-copy (ntotal, d) view over the stored vectors of a flat index.
+        Returns None for index types that don't store raw vectors contiguously.
+        """
+        index = faiss.downcast_index(self.index)
+        if isinstance(index, faiss.IndexIDMap):
+            index = faiss.downcast_index(index.index)
+        if not isinstance(index, faiss.IndexFlat):
+            return None
+        xb = faiss.rev_swig_ptr(index.get_xb(), index.ntotal * index.d)
+        return xb.reshape(index.ntotal, index.d)
+
+    def vectors(self, positions: np.ndarray) -> np.ndarray:
+        """Stored vectors for the given metadata positions (FAISS ids), shape (n, d)."""
+        positions = np.asarray(positions, dtype=np.int64)
+        flat = self._flat_vectors()
+        if flat is not None:
+            rows = positions if self._pos_to_row is None else self._pos_to_row[positions]
+            return flat[rows]
+        return np.vstack([self.index.reconstruct(int(p)) for p in positions])
+
+    def _search_subset(self, query_vector: np.ndarray, candidates: np.ndarray, top_k: int):
+        """
+        Ranks only the candidate positions. On a flat index this touches
+        len(candidates) vectors, so narrower filters make the search cheaper.
+        """
+        k = min(top_k, len(candidates))
+        if k == 0:
+            return np.empty((1, 0), dtype=np.float32), np.empty((1, 0), dtype=np.int64)
+
+        vectors = self._flat_vectors()
+        if vectors is not None:
+            rows = candidates if self._pos_to_row is None else self._pos_to_row[candidates]
+            scores = vectors[rows] @ query_vector[0]
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return scores[top][None, :], candidates[top][None, :]
+
+        # Other index types: let FAISS skip non-matching ids during the scan
+        params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(candidates))
+        return self.index.search(query_vector, k, params=params)
+
+    def _to_results(self, scores: np.ndarray, ids: np.ndarray) -> List[SearchResult]:
         results = []
-        for i in range(top_k):
-            idx = I[0][i]
-            score = float(D[0][i]) # Convert numpy float to python float
-            
-            if idx < 0 or idx >= len(self.blocks):
+        for i in range(len(ids)):
+            idx = ids[i]
+            score = float(scores[i]) # Convert numpy float to python float
+
+            if idx < 0 or idx >= len(self.blocks) or self.blocks[idx] is None:
                 continue
-                
-            block = self.blocks[idx].copy()
-            block['score'] = score
-            results.append(block)
+
+            block_id = self.blocks[idx].get("block_id")
+            results.append(SearchResult(block_id, score, self.blocks, int(idx), self.name))
+        return results
+
+    def search_vectors(self, query_vectors: np.ndarray, top_k: int,
+                       filters: Optional[Dict[str, Any]] = None) -> List[List[SearchResult]]:
+        """
+        Searches a (n, d) batch of query vectors with the same filters.
+        Unfiltered batches are a single FAISS call (one matrix product on a flat index).
+        """
+        n = len(query_vectors)
+        with span("metadata_filter"):
+            candidates = self.filter_index.candidates(filters)
+        if self.index.ntotal == 0 or (candidates is not None and len(candidates) == 0):
+            return [[] for _ in range(n)]
+
+        if candidates is None:
+            D, I = self.index.search(query_vectors, min(top_k, self.index.ntotal))
+        else:
+            D, I = zip(*(self._search_subset(query_vectors[i:i + 1], candidates, top_k) for i in range(n)))
+            D, I = [d[0] for d in D], [ids[0] for ids in I]
+        return [self._to_results(D[i], I[i]) for i in range(n)]
+
+    def search_vector(self, query_vector: np.ndarray, top_k: int,
+                      filters: Optional[Dict[str, Any]] = None) -> List[SearchResult]:
+        return self.search_vectors(query_vector, top_k, filters)[0]
+
+
+    def search_lexical(self, query: str, top_k: int,
+                       filters: Optional[Dict[str, Any]] = None) -> List[SearchResult]:
+        """BM25 search; scores are BM25 scores, not cosine similarities."""
+        if self.lexical is None:
+            return []
+        candidates = self.filter_index.candidates(filters)
+        if candidates is not None and len(candidates) == 0:
+            return []
+        scores, positions = self.lexical.search(query, top_k, candidates)
+        return [
+            SearchResult(self.blocks[pos].get("block_id"), float(score), self.blocks, int(pos), self.name)
+            for score, pos in zip(scores, positions) if self.blocks[pos] is not None
+        ]
+
+
+def reciprocal_rank_fusion(ranked_lists: List[List[SearchResult]], k: int = 60) -> List[SearchResult]:
+    """
+    Merges ranked result lists with Reciprocal Rank Fusion: score = sum(1 / (k + rank)).
+    Only ranks are used, so dense cosine and BM25 scores need no calibration.
+    """
+    fused: Dict[Tuple[str, int], float] = {}
+    first_seen: Dict[Tuple[str, int], SearchResult] = {}
+    for results in ranked_lists:
+        for rank, r in enumerate(results, start=1):
+            key = (r.shard, r._idx)
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+            first_seen.setdefault(key, r)
+    ordered = sorted(fused.items(), key=lambda item: -item[1])
+    return [
+        SearchResult(first_seen[key].block_id, score, first_seen[key]._blocks, key[1], key[0])
+        for key, score in ordered
+    ]
+
+
+class SimpleRAGSearcher:
+    def __init__(self, index_path: str = None, meta_path: str = None, version: str = None,
+                 shard_paths: Dict[str, Tuple[str, str]] = None, max_workers: int = None,
+                 embedder: RAGEmbedder = None, rerank: bool = True, shadow: bool = True):
+        """
+        Initializes the searcher with FAISS index shards and metadata.
+        Uses RAGEmbedder for query encoding (default: from rag_config.yaml); pass
+        `embedder` to search with another config or model. Retrieval options are
+        read from the embedder's config.
+        `rerank=False` skips loading the cross-encoder; `shadow=False` never mirrors
+        queries to the `shadow` candidate index (see `mirror`).
+
+        - Default: all shards of the live version published in data/index/CURRENT.
+        - `index_path` / `meta_path`: a single, unsharded index.
+        - `shard_paths`: {shard_name: (index_path, meta_path)}.
+        """
+        if shard_paths is None:
+            if index_path is None and meta_path is None:
+                shard_paths, version = index_store.current_shard_paths()
+            else:
+                shard_paths = {index_store.DEFAULT_SHARD: (index_path, meta_path)}
+        if not shard_paths:
+            raise FileNotFoundError("No index shards found. Please run build_index.py first.")
+        self.version = version or "unversioned"
             
+        print("Loading embedder...")
+        self.embedder = embedder or RAGEmbedder() # Loads from config
+        if version and (index_store.VERSIONS_DIR / version).is_dir():
+            # Query vectors of another model are meaningless against this version's vectors
+            index_store.check_model(index_store.VERSIONS_DIR / version, self.embedder.model_name)
+        retrieval_conf = self.embedder.config.get("retrieval", {})
+        # Default MMR diversification (None / 1.0 = off) and its candidate pool size
+        self.mmr_lambda = retrieval_conf.get("mmr_lambda")
+        self.mmr_fetch_k = retrieval_conf.get("mmr_fetch_k", 30)
+        # BM25 + dense fusion, and the embedder-free path for identifier lookups
+        self.hybrid = retrieval_conf.get("hybrid", True)
+        self.rrf_k = retrieval_conf.get("rrf_k", 60)
+        self.lexical_fast_path = retrieval_conf.get("lexical_fast_path", True)
+        # Optional cross-encoder second stage over `rerank.candidates` first-stage hits;
+        # the model is loaded once per process and reused by reloaded searchers
+        self.reranker = CrossEncoderReranker.from_config(self.embedder.config) if rerank else None
+        if self.reranker is not None:
+            # A reloaded searcher replaces the previous one's collector
+            REGISTRY.register_collector("rag_reranker", self.reranker.stats)
+        self.rerank_candidates = self.embedder.config.get("rerank", {}).get("candidates", 30)
+        
+        print("Loading index and metadata...")
+        self.shards: Dict[str, IndexShard] = {
+            name: IndexShard(name, idx_path, m_path) for name, (idx_path, m_path) in sorted(shard_paths.items())
+        }
+        # Shards are searched concurrently; FAISS and NumPy release the GIL while scanning
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers or min(8, len(self.shards)), thread_name_prefix="shard-search"
+        ) if len(self.shards) > 1 else None
+        
+        total = sum(s.index.ntotal for s in self.shards.values())
+        print(f"Searcher ready. Index: {total} vectors in {len(self.shards)} shard(s) (version {self.version}).")
+        # Process-wide candidate index compared on live traffic (`shadow.enabled`), shared across reloads
+        self.shadow = get_shadow(self.embedder.config) if shadow else None
+        if self.shadow is not None:
+            # A shadow without a pinned version follows hot reloads of the live one
+            self.shadow.follow(self.version)
+
+    @property
+    def shard_names(self) -> List[str]:
+        return list(self.shards.keys())
+
+    def get_block(self, block_id: str) -> Optional[Dict[str, Any]]:
+        """Looks up a block by its id (no copy). Returns None if unknown."""
+        for shard in self.shards.values():
+            block = shard.get_block(block_id)
+            if block is not None:
+                return block
+        return None
+
+    def filter_values(self, field: str) -> List[str]:
+        """Distinct values of a filterable field across all shards."""
+        values = set()
+        for shard in self.shards.values():
+            values.update(shard.filter_index.values(field))
+        return sorted(values)
+
+    def _route(self, shards: Optional[Iterable[str]], filters: Optional[Dict[str, Any]]) -> List[IndexShard]:
+        """Selects the shards to query: explicit `shards`, else a `source_name` filter, else all."""
+        wanted = shards
+        if wanted is None and filters and filters.get("source_name"):
+            wanted = filters["source_name"]
+            if isinstance(wanted, str):
+                wanted = [wanted]
+        if wanted is None:
+            return list(self.shards.values())
+        return [self.shards[name] for name in wanted if name in self.shards]
+
+    @property
+    def has_lexical(self) -> bool:
+        return any(s.lexical is not None for s in self.shards.values())
+
+    def _fan_out(self, method: str, targets: List[IndexShard], *args) -> List[List[SearchResult]]:
+        pool = self._pool
+        if len(targets) > 1 and pool is not None:
+            try:
+                futures = [pool.submit(getattr(s, method), *args) for s in targets]
+                return [f.result() for f in futures]
+            except RuntimeError:
+                # Closed by a hot reload while this request was in flight
+                pass
+        return [getattr(s, method)(*args) for s in targets]
+
+    def close(self):
+        """
+        Shuts down the shard-search threads (e.g. of a searcher replaced by a hot reload).
+        Requests still running on it fall back to searching shards sequentially.
+        """
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def search_lexical(self, query: str, top_k: int = 3, filters: Optional[Dict[str, Any]] = None,
+                       shards: Optional[Iterable[str]] = None) -> List[SearchResult]:
+        """BM25-only search (no embedding). Scores are BM25 scores."""
+        targets = self._route(shards, filters)
+        if not targets:
+            return []
+        per_shard = self._fan_out("search_lexical", targets, query, top_k, filters)
+        return heapq.nlargest(top_k, (r for results in per_shard for r in results), key=lambda r: r.score)
+
+    def lexical_lookup(self, query: str, top_k: int = 3, filters: Optional[Dict[str, Any]] = None,
+                       shards: Optional[Iterable[str]] = None) -> Optional[List[SearchResult]]:
+        """
+        Fast path for pure identifier queries (API names, instance types, error codes):
+        answers from the BM25 index without running the embedding model.
+        Returns None when the query isn't lexical or nothing matched, so the
+        caller falls back to the normal (hybrid) search.
+        """
+        if not (self.lexical_fast_path and self.has_lexical and is_lexical_query(query)):
+            return None
+        with span("lexical_lookup"):
+            return self.search_lexical(query, top_k, filters, shards) or None
+
+    def _rerank(self, query_text: str, candidates: List[SearchResult], keep: int) -> Tuple[List[SearchResult], bool]:
+        """Cross-encoder rerank; returns (results, reranked). Scores become cross-encoder logits."""
+        ranked, scores = self.reranker.rerank(query_text, candidates, keep)
+        if scores is None:
+            return ranked, False
+        return [SearchResult(r.block_id, float(sc), r._blocks, r._idx, r.shard) for r, sc in zip(ranked, scores)], True
+
+    def _diversify(self, query_vector: np.ndarray, candidates: List[SearchResult], top_k: int,
+                   lambda_mult: float, score_kind: str = "cosine") -> List[SearchResult]:
+        """Re-selects `top_k` of the candidates with MMR, using their stored vectors."""
+        if len(candidates) <= 1:
+            return candidates[:top_k]
+        vectors = np.empty((len(candidates), query_vector.shape[1]), dtype=np.float32)
+        by_shard: Dict[str, List[int]] = {}
+        for i, r in enumerate(candidates):
+            by_shard.setdefault(r.shard, []).append(i)
+        for name, idxs in by_shard.items():
+            vectors[idxs] = self.shards[name].vectors([candidates[i]._idx for i in idxs])
+        relevance = np.array([r.score for r in candidates], dtype=np.float32)
+        # Bring non-cosine scores onto a comparable 0..1 scale for the MMR trade-off
+        if score_kind == "rrf":
+            # RRF scores are tiny; rescale so the best candidate has relevance 1 like a cosine match
+            relevance /= relevance.max()
+        elif score_kind == "logit":
+            relevance = 1.0 / (1.0 + np.exp(-relevance))
+        order = mmr_select(query_vector, vectors, top_k, lambda_mult, relevance=relevance)
+        return [candidates[i] for i in order]
+
+    def plan(self, top_k: int = 3, mmr_lambda: Optional[float] = None, rerank: bool = True,
+             has_text: bool = True) -> Dict[str, Any]:
+        """Resolves per-request options against config: candidate count and which stages run."""
+        lambda_mult = self.mmr_lambda if mmr_lambda is None else mmr_lambda
+        diversify = lambda_mult is not None and lambda_mult < 1.0
+        rerank = rerank and self.reranker is not None and has_text
+        fetch_k = max(top_k, self.mmr_fetch_k) if diversify else top_k
+        if rerank:
+            fetch_k = max(fetch_k, self.rerank_candidates)
+        return {
+            "top_k": top_k,
+            "fetch_k": fetch_k,
+            "lambda_mult": lambda_mult,
+            "diversify": diversify,
+            "rerank": rerank,
+            "hybrid": bool(self.hybrid and has_text and self.has_lexical),
+        }
+
+    def first_stage(self, query_vectors: np.ndarray, fetch_k: int,
+                    filters: Optional[Dict[str, Any]] = None,
+                    shards: Optional[Iterable[str]] = None) -> List[List[SearchResult]]:
+        """
+        Dense candidates for a (n, d) batch of query vectors sharing filters/shards.
+        Each shard is searched once for the whole batch.
+        """
+        targets = self._route(shards, filters)
+        if not targets:
+            return [[] for _ in range(len(query_vectors))]
+        with span("vector_search", queries=len(query_vectors), shards=len(targets)):
+            per_shard = self._fan_out("search_vectors", targets, query_vectors, fetch_k, filters)
+            # Scores are comparable across shards (same embedder, cosine similarity)
+            return [
+                heapq.nlargest(fetch_k, (r for shard_results in per_shard for r in shard_results[i]), key=lambda r: r.score)
+                for i in range(len(query_vectors))
+            ]
+
+    def second_stage(self, query_vector: np.ndarray, candidates: List[SearchResult], plan: Dict[str, Any],
+                     filters: Optional[Dict[str, Any]] = None, shards: Optional[Iterable[str]] = None,
+                     query_text: Optional[str] = None) -> List[SearchResult]:
+        """Per-query refinement of first-stage candidates: BM25 fusion, rerank, MMR."""
+        results = candidates
+        fetch_k, top_k = plan["fetch_k"], plan["top_k"]
+        hybrid = plan["hybrid"] and bool(query_text)
+        if hybrid:
+            with span("lexical_search"):
+                lexical = self.search_lexical(query_text, fetch_k, filters, shards)
+                results = reciprocal_rank_fusion([results, lexical], self.rrf_k)[:fetch_k]
+        score_kind = "rrf" if hybrid else "cosine"
+        if plan["rerank"] and query_text:
+            # Keep enough reranked candidates for MMR to choose from
+            keep = max(top_k, self.mmr_fetch_k) if plan["diversify"] else top_k
+            with span("rerank", candidates=len(results)) as rec:
+                results, reranked = self._rerank(query_text, results, keep)
+                rec["fallback"] = not reranked
+            if reranked:
+                score_kind = "logit"
+        if plan["diversify"]:
+            with span("mmr"):
+                return self._diversify(query_vector.reshape(1, -1), results, top_k, plan["lambda_mult"], score_kind)
+        return results[:top_k]
+
+    def search_vector(self, query_vector: np.ndarray, top_k: int = 3,
+                      filters: Optional[Dict[str, Any]] = None,
+                      shards: Optional[Iterable[str]] = None,
+                      mmr_lambda: Optional[float] = None,
+                      query_text: Optional[str] = None, rerank: bool = True) -> List[SearchResult]:
+        """
+        Searches with a pre-computed (1, d) query vector. See `search`.
+        Pass `query_text` to fuse BM25 results into the ranking (if `retrieval.hybrid`).
+        """
+        plan = self.plan(top_k, mmr_lambda, rerank, has_text=bool(query_text))
+        candidates = self.first_stage(query_vector, plan["fetch_k"], filters, shards)[0]
+        return self.second_stage(query_vector, candidates, plan, filters, shards, query_text)
+
+    def search_batch(self, queries: List[str], top_k: int = 3, filters: Optional[Dict[str, Any]] = None,
+                     shards: Optional[Iterable[str]] = None,
+                     mmr_lambda: Optional[float] = None) -> List[List[SearchResult]]:
+        """Searches several queries with one encoder call and one FAISS call per shard."""
+        if not queries:
+            return []
+        query_vectors = self.embedder.encode(list(queries))
+        plan = self.plan(top_k, mmr_lambda)
+        candidates = self.first_stage(query_vectors, plan["fetch_k"], filters, shards)
+        batch = [
+            self.second_stage(query_vectors[i], candidates[i], plan, filters, shards, query_text=queries[i])
+            for i in range(len(queries))
+        ]
+        for query, results in zip(queries, batch):
+            self.mirror(query, results, top_k, filters, shards, mmr_lambda)
+        return batch
+
+    def search_rewrites(self, results: List[SearchResult], rewrites: List[str], top_k: int = 3,
+                        filters: Optional[Dict[str, Any]] = None, shards: Optional[Iterable[str]] = None,
+                        mmr_lambda: Optional[float] = None) -> List[SearchResult]:
+        """
+        Searches alternative phrasings of a query (expansions, translations) and
+        fuses them with the original `results` by reciprocal rank.
+        Rewrites are encoded and searched as one batch and not reranked, to keep the added latency small.
+        """
+        if not rewrites:
+            return results
+        vectors = self.embedder.encode(list(rewrites))
+        plan = self.plan(top_k, mmr_lambda, rerank=False)
+        candidates = self.first_stage(vectors, plan["fetch_k"], filters, shards)
+        rankings = [results] + [
+            self.second_stage(vectors[i], candidates[i], plan, filters, shards, query_text=rewrites[i])
+            for i in range(len(rewrites))
+        ]
+        return reciprocal_rank_fusion(rankings, self.rrf_k)[:top_k]
+
+    def search(self, query: str, top_k: int = 3, filters: Optional[Dict[str, Any]] = None,
+               shards: Optional[Iterable[str]] = None, mmr_lambda: Optional[float] = None) -> List[SearchResult]:
+        """
+        Searches the index for the given query.
+        Optional `filters` restrict the search to matching blocks, e.g.
+        {"block_type": "release_version", "time_from": "October 2025", "time_to": "October 2025"}.
+        See `MetadataFilterIndex` for the supported keys.
+        Optional `shards` (or a `source_name` filter) limits the fan-out to those shards.
+        With `mmr_lambda` < 1.0 (default: `retrieval.mmr_lambda` in rag_config.yaml),
+        `retrieval.mmr_fetch_k` candidates are fetched and `top_k` diverse ones kept (MMR).
+        Dense results are fused with BM25 results by reciprocal rank (`retrieval.hybrid`);
+        identifier-only queries are answered from BM25 without encoding (`retrieval.lexical_fast_path`).
+        With `rerank.enabled`, `rerank.candidates` first-stage hits are rescored by a cross-encoder
+        within `rerank.time_budget_ms` (first-stage order is kept if the budget runs out).
+        Returns a list of SearchResult handles (no block copies are made).
+        Use `SearchResult.to_dict()` when a standalone dict is required.
+        """
+        start_t = time.perf_counter()
+        results = self.lexical_lookup(query, top_k, filters, shards)
+        if results is None:
+            # Use centralized embedder
+            query_vector = self.embedder.encode(query)
+            results = self.search_vector(query_vector, top_k, filters, shards, mmr_lambda, query_text=query)
+        self.mirror(query, results, top_k, filters, shards, mmr_lambda,
+                    latency_ms=(time.perf_counter() - start_t) * 1000)
         return results
+
+    def mirror(self, query: str, results: List[SearchResult], top_k: int = 3,
+               filters: Optional[Dict[str, Any]] = None, shards: Optional[Iterable[str]] = None,
+               mmr_lambda: Optional[float] = None, rewrites: Optional[List[str]] = None,
+               latency_ms: Optional[float] = None):
+        """
+        Hands a served query and its results to the shadow candidate (`shadow.enabled`),
+        which repeats the search on its own thread and logs how its top-k compares.
+        Returns immediately. `search` and `search_batch` mirror by themselves; callers
+        composing the lower-level steps (web UI, API) call this once per request.
+        """
+        if self.shadow is not None:
+            self.shadow.submit(query, results, self.version, top_k, filters, shards, mmr_lambda,
+                               rewrites, latency_ms)
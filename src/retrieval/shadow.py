@@ -0,0 +1,303 @@
+import os
+import sys
+import json
+import time
+import queue
+import random
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+
+from utils.paths import ROOT_DIR
+from utils import metrics
+from utils.query_log import anonymize
+from retrieval import index_store
+
+# Stage names of shadow searches in rag_stage_latency_seconds, e.g. "shadow:embed"
+STAGE_PREFIX = "shadow:"
+# Recent comparisons kept for the overlap / latency summaries
+WINDOW_SIZE = 1000
+
+
+def overlap_at_k(production: List[str], candidate: List[str], k: int) -> float:
+    """Share of production's top-k block ids that the candidate also returned in its top k."""
+    if k <= 0:
+        return 1.0
+    return len(set(production[:k]) & set(candidate[:k])) / k
+
+
+class ShadowSearcher:
+    """
+    Candidate index / embedding model queried alongside production, off the request path.
+
+    - The candidate (`shadow.version` under data/index/versions, searched with
+      `shadow.model_name`) is loaded on a background thread; queries arriving
+      before it is ready are not mirrored. Without `shadow.version` it follows
+      the live version: `follow` reloads it when production hot-reloads. Only
+      production's model may follow live; another model needs a version built with it.
+    - `submit` copies the served query and production's result ids into a bounded
+      queue and returns immediately. A single worker thread searches the candidate
+      with the same options; when the queue is full the query is dropped, so
+      production latency never depends on the candidate.
+    - Each comparison (overlap@k, top-1 agreement, both latencies) is appended to
+      `shadow.log_path`; `stats()` summarises recent ones plus the memory the
+      candidate added when it was loaded. Its stages are recorded as "shadow:<stage>".
+    """
+
+    def __init__(self, version: Optional[str] = None, model_name: Optional[str] = None, rerank: bool = False,
+                 sample_rate: float = 1.0, max_queue: int = 32, log_path: Optional[Path] = None,
+                 config: Optional[Dict] = None):
+        self.version = version
+        # No pinned version: track data/index/CURRENT across hot reloads
+        self.follow_live = version is None
+        self.model_name = model_name
+        self.rerank = rerank
+        self.sample_rate = sample_rate
+        self.log_path = log_path
+        self.config = config or {}
+        self.searcher = None
+        self.load_error: Optional[str] = None
+        self.load_rss_mb = 0.0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._overlaps = deque(maxlen=WINDOW_SIZE)
+        self._top1 = deque(maxlen=WINDOW_SIZE)
+        self._latencies_ms = deque(maxlen=WINDOW_SIZE)
+        self._production_ms = deque(maxlen=WINDOW_SIZE)
+        self._lock = threading.Lock()
+        self._stats = {"mirrored": 0, "compared": 0, "dropped": 0, "failed": 0, "reloads": 0}
+        self._reload = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="shadow-search", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional["ShadowSearcher"]:
+        """Builds the shadow from the `shadow` config section; None if disabled."""
+        conf = config.get("shadow", {})
+        if not conf.get("enabled"):
+            return None
+        log_path = conf.get("log_path", "logs/shadow.jsonl")
+        if log_path:
+            log_path = Path(log_path) if os.path.isabs(log_path) else ROOT_DIR / log_path
+            log_path.parent.mkdir(parents=True, exist_ok=True)
+        return cls(
+            version=conf.get("version") or None,
+            model_name=conf.get("model_name") or None,
+            rerank=conf.get("rerank", False),
+            sample_rate=conf.get("sample_rate", 1.0),
+            max_queue=conf.get("max_queue", 32),
+            log_path=log_path or None,
+            config=config,
+        )
+
+    @property
+    def ready(self) -> bool:
+        return self.searcher is not None
+
+    def _load(self):
+        # Imported here: search_engine creates the process-wide shadow (see get_shadow)
+        from embedding.embedder import DEFAULT_MODEL, RAGEmbedder
+        from retrieval.reranker import CrossEncoderReranker
+        from retrieval.search_engine import SimpleRAGSearcher
+
+        production_model = self.config.get("embedding", {}).get("model_name") or DEFAULT_MODEL
+        if self.follow_live:
+            if self.model_name is not None and self.model_name != production_model:
+                # The live index holds production-model vectors
+                raise ValueError(f"Shadow model {self.model_name} needs shadow.version: an index built with it "
+                                 f"(build_index.py --model {self.model_name} --no-publish)")
+            shard_paths, version = index_store.current_shard_paths()
+        else:
+            version = self.version
+            shard_paths = index_store.shard_paths(index_store.VERSIONS_DIR / version)
+        if not shard_paths:
+            raise FileNotFoundError(f"Shadow index version {version} not found")
+        previous = self.searcher
+        if previous is not None and version == self.version:
+            return
+        rss_before = metrics.current_rss_mb()
+        # Production's model reuses its loaded instance (RAGEmbedder is shared per config and model)
+        embedder = previous.embedder if previous is not None else RAGEmbedder(
+            model_name=self.model_name if self.model_name != production_model else None)
+        searcher = SimpleRAGSearcher(version=version, shard_paths=shard_paths, embedder=embedder,
+                                     rerank=False, shadow=False)
+        dims = {s.index.d for s in searcher.shards.values()}
+        if dims != {embedder.embedding_dim}:
+            raise ValueError(f"Shadow model {embedder.model_name} encodes {embedder.embedding_dim}-d vectors, "
+                             f"index version {version} holds {sorted(dims)}-d")
+        if previous is not None:
+            searcher.reranker = previous.reranker
+        elif self.rerank:
+            # Own cross-encoder, so shadow queries don't queue behind production reranks
+            searcher.reranker = CrossEncoderReranker.from_config(self.config, shared=False)
+        if previous is None:
+            self.load_rss_mb = metrics.current_rss_mb() - rss_before
+        self.model_name = embedder.model_name
+        self.version = version
+        self.searcher = searcher
+        if previous is not None:
+            previous.close()
+            with self._lock:
+                self._stats["reloads"] += 1
+        print(f"[Shadow] Candidate ready: index {self.version}, model {self.model_name} "
+              f"(+{self.load_rss_mb:.0f} MB RSS)")
+
+    def follow(self, version: str):
+        """
+        Called when production (re)loads `version`. A shadow following the live
+        version reloads the candidate from data/index/CURRENT on its worker thread.
+        """
+        if self.follow_live and self.ready and version != self.version:
+            self._reload.set()
+            try:
+                # Wakes the worker if it is idle
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass
+
+    def submit(self, query: str, results: List, production_version: str, top_k: int = 3,
+               filters: Optional[Dict[str, Any]] = None, shards: Optional[List[str]] = None,
+               mmr_lambda: Optional[float] = None, rewrites: Optional[List[str]] = None,
+               latency_ms: Optional[float] = None) -> bool:
+        """Queues one served query for comparison. Never blocks; returns False if not mirrored."""
+        if not self.ready or random.random() >= self.sample_rate:
+            return False
+        item = {
+            "query": query,
+            "production_ids": [r.block_id for r in results],
+            "production_version": production_version,
+            "production_ms": latency_ms,
+            "top_k": top_k,
+            "filters": dict(filters) if filters else None,
+            "shards": list(shards) if shards else None,
+            "mmr_lambda": mmr_lambda,
+            "rewrites": list(rewrites or []),
+        }
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self._stats["dropped"] += 1
+            return False
+        with self._lock:
+            self._stats["mirrored"] += 1
+        return True
+
+    def _search(self, item: Dict[str, Any]) -> List:
+        searcher, query = self.searcher, item["query"]
+        args = (item["top_k"], item["filters"], item["shards"])
+        results = searcher.lexical_lookup(query, *args)
+        if results is not None:
+            return results
+        vector = searcher.embedder.encode(query)
+        results = searcher.search_vector(vector, *args, item["mmr_lambda"], query_text=query)
+        if item["rewrites"]:
+            results = searcher.search_rewrites(results, item["rewrites"], *args, item["mmr_lambda"])
+        return results
+
+    def _compare(self, item: Dict[str, Any]):
+        t = metrics.Trace("shadow")
+        start_t = time.perf_counter()
+        with metrics.activate(t):
+            results = self._search(item)
+        latency_ms = (time.perf_counter() - start_t) * 1000
+        candidate_ids = [r.block_id for r in results]
+        production_ids = item["production_ids"]
+        overlap = overlap_at_k(production_ids, candidate_ids, item["top_k"])
+        top1 = bool(production_ids and candidate_ids and production_ids[0] == candidate_ids[0])
+        with self._lock:
+            self._stats["compared"] += 1
+            self._overlaps.append(overlap)
+            self._top1.append(top1)
+            self._latencies_ms.append(latency_ms)
+            if item["production_ms"] is not None:
+                self._production_ms.append(item["production_ms"])
+        if self.log_path is not None:
+            self._write({
+                "ts": time.time(),
+                "query": anonymize(item["query"]),
+                "top_k": item["top_k"],
+                "production_version": item["production_version"],
+                "shadow_version": self.version,
+                "shadow_model": self.model_name,
+                "overlap_at_k": overlap,
+                "top1_match": top1,
+                "production_ms": item["production_ms"],
+                "shadow_ms": latency_ms,
+                "shadow_stage_ms": t.stage_ms(),
+                "production_ids": production_ids,
+                "shadow_ids": candidate_ids,
+            })
+
+    def _write(self, record: Dict[str, Any]):
+        try:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"[Warning] Could not write shadow log {self.log_path}: {e}")
+
+    def _run(self):
+        with metrics.stage_prefix(STAGE_PREFIX):
+            try:
+                self._load()
+            except Exception as e:
+                self.load_error = str(e)
+                print(f"[Warning] Shadow index disabled: {e}")
+                return
+            while True:
+                item = self._queue.get()
+                if self._reload.is_set():
+                    self._reload.clear()
+                    try:
+                        self._load()
+                    except Exception as e:
+                        print(f"[Warning] Shadow reload failed, keeping index {self.version}: {e}")
+                if item is None:
+                    continue
+                try:
+                    self._compare(item)
+                except Exception as e:
+                    with self._lock:
+                        self._stats["failed"] += 1
+                    print(f"[Shadow] Search failed: {type(e).__name__}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            overlaps, top1 = list(self._overlaps), list(self._top1)
+            latencies, production = sorted(self._latencies_ms), sorted(self._production_ms)
+            stats = dict(self._stats)
+        pct = lambda values, q: values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+        stats.update({
+            "ready": int(self.ready),
+            "queued": self._queue.qsize(),
+            "overlap_at_k": sum(overlaps) / len(overlaps) if overlaps else 0.0,
+            "top1_agreement": sum(top1) / len(top1) if top1 else 0.0,
+            "latency_p50_ms": pct(latencies, 0.50),
+            "latency_p95_ms": pct(latencies, 0.95),
+            "production_p50_ms": pct(production, 0.50),
+            "production_p95_ms": pct(production, 0.95),
+            "load_rss_mb": self.load_rss_mb,
+            "vectors": sum(s.index.ntotal for s in self.searcher.shards.values()) if self.ready else 0,
+        })
+        return stats
+
+
+_shadow: Optional[ShadowSearcher] = None
+_shadow_lock = threading.Lock()
+
+
+def get_shadow(config: Dict) -> Optional[ShadowSearcher]:
+    """
+    Returns the process-wide shadow (None if `shadow.enabled` is off). Reloaded
+    production searchers share it, so the candidate is loaded once per process.
+    """
+    global _shadow
+    with _shadow_lock:
+        if _shadow is None:
+            _shadow = ShadowSearcher.from_config(config)
+            if _shadow is not None:
+                metrics.REGISTRY.register_collector("rag_shadow", _shadow.stats)
+        return _shadow
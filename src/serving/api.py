@@ -0,0 +1,341 @@
+import os
+import sys
+import hmac
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+
+# Add src to path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+
+from utils.paths import CONFIG_DIR
+from utils.dates import time_range_from_text
+from utils import metrics, query_log
+from utils.profiling import start_service_profiler
+from retrieval.hot_reload import HotReloadingSearcher
+from retrieval.lexical import is_lexical_query
+from generator.generate import RAGGenerator
+from generator.llm_client import load_config
+from serving.batcher import MicroBatcher
+
+CONFIG_PATH = str(CONFIG_DIR / "rag_config.yaml")
+
+# Process-wide components, created in `lifespan`
+_state: Dict[str, Any] = {}
+
+
+# Largest top_k a request may ask for
+MAX_TOP_K = 50
+
+
+class SearchRequest(BaseModel):
+    query: str = Field(..., min_length=1)
+    top_k: int = Field(3, ge=1, le=MAX_TOP_K)
+    # Same keys as SimpleRAGSearcher.search, e.g. {"block_type": "release_version", "time_from": "2025-10"}
+    filters: Optional[Dict[str, Any]] = None
+    shards: Optional[List[str]] = None
+    mmr_lambda: Optional[float] = Field(None, ge=0.0, le=1.0)
+    # Restrict to dates mentioned in the query (dropped again if nothing matches)
+    auto_time_filter: bool = True
+    # Search LLM expansions / translations too (if query_rewrite is enabled)
+    rewrite: bool = True
+
+
+def _encode_and_search(items: List[Dict[str, Any]]) -> List[Tuple]:
+    """
+    Batch function for the micro-batcher: one `encode` call for all queries,
+    then one first-stage FAISS search per group of requests sharing options.
+    """
+    searcher = _state["holder"].current
+    vectors = searcher.embedder.encode([item["query"] for item in items])
+    plans = [searcher.plan(item["top_k"], item["mmr_lambda"]) for item in items]
+
+    groups: Dict[Tuple, List[int]] = {}
+    for i, item in enumerate(items):
+        key = (plans[i]["fetch_k"], json.dumps(item["filters"], sort_keys=True), tuple(item["shards"] or ()))
+        groups.setdefault(key, []).append(i)
+
+    outputs: List[Optional[Tuple]] = [None] * len(items)
+    for idxs in groups.values():
+        first = items[idxs[0]]
+        try:
+            candidates = searcher.first_stage(vectors[idxs], plans[idxs[0]]["fetch_k"], first["filters"], first["shards"])
+        except Exception as e:
+            # Bad filter values (or any other failure of this group) only fail the requests that sent them
+            candidates = [e] * len(idxs)
+        for i, cands in zip(idxs, candidates):
+            outputs[i] = (searcher, vectors[i:i + 1], cands, plans[i])
+    return outputs
+
+
+async def _search(query: str, top_k: int, filters: Optional[Dict], shards: Optional[List[str]],
+                  mmr_lambda: Optional[float]):
+    # Queue wait + batched encode + first stage (the batch runs outside this request's trace)
+    with metrics.span("batched_search"):
+        searcher, vector, candidates, plan = await _state["batcher"].submit({
+            "query": query, "top_k": top_k, "filters": filters, "shards": shards, "mmr_lambda": mmr_lambda,
+        })
+    if isinstance(candidates, Exception):
+        raise candidates
+    results = await run_in_threadpool(searcher.second_stage, vector, candidates, plan, filters, shards, query)
+    return searcher, results, vector
+
+
+async def retrieve(req: SearchRequest) -> Dict[str, Any]:
+    """Same flow as the web UI: lexical fast path, else batched dense/hybrid search plus concurrent rewrites."""
+    start_t = time.time()
+    searcher = _state["holder"].current
+    generator: RAGGenerator = _state["generator"]
+    filters = dict(req.filters or {})
+    time_range = time_range_from_text(req.query) if req.auto_time_filter else None
+    if time_range:
+        filters["time_from"], filters["time_to"] = time_range
+
+    pending = None
+    if req.rewrite and generator.rewriter and not (searcher.lexical_fast_path and is_lexical_query(req.query)):
+        pending = generator.rewriter.submit(req.query)
+
+    async def attempt(filters):
+        # Identifier-only queries are answered from the BM25 index without encoding
+        lexical = await run_in_threadpool(searcher.lexical_lookup, req.query, req.top_k, filters, req.shards)
+        if lexical is not None:
+            return searcher, lexical, None
+        return await _search(req.query, req.top_k, filters, req.shards, req.mmr_lambda)
+
+    try:
+        searcher, results, vector = await attempt(filters)
+        if not results and time_range:
+            # Detected date matched nothing; fall back to the unrestricted search
+            filters.pop("time_from")
+            filters.pop("time_to")
+            searcher, results, vector = await attempt(filters)
+
+        rewrites = []
+        if pending is not None and vector is not None:
+            rewrites = await run_in_threadpool(generator.rewriter.wait, pending)
+            if rewrites:
+                results = await run_in_threadpool(searcher.search_rewrites, results, rewrites, req.top_k,
+                                                  filters, req.shards, req.mmr_lambda)
+    except (ValueError, TypeError) as e:
+        # Malformed filter values
+        raise HTTPException(status_code=400, detail=str(e))
+
+    retrieval_ms = (time.time() - start_t) * 1000
+    # Compared against the shadow candidate index in the background (if enabled)
+    searcher.mirror(req.query, results, req.top_k, filters, req.shards, req.mmr_lambda, rewrites, retrieval_ms)
+    return {"searcher": searcher, "results": results, "query_vector": vector,
+            "mode": "lexical" if vector is None else "hybrid",
+            "rewrites": rewrites, "retrieval_ms": retrieval_ms}
+
+
+def _log_query(endpoint: str, req: SearchRequest):
+    # Opt-in (query_log.enabled); the request as sent, before auto time filters are added
+    query_log.record(endpoint, req.query, req.top_k, req.filters, req.shards, req.mmr_lambda,
+                     auto_time_filter=req.auto_time_filter, rewrite=req.rewrite)
+
+
+def _source(res, with_content: bool = False) -> Dict[str, Any]:
+    meta = res.source_meta
+    source = {
+        "block_id": res.block_id,
+        "score": res.score,
+        "shard": res.shard,
+        "title": meta.get("title", "Unknown"),
+        "url": meta.get("url", "#"),
+    }
+    if with_content:
+        source["content"] = res.content
+    return source
+
+
+def _retrieval_info(retrieved: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "index_version": retrieved["searcher"].version,
+        "mode": retrieved["mode"],
+        "rewrites": retrieved["rewrites"],
+        "retrieval_ms": retrieved["retrieval_ms"],
+    }
+
+
+def require_token(authorization: Optional[str] = Header(None)):
+    """With `api.token_env` set in the environment, every route needs `Authorization: Bearer <token>`."""
+    token = _state.get("api_token")
+    if token and not hmac.compare_digest(authorization or "", f"Bearer {token}"):
+        raise HTTPException(status_code=401, detail="Missing or invalid bearer token",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    config = load_config(CONFIG_PATH)
+    api_conf = config.get("api", {})
+    reload_interval = config.get("index", {}).get("reload_interval_sec", 10)
+    _state["holder"] = HotReloadingSearcher(poll_interval=reload_interval).start()
+    _state["generator"] = RAGGenerator(CONFIG_PATH)
+    # Read after the generator has loaded .env
+    _state["api_token"] = os.getenv(api_conf.get("token_env", "API_TOKEN"), "")
+    if not _state["api_token"] and api_conf.get("host", "127.0.0.1") not in ("127.0.0.1", "localhost"):
+        print(f"[Warning] API listens on {api_conf['host']} without {api_conf.get('token_env', 'API_TOKEN')}: "
+              "/answer spends LLM budget and is open to anyone who can reach it")
+    _state["batcher"] = MicroBatcher(
+        _encode_and_search,
+        max_batch_size=api_conf.get("batch_max_size", 16),
+        max_wait_ms=api_conf.get("batch_max_wait_ms", 5),
+        name="encode-search",
+    )
+    _state["batcher"].start()
+    metrics.configure(config)
+    query_log.configure(config)
+    metrics.REGISTRY.register_collector("rag_api_batcher", _state["batcher"].stats)
+    # RAG_PROFILE=sample samples all request threads until shutdown
+    profiler = start_service_profiler("api")
+    yield
+    await _state["batcher"].stop()
+    _state["holder"].stop()
+    if profiler is not None:
+        profiler.stop()
+    if _state["generator"]._async_client is not None:
+        await _state["generator"]._async_client.aclose()
+
+
+app = FastAPI(title="BytePlus ECS RAG API", lifespan=lifespan, dependencies=[Depends(require_token)])
+
+
+@app.exception_handler(RequestValidationError)
+async def validation_error(request: Request, exc: RequestValidationError):
+    # Out-of-range or malformed request fields are client errors, like bad filter values
+    errors = [{"loc": list(e.get("loc", ())), "msg": e.get("msg", "")} for e in exc.errors()]
+    return JSONResponse(status_code=400, content={"detail": errors})
+
+
+@app.get("/health")
+async def health():
+    generator: RAGGenerator = _state["generator"]
+    shadow = _state["holder"].current.shadow
+    return {
+        "status": "ok",
+        "index_version": _state["holder"].version,
+        "batcher": _state["batcher"].stats(),
+        "scheduler": generator.scheduler.stats(),
+        "usage": generator.accountant.stats(),
+        "shadow": shadow.stats() if shadow is not None else None,
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus text format: per-stage latency histograms, token counters, component gauges."""
+    return metrics.REGISTRY.render_prometheus()
+
+
+@app.get("/metrics.json")
+async def metrics_json():
+    """Same metrics as JSON, with p50/p95/p99 per stage."""
+    return metrics.REGISTRY.snapshot()
+
+
+@app.post("/search")
+async def search(req: SearchRequest):
+    _log_query("search", req)
+    with metrics.trace("api.search") as t:
+        retrieved = await retrieve(req)
+    return {
+        "trace_id": t.trace_id,
+        **_retrieval_info(retrieved),
+        "results": [_source(r, with_content=True) for r in retrieved["results"]],
+    }
+
+
+@app.post("/answer")
+async def answer(req: SearchRequest):
+    _log_query("answer", req)
+    with metrics.trace("api.answer") as t:
+        retrieved = await retrieve(req)
+        generator: RAGGenerator = _state["generator"]
+        start_t = time.time()
+        result = await generator.answer_async(
+            req.query, retrieved["results"], query_vector=retrieved["query_vector"],
+            index_version=retrieved["searcher"].version,
+        )
+    debug = result["debug"]
+    return {
+        "trace_id": t.trace_id,
+        **_retrieval_info(retrieved),
+        "answer": result["answer"],
+        "sources": [_source(r) for r in retrieved["results"]],
+        "generation_ms": (time.time() - start_t) * 1000,
+        "cache_hit": debug.get("cache_hit", False),
+        "degraded": debug.get("degraded"),
+        "context": debug.get("context", {}),
+        "usage": debug.get("usage"),
+        "budget": debug.get("budget"),
+    }
+
+
+@app.post("/answer/stream")
+async def answer_stream(req: SearchRequest):
+    """
+    Newline-delimited JSON events:
+      {"type": "sources", ...}, then {"type": "delta", "text": ...} per chunk,
+      then {"type": "done", "ttft_ms": ..., "generation_ms": ..., ...}.
+    """
+    _log_query("answer_stream", req)
+    # Finished by the response generator, which runs after this handler has returned
+    t = metrics.start_trace("api.answer_stream", activate=False)
+    with metrics.activate(t):
+        retrieved = await retrieve(req)
+        generator: RAGGenerator = _state["generator"]
+        # Async client: same deadlines, retries, failover and hedging as /answer
+        stream = await generator.answer_stream_async(
+            req.query, retrieved["results"], query_vector=retrieved["query_vector"],
+            index_version=retrieved["searcher"].version,
+        )
+
+    async def events():
+        yield json.dumps({
+            "type": "sources",
+            "trace_id": t.trace_id,
+            **_retrieval_info(retrieved),
+            "sources": [_source(r) for r in retrieved["results"]],
+        }, ensure_ascii=False) + "\n"
+        deltas = stream.__aiter__()
+        try:
+            while True:
+                # The trace is not active in the response task: activate it per step
+                with metrics.activate(t):
+                    try:
+                        delta = await deltas.__anext__()
+                    except StopAsyncIteration:
+                        break
+                yield json.dumps({"type": "delta", "text": delta}, ensure_ascii=False) + "\n"
+        finally:
+            metrics.finish_trace(t)
+        debug = stream.debug
+        yield json.dumps({
+            "type": "done",
+            "ttft_ms": debug.get("ttft_ms"),
+            "generation_ms": debug.get("generation_ms"),
+            "cache_hit": debug.get("cache_hit", False),
+            "degraded": debug.get("degraded"),
+            "context": debug.get("context", {}),
+            "usage": debug.get("usage"),
+            "budget": debug.get("budget"),
+        }, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    api_conf = load_config(CONFIG_PATH).get("api", {})
+    # One worker: models and caches live in this process
+    uvicorn.run(app, host=api_conf.get("host", "127.0.0.1"), port=api_conf.get("port", 8000))
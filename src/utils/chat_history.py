@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+
+from utils.paths import ROOT_DIR
+from utils.query_log import anonymize
+
+# Debug fields small enough to keep on every turn; the rest (the full final prompt) is spilled
+SUMMARY_FIELDS = ("ttft_ms", "generation_ms", "cache_hit", "degraded", "context")
+
+
+def _spill_root(config: Dict) -> Optional[Path]:
+    path = config.get("chat_history", {}).get("spill_dir", "logs/chat_debug")
+    if not path:
+        return None
+    return Path(path) if os.path.isabs(path) else ROOT_DIR / path
+
+
+def _anonymized(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a debug payload whose prompt text has e-mails, IPs, numbers and keys redacted (as in the query log)."""
+    messages = payload.get("final_messages")
+    if not messages:
+        return payload
+    return {**payload, "final_messages": [
+        {**m, "content": anonymize(m["content"])} if isinstance(m.get("content"), str) else m for m in messages
+    ]}
+
+
+class ChatHistory:
+    """
+    Bounded chat history of one web UI session.
+
+    - At most `max_messages` messages are kept; the oldest are dropped.
+    - Assistant turns reference their sources as (block_id, score) pairs; titles,
+      URLs and content are looked up in the index when a turn is rendered.
+    - Debug payloads (the final prompt sent to the LLM) of only the newest
+      `debug_in_memory` answers stay in memory. Older ones are written to
+      `<spill_dir>/<session_id>/<message id>.json` (prompt text anonymised like
+      the query log) and read back on demand, or dropped when there is no spill dir.
+    """
+
+    def __init__(self, max_messages: int = 50, visible_messages: int = 20, debug_in_memory: int = 1,
+                 spill_dir: Optional[Path] = None, session_id: Optional[str] = None):
+        self.max_messages = max_messages
+        self.visible_messages = visible_messages
+        self.debug_in_memory = debug_in_memory
+        self.session_id = session_id or uuid.uuid4().hex[:16]
+        self.spill_dir = Path(spill_dir) / self.session_id if spill_dir else None
+        self.messages: List[Dict[str, Any]] = []
+        self._debug: Dict[int, Dict[str, Any]] = {}
+        self._next_id = 0
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "ChatHistory":
+        """Applies the `chat_history` section of rag_config.yaml."""
+        conf = config.get("chat_history", {})
+        return cls(
+            max_messages=conf.get("max_messages", 50),
+            visible_messages=conf.get("visible_messages", 20),
+            debug_in_memory=conf.get("debug_in_memory", 1),
+            spill_dir=_spill_root(config),
+        )
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def _append(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        message["id"] = self._next_id
+        self._next_id += 1
+        self.messages.append(message)
+        while len(self.messages) > self.max_messages:
+            self._forget(self.messages.pop(0))
+        return message
+
+    def add_user(self, content: str) -> Dict[str, Any]:
+        return self._append({"role": "user", "content": content})
+
+    def add_assistant(self, content: str, results: Iterable, debug: Optional[Dict[str, Any]] = None,
+                      index_version: Optional[str] = None, score_kind: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Records an answer with compact references to `results` (SearchResult handles).
+        `score_kind` names what their scores are (e.g. "RRF", "Cosine") for display.
+        """
+        debug = debug or {}
+        message = self._append({
+            "role": "assistant",
+            "content": content,
+            "sources": [(r.block_id, round(float(r.score), 4)) for r in results],
+            "index_version": index_version,
+            "score_kind": score_kind,
+            "stats": {k: debug[k] for k in SUMMARY_FIELDS if k in debug},
+            "debug": "memory" if debug else None,
+        })
+        if debug:
+            self._debug[message["id"]] = debug
+            self._evict_debug()
+        return message
+
+    def _debug_path(self, message_id: int) -> Optional[Path]:
+        return self.spill_dir / f"{message_id}.json" if self.spill_dir else None
+
+    def _evict_debug(self):
+        while len(self._debug) > self.debug_in_memory:
+            message_id = min(self._debug)
+            payload = self._debug.pop(message_id)
+            message = next((m for m in self.messages if m["id"] == message_id), None)
+            if message is None:
+                continue
+            path = self._debug_path(message_id)
+            message["debug"] = None
+            if path is None:
+                continue
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(_anonymized(payload), f, ensure_ascii=False, default=str)
+                message["debug"] = "spilled"
+            except OSError as e:
+                print(f"[Warning] Could not spill chat debug payload to {path}: {e}")
+
+    def _forget(self, message: Dict[str, Any]):
+        self._debug.pop(message["id"], None)
+        if message.get("debug") == "spilled":
+            try:
+                os.remove(self._debug_path(message["id"]))
+            except OSError:
+                pass
+
+    def debug(self, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Full debug payload of an assistant turn (from memory or disk), None if it was dropped."""
+        if message.get("debug") == "memory":
+            return self._debug.get(message["id"])
+        if message.get("debug") == "spilled":
+            try:
+                with open(self._debug_path(message["id"]), "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                return None
+        return None
+
+    def visible(self, count: Optional[int] = None) -> List[Dict[str, Any]]:
+        """The newest `count` (default `visible_messages`) messages; only these are rendered."""
+        count = self.visible_messages if count is None else count
+        return self.messages[-count:] if count > 0 else []
+
+    def clear(self):
+        self.messages = []
+        self._debug = {}
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    @staticmethod
+    def remove_stale(config: Dict) -> int:
+        """
+        Deletes spilled payloads of sessions idle for more than `chat_history.spill_ttl_hours`
+        (Streamlit has no session-end hook). Returns the number of sessions removed.
+        """
+        root = _spill_root(config)
+        if root is None or not root.is_dir():
+            return 0
+        cutoff = time.time() - config.get("chat_history", {}).get("spill_ttl_hours", 24) * 3600
+        removed = 0
+        for session_dir in root.iterdir():
+            if session_dir.is_dir() and session_dir.stat().st_mtime < cutoff:
+                shutil.rmtree(session_dir, ignore_errors=True)
+                removed += 1
+        return removed
@@ -0,0 +1,79 @@
+import re
+import calendar
+from datetime import date
+from typing import Optional, Tuple
+
+MONTH_NAMES = [
+    "january", "february", "march", "april", "may", "june",
+    "july", "august", "september", "october", "november", "december"
+]
+MONTHS = r"(?:January|February|March|April|May|June|July|August|September|October|November|December)"
+
+# "October 21, 2025" / "October 21 2025"
+_MONTH_DAY_YEAR = re.compile(rf"\b({MONTHS})\s+(\d{{1,2}}),?\s+(\d{{4}})\b", re.IGNORECASE)
+# "October 2025"
+_MONTH_YEAR = re.compile(rf"\b({MONTHS})\s+(\d{{4}})\b", re.IGNORECASE)
+# "2025-10-21" / "2025-10" / "2025/10/21"
+_ISO = re.compile(r"\b(\d{4})[-/](\d{1,2})(?:[-/](\d{1,2}))?\b")
+# "2025年10月21日" / "2025年10月"
+_CJK = re.compile(r"(\d{4})\s*年\s*(\d{1,2})\s*月(?:\s*(\d{1,2})\s*日)?")
+
+
+def _month_index(name: str) -> int:
+    return MONTH_NAMES.index(name.lower()) + 1
+
+
+def _to_iso(year: int, month: int, day: Optional[int], end: bool) -> Optional[str]:
+    if not 1 <= month <= 12:
+        return None
+    if day is None:
+        day = calendar.monthrange(year, month)[1] if end else 1
+    try:
+        return date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def _parse_match(text: str, end: bool) -> Optional[Tuple[int, str]]:
+    """Returns (match_start, iso_date) for the earliest date found in text."""
+    found = []
+    m = _MONTH_DAY_YEAR.search(text)
+    if m:
+        found.append((m.start(), _to_iso(int(m.group(3)), _month_index(m.group(1)), int(m.group(2)), end)))
+    m = _MONTH_YEAR.search(text)
+    if m:
+        found.append((m.start(), _to_iso(int(m.group(2)), _month_index(m.group(1)), None, end)))
+    for pattern in (_ISO, _CJK):
+        m = pattern.search(text)
+        if m:
+            day = int(m.group(3)) if m.group(3) else None
+            found.append((m.start(), _to_iso(int(m.group(1)), int(m.group(2)), day, end)))
+    found = [f for f in found if f[1]]
+    if not found:
+        return None
+    # Prefer the earliest match; on ties the most specific pattern was appended first
+    return min(found, key=lambda f: f[0])
+
+
+def normalize_time(value: Optional[str], end: bool = False) -> Optional[str]:
+    """
+    Normalises a human readable date string to an ISO date (YYYY-MM-DD).
+    Month-only values map to the first day of the month, or the last day when `end` is True.
+    Returns None if no date can be parsed.
+    """
+    if not value:
+        return None
+    parsed = _parse_match(str(value), end)
+    return parsed[1] if parsed else None
+
+
+def time_range_from_text(text: str) -> Optional[Tuple[str, str]]:
+    """
+    Detects a date mentioned in free text (e.g. a user question) and returns
+    an inclusive (start, end) ISO range covering it, or None.
+    "October 2025" -> ("2025-10-01", "2025-10-31").
+    """
+    start = normalize_time(text)
+    if not start:
+        return None
+    return start, normalize_time(text, end=True)
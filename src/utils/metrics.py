@@ -0,0 +1,413 @@
+import os
+import sys
+import json
+import time
+import uuid
+import bisect
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+
+from utils.paths import ROOT_DIR
+
+# Latency buckets in seconds (Prometheus histogram `le` bounds)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Recent observations kept per series for p50/p95/p99
+WINDOW_SIZE = 2048
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines += [f"{self.name}{_format_labels(k)} {v}" for k, v in sorted(self._values.items())]
+        return lines
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {_format_labels(k) or "total": v for k, v in self._values.items()}
+
+
+class Histogram:
+    """Prometheus-style cumulative buckets plus a rolling window for exact recent percentiles."""
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0,
+                          "window": deque(maxlen=WINDOW_SIZE)}
+                self._series[key] = series
+            series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+            series["window"].append(value)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', str(bound)))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        out = {}
+        with self._lock:
+            for key, series in self._series.items():
+                window = sorted(series["window"])
+                out[_format_labels(key) or "total"] = {
+                    "count": series["count"],
+                    "mean": series["sum"] / series["count"] if series["count"] else 0.0,
+                    "p50": _percentile(window, 0.50),
+                    "p95": _percentile(window, 0.95),
+                    "p99": _percentile(window, 0.99),
+                }
+        return out
+
+
+class MetricsRegistry:
+    """
+    Process-wide metrics: counters, histograms and collector callbacks
+    (existing `stats()` methods, exported as gauges).
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help_text: str, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, help_text, **kwargs)
+                self._metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str = "") -> Counter:
+        return self._get(Counter, name, help_text)
+
+    def histogram(self, name: str, help_text: str = "", buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def register_collector(self, prefix: str, fn: Callable[[], Dict[str, Any]]):
+        """Exports the numeric fields of `fn()` as gauges named `<prefix>_<field>`. Re-registering replaces."""
+        with self._lock:
+            self._collectors[prefix] = fn
+
+    def _collect(self) -> Dict[str, float]:
+        with self._lock:
+            collectors = list(self._collectors.items())
+        gauges = {}
+        for prefix, fn in collectors:
+            try:
+                values = fn()
+            except Exception:
+                continue
+            for field, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    gauges[f"{prefix}_{field}"] = float(value)
+        return gauges
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        for name, value in sorted(self._collect().items()):
+            lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-friendly view with p50/p95/p99 for histograms."""
+        with self._lock:
+            metrics = dict(self._metrics)
+        return {
+            **{name: metric.snapshot() for name, metric in metrics.items()},
+            "gauges": self._collect(),
+        }
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_LATENCY = REGISTRY.histogram("rag_stage_latency_seconds", "Latency of pipeline stages (span name = stage)")
+STAGE_ERRORS = REGISTRY.counter("rag_stage_errors_total", "Exceptions raised inside pipeline stages")
+LLM_TOKENS = REGISTRY.counter("rag_llm_tokens_total", "Tokens reported by the LLM API (kind = prompt | completion)")
+
+
+class Trace:
+    """One request: a trace id and the spans recorded while it was active."""
+
+    def __init__(self, name: str, trace_id: Optional[str] = None, **attrs):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration_ms: Optional[float] = None
+        self.spans: List[Dict[str, Any]] = []
+        self._token = None
+        self._started = time.perf_counter()
+
+    def stage_ms(self) -> Dict[str, float]:
+        """Total time per span name (a stage can run several times per request)."""
+        totals: Dict[str, float] = {}
+        for s in self.spans:
+            totals[s["name"]] = totals.get(s["name"], 0.0) + s["ms"]
+        return totals
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "attrs": self.attrs,
+            "spans": self.spans,
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("rag_trace", default=None)
+_stage_prefix: ContextVar[str] = ContextVar("rag_stage_prefix", default="")
+_trace_log = {"path": None, "max_bytes": 0, "lock": threading.Lock()}
+
+
+def configure(config: Dict):
+    """Applies the `metrics` section of rag_config.yaml (JSON trace log location and size cap)."""
+    conf = config.get("metrics", {})
+    path = conf.get("trace_log", "logs/traces.jsonl") if conf.get("enabled", True) else ""
+    if path:
+        path = Path(path) if os.path.isabs(path) else ROOT_DIR / path
+        path.parent.mkdir(parents=True, exist_ok=True)
+    _trace_log["path"] = path or None
+    _trace_log["max_bytes"] = int(conf.get("trace_log_max_mb", 100) * 2**20)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def start_trace(name: str, trace_id: Optional[str] = None, activate: bool = True, **attrs) -> Trace:
+    """
+    Starts a request trace. With `activate`, spans opened in this context (and in
+    contexts copied from it, e.g. Starlette's threadpool) are attached to it.
+    """
+    t = Trace(name, trace_id, **attrs)
+    t._token = _current_trace.set(t) if activate else None
+    t._started = time.perf_counter()
+    return t
+
+
+def finish_trace(t: Trace):
+    """Ends the trace: records its total latency and appends it to the JSON trace log."""
+    t.duration_ms = (time.perf_counter() - t._started) * 1000
+    if t._token is not None:
+        try:
+            _current_trace.reset(t._token)
+        except ValueError:
+            # Finished from a different context (e.g. a streaming worker thread)
+            pass
+        t._token = None
+    STAGE_LATENCY.observe(t.duration_ms / 1000, stage=f"request:{t.name}")
+    _write_trace(t)
+
+
+@contextmanager
+def trace(name: str, trace_id: Optional[str] = None, **attrs) -> Iterator[Trace]:
+    t = start_trace(name, trace_id, **attrs)
+    try:
+        yield t
+    finally:
+        finish_trace(t)
+
+
+@contextmanager
+def activate(t: Trace) -> Iterator[Trace]:
+    """Makes an existing trace current for a block, without finishing it."""
+    token = _current_trace.set(t)
+    try:
+        yield t
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def stage_prefix(prefix: str) -> Iterator[None]:
+    """
+    Prefixes the names of stages recorded in this context, e.g. "shadow:" keeps a
+    shadow index's `embed` / `vector_search` apart from the production series.
+    """
+    token = _stage_prefix.set(prefix)
+    try:
+        yield
+    finally:
+        _stage_prefix.reset(token)
+
+
+def observe_stage(name: str, ms: float, t: Optional[Trace] = None, **attrs):
+    """Records an already measured stage (e.g. time to first token)."""
+    name = _stage_prefix.get() + name
+    STAGE_LATENCY.observe(ms / 1000, stage=name)
+    t = t or _current_trace.get()
+    if t is not None:
+        t.spans.append({"name": name, "ms": ms, **attrs})
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Dict[str, Any]]:
+    """
+    Times one pipeline stage: observed in `rag_stage_latency_seconds{stage=name}`
+    and appended to the active trace, if any. Yields a dict for extra attributes.
+    """
+    name = _stage_prefix.get() + name
+    record = {"name": name, **attrs}
+    start_t = time.perf_counter()
+    try:
+        yield record
+    except BaseException:
+        STAGE_ERRORS.inc(stage=name)
+        record["error"] = True
+        raise
+    finally:
+        record["ms"] = (time.perf_counter() - start_t) * 1000
+        STAGE_LATENCY.observe(record["ms"] / 1000, stage=name)
+        t = _current_trace.get()
+        if t is not None:
+            t.spans.append(record)
+
+
+def record_tokens(prompt_tokens: Optional[int], completion_tokens: Optional[int], provider: str = ""):
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, kind="prompt", provider=provider)
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, kind="completion", provider=provider)
+    t = _current_trace.get()
+    if t is not None:
+        t.attrs["prompt_tokens"] = t.attrs.get("prompt_tokens", 0) + (prompt_tokens or 0)
+        t.attrs["completion_tokens"] = t.attrs.get("completion_tokens", 0) + (completion_tokens or 0)
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process (Linux /proc; falls back to the peak)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def _write_trace(t: Trace):
+    path = _trace_log["path"]
+    if path is None:
+        return
+    line = json.dumps(t.to_dict(), ensure_ascii=False, default=str)
+    try:
+        with _trace_log["lock"]:
+            # Size-based rotation: the full file becomes <trace_log>.1 (replacing the previous one)
+            max_bytes = _trace_log["max_bytes"]
+            if max_bytes and os.path.exists(path) and os.path.getsize(path) >= max_bytes:
+                os.replace(path, f"{path}.1")
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    except OSError as e:
+        print(f"[Warning] Could not write trace log {path}: {e}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body, content_type = json.dumps(REGISTRY.snapshot()).encode(), "application/json"
+        elif self.path.startswith("/metrics"):
+            body, content_type = REGISTRY.render_prometheus().encode(), "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_http_server(port: int, host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """
+    Serves /metrics (Prometheus text) and /metrics.json on a daemon thread.
+    Unauthenticated, so it listens on localhost unless `host` says otherwise.
+    """
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        # e.g. another worker already serves this port
+        print(f"[Warning] Metrics endpoint not started on port {port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"[Info] Metrics endpoint on http://{host}:{port}/metrics")
+    return server
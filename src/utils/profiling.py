@@ -0,0 +1,320 @@
+import os
+import sys
+import time
+import atexit
+import pstats
+import argparse
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+
+from utils.paths import DATA_DIR
+
+MODES = ("cprofile", "sample")
+# Env toggle, e.g. RAG_PROFILE=sample streamlit run src/web_ui.py (1/true = default mode)
+ENV_MODE = "RAG_PROFILE"
+ENV_DIR = "RAG_PROFILE_DIR"
+ENV_MEMORY = "RAG_PROFILE_MEMORY"
+ENV_TOP = "RAG_PROFILE_TOP"
+ENV_INTERVAL = "RAG_PROFILE_INTERVAL_MS"
+ENV_FLUSH = "RAG_PROFILE_FLUSH_SEC"
+
+
+def _frame_label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+
+
+class _Sampler:
+    """Wall-clock stack sampler over all threads (sys._current_frames), as folded stacks."""
+
+    def __init__(self, interval_ms: float):
+        self.interval = interval_ms / 1000
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            frames = sys._current_frames()
+            with self._lock:
+                self.samples += 1
+                for ident, frame in frames.items():
+                    if ident == own:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_label(frame.f_code))
+                        frame = frame.f_back
+                    stack.append(names.get(ident, f"thread-{ident}"))
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stacks)
+
+
+def _pstats_to_folded(stats: pstats.Stats, max_depth: int = 64, min_sec: float = 1e-5) -> Dict[str, int]:
+    """
+    Approximate folded stacks (microseconds) from a cProfile call graph: a function's
+    time is split across its callers in proportion to the time spent on each call edge.
+    """
+    raw = stats.stats
+    callees: Dict[tuple, List[tuple]] = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    label = lambda f: f"{os.path.basename(f[0])}:{f[2]}:{f[1]}"
+    folded: Counter = Counter()
+
+    def walk(func, path, share):
+        _, _, tt, ct, _ = raw[func]
+        if ct * share < min_sec or len(path) >= max_depth:
+            return
+        path = path + [label(func)]
+        folded[";".join(path)] += int(tt * share * 1e6)
+        for callee, edge_ct in callees.get(func, []):
+            total = raw[callee][3]
+            # Recursion is folded into the first occurrence
+            if total > 0 and label(callee) not in path:
+                walk(callee, path, share * edge_ct / total)
+
+    for func, (_, _, _, _, callers) in raw.items():
+        if not callers:
+            walk(func, [], 1.0)
+    return {stack: us for stack, us in folded.items() if us > 0}
+
+
+class Profiler:
+    """
+    Profiles one pipeline stage or service and writes, into `out_dir`:
+      <name>.folded   collapsed stacks (flamegraph.pl / speedscope / inferno)
+      <name>.txt      top-N summary
+      <name>.prof     pstats dump (cProfile mode; snakeviz, `python -m pstats`)
+      <name>.mem.txt  tracemalloc top allocations (with `memory`)
+
+    Modes: "cprofile" (deterministic, calling thread only) or "sample"
+    (wall-clock sampling of all threads every `interval_ms`, low overhead, for services).
+    With `flush_sec`, a sampling profile is rewritten periodically while running.
+    """
+
+    def __init__(self, name: str, mode: str = "cprofile", out_dir: Optional[str] = None, top_n: int = 30,
+                 memory: bool = False, interval_ms: float = 5.0, flush_sec: float = 0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profile mode '{mode}' (expected one of {', '.join(MODES)})")
+        self.name = name
+        self.mode = mode
+        self.out_dir = Path(out_dir) if out_dir else DATA_DIR / "profiles"
+        self.top_n = top_n
+        self.memory = memory
+        self.interval_ms = interval_ms
+        self.flush_sec = flush_sec
+        self.prefix = f"{time.strftime('%Y%m%d-%H%M%S')}_{name}"
+        self._profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[_Sampler] = None
+        self._flusher: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._started = 0.0
+
+    def _path(self, suffix: str) -> Path:
+        return self.out_dir / f"{self.prefix}{suffix}"
+
+    def start(self) -> "Profiler":
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        if self.memory:
+            tracemalloc.start(25)
+        self._started = time.perf_counter()
+        if self.mode == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = _Sampler(self.interval_ms)
+            self._sampler.start()
+            if self.flush_sec:
+                self._flusher = threading.Thread(target=self._flush_loop, name="profile-flush", daemon=True)
+                self._flusher.start()
+        print(f"[Info] Profiling {self.name} ({self.mode}{', memory' if self.memory else ''}) -> {self.out_dir}")
+        return self
+
+    def _flush_loop(self):
+        while not self._stopped.wait(self.flush_sec):
+            self._write_sampled()
+
+    def stop(self) -> List[Path]:
+        if self._stopped.is_set():
+            return []
+        self._stopped.set()
+        elapsed = time.perf_counter() - self._started
+        written = []
+        if self._profile is not None:
+            self._profile.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+        if self._flusher is not None:
+            self._flusher.join()
+        if self.memory:
+            # Before writing the other reports, so their allocations don't show up
+            written.append(self._write_memory())
+            tracemalloc.stop()
+        if self._profile is not None:
+            written += self._write_cprofile(elapsed)
+        if self._sampler is not None:
+            written += self._write_sampled()
+        print(f"[Info] Profile written: {', '.join(p.name for p in written)}")
+        return written
+
+    def __enter__(self) -> "Profiler":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _write_folded(self, folded: Dict[str, int]) -> Path:
+        path = self._path(".folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(folded.items()):
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def _write_cprofile(self, elapsed: float) -> List[Path]:
+        prof_path = self._path(".prof")
+        self._profile.dump_stats(str(prof_path))
+        stats = pstats.Stats(str(prof_path))
+        txt_path = self._path(".txt")
+        with open(txt_path, "w", encoding="utf-8") as f:
+            f.write(f"# {self.name}: {elapsed:.2f}s wall (cProfile)\n\n")
+            for key, title in (("cumulative", "cumulative time"), ("tottime", "own time")):
+                f.write(f"## Top {self.top_n} by {title}\n")
+                stats.stream = f
+                stats.sort_stats(key).print_stats(self.top_n)
+        return [prof_path, txt_path, self._write_folded(_pstats_to_folded(stats))]
+
+    def _write_sampled(self) -> List[Path]:
+        folded = self._sampler.folded()
+        total = sum(folded.values()) or 1
+        own: Counter = Counter()
+        inclusive: Counter = Counter()
+        for stack, count in folded.items():
+            frames = stack.split(";")[1:]  # first entry is the thread name
+            if frames:
+                own[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+        txt_path = self._path(".txt")
+        with open(txt_path, "w", encoding="utf-8") as f:
+            f.write(f"# {self.name}: {self._sampler.samples} samples every {self.interval_ms:g} ms "
+                    f"({total} thread stacks)\n\n")
+            for title, counter in (("own samples (where time is spent)", own), ("inclusive samples", inclusive)):
+                f.write(f"## Top {self.top_n} by {title}\n")
+                for frame, count in counter.most_common(self.top_n):
+                    f.write(f"{count / total:7.1%} {count:8d}  {frame}\n")
+                f.write("\n")
+        return [txt_path, self._write_folded(folded)]
+
+    def _write_memory(self) -> Path:
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, __file__),
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        path = self._path(".mem.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"# {self.name}: traced current {current / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB\n\n")
+            f.write(f"## Top {self.top_n} allocation sites (live at exit)\n")
+            for stat in snapshot.statistics("lineno")[:self.top_n]:
+                f.write(f"{stat.size / 2**20:9.2f} MiB {stat.count:9d} blocks  {stat.traceback[0]}\n")
+            f.write(f"\n## Largest allocation tracebacks\n")
+            for stat in snapshot.statistics("traceback")[:5]:
+                f.write(f"\n{stat.size / 2**20:.2f} MiB in {stat.count} blocks\n")
+                f.write("\n".join(stat.traceback.format(limit=8)) + "\n")
+        return path
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    """Adds the common --profile options to an entry point's argument parser."""
+    group = parser.add_argument_group("profiling")
+    group.add_argument("--profile", nargs="?", const="cprofile", choices=MODES, default=None,
+                       help=f"Profile this run (default mode: cprofile; also enabled by ${ENV_MODE})")
+    group.add_argument("--profile-dir", default=None, help="Where to write profiles (default: next to the output)")
+    group.add_argument("--profile-memory", action="store_true", help="Also record tracemalloc allocation snapshots")
+    group.add_argument("--profile-top", type=int, default=30, help="Entries in the top-N summary")
+    group.add_argument("--profile-interval-ms", type=float, default=5.0, help="Sampling interval (sample mode)")
+
+
+def _env_mode(default: str) -> Optional[str]:
+    value = os.environ.get(ENV_MODE, "").strip().lower()
+    if value in ("", "0", "false", "no", "off"):
+        return None
+    return value if value in MODES else default
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def profiler_for(name: str, args: Optional[argparse.Namespace] = None,
+                 artifact_dir: Optional[str] = None, service: bool = False) -> Optional[Profiler]:
+    """
+    Builds a Profiler from --profile options or the RAG_PROFILE* environment, or None if off.
+    Services (threads serving requests) always use the sampling mode.
+    """
+    mode = getattr(args, "profile", None) or _env_mode("sample" if service else "cprofile")
+    if mode is None:
+        return None
+    if service and mode == "cprofile":
+        print("[Warning] cProfile only sees the calling thread; profiling the service by sampling instead.")
+        mode = "sample"
+    out_dir = getattr(args, "profile_dir", None) or os.environ.get(ENV_DIR)
+    if not out_dir:
+        out_dir = Path(artifact_dir) / "profiles" if artifact_dir else DATA_DIR / "profiles"
+    return Profiler(
+        name,
+        mode=mode,
+        out_dir=out_dir,
+        top_n=getattr(args, "profile_top", None) or int(os.environ.get(ENV_TOP, 30)),
+        memory=getattr(args, "profile_memory", False) or _env_flag(ENV_MEMORY),
+        interval_ms=float(os.environ.get(ENV_INTERVAL) or getattr(args, "profile_interval_ms", None) or 5.0),
+        flush_sec=float(os.environ.get(ENV_FLUSH, 60)) if service else 0,
+    )
+
+
+@contextmanager
+def profiled(name: str, args: Optional[argparse.Namespace] = None, artifact_dir: Optional[str] = None,
+             service: bool = False) -> Iterator[Optional[Profiler]]:
+    """Profiles the block if --profile or RAG_PROFILE asks for it; otherwise a no-op."""
+    profiler = profiler_for(name, args, artifact_dir, service)
+    if profiler is None:
+        yield None
+        return
+    with profiler:
+        yield profiler
+
+
+def start_service_profiler(name: str) -> Optional[Profiler]:
+    """For long-running services: starts sampling if RAG_PROFILE is set; flushed periodically and at exit."""
+    profiler = profiler_for(name, service=True)
+    if profiler is not None:
+        profiler.start()
+        atexit.register(profiler.stop)
+    return profiler
@@ -0,0 +1,86 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, ".."))
+
+from utils.paths import ROOT_DIR
+
+# Personal data is replaced with fixed placeholders of the same kind, so replayed
+# queries keep their shape (length, identifiers, the lexical fast path still triggers).
+_REDACTIONS = [
+    (re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"), "user@example.com"),
+    (re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}\b"), "192.0.2.1"),
+    # Access keys / tokens: long mixed letter+digit strings
+    (re.compile(r"\b(?=[A-Za-z0-9_-]*\d)(?=[A-Za-z0-9_-]*[A-Za-z])[A-Za-z0-9_-]{24,}\b"), "<secret>"),
+]
+# Phone, account and card numbers; ISO dates have the same shape but are kept (see anonymize)
+_NUMBER = re.compile(r"\+?\d[\d -]{7,}\d")
+_ISO_DATE = re.compile(r"(?<!\d)(\d{4}-\d{2}-\d{2})(?!\d)")
+
+_query_log = {"path": None, "sample_rate": 1.0, "anonymize": True, "lock": threading.Lock()}
+
+
+def configure(config: Dict):
+    """
+    Applies the `query_log` section of rag_config.yaml. Capture is opt-in
+    (`enabled: false` by default); the log is the input of benchmark/replay.py.
+    """
+    conf = config.get("query_log", {})
+    path = conf.get("path", "logs/queries.jsonl") if conf.get("enabled", False) else ""
+    if path:
+        path = Path(path) if os.path.isabs(path) else ROOT_DIR / path
+        path.parent.mkdir(parents=True, exist_ok=True)
+    _query_log["path"] = path or None
+    _query_log["sample_rate"] = conf.get("sample_rate", 1.0)
+    _query_log["anonymize"] = conf.get("anonymize", True)
+
+
+def enabled() -> bool:
+    return _query_log["path"] is not None
+
+
+def anonymize(text: str) -> str:
+    for pattern, replacement in _REDACTIONS:
+        text = pattern.sub(replacement, text)
+    # Odd pieces are the dates themselves; numbers are only looked for between them
+    pieces = _ISO_DATE.split(text)
+    return "".join(
+        piece if i % 2 else _NUMBER.sub(lambda m: re.sub(r"\d", "0", m.group(0)), piece)
+        for i, piece in enumerate(pieces)
+    )
+
+
+def record(endpoint: str, query: str, top_k: int, filters: Optional[Dict[str, Any]] = None,
+           shards: Optional[list] = None, mmr_lambda: Optional[float] = None, **extra):
+    """
+    Appends one served query: wall-clock timestamp, endpoint ("search", "answer",
+    "answer_stream", "chat") and the request options needed to replay it.
+    No user, session or client address is stored.
+    """
+    path = _query_log["path"]
+    if path is None or random.random() >= _query_log["sample_rate"]:
+        return
+    entry = {
+        "ts": time.time(),
+        "endpoint": endpoint,
+        "query": anonymize(query) if _query_log["anonymize"] else query,
+        "top_k": top_k,
+        "filters": filters or None,
+        "shards": shards or None,
+        "mmr_lambda": mmr_lambda,
+        **extra,
+    }
+    line = json.dumps(entry, ensure_ascii=False, default=str)
+    try:
+        with _query_log["lock"], open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print(f"[Warning] Could not write query log {path}: {e}")
@@ -12,11 +12,16 @@ sys.path.append(current_dir)
 # Load environment variables explicitly
 load_dotenv(os.path.join(current_dir, "../.env"))
 
-from utils.paths import DATA_DIR, CONFIG_DIR, add_src_to_path
+from utils.paths import CONFIG_DIR, add_src_to_path
 add_src_to_path()
 
-from retrieval.search_engine import SimpleRAGSearcher
+from retrieval.hot_reload import HotReloadingSearcher
+from retrieval.lexical import is_lexical_query
+from utils.dates import time_range_from_text
 from generator.generate import RAGGenerator
+from utils import metrics, query_log
+from utils.chat_history import ChatHistory
+from utils.profiling import start_service_profiler
 
 # Page Configuration
 st.set_page_config(
@@ -74,21 +79,35 @@ if not check_password():
 @st.cache_resource
 def load_rag_system():
     # Define paths using centralized config
-    index_path = DATA_DIR / "byteplus.index"
-    meta_path = DATA_DIR / "byteplus_meta.json"
     config_path = CONFIG_DIR / "rag_config.yaml"
     
     # Convert Path objects to strings for compatibility
-    searcher = SimpleRAGSearcher(str(index_path), str(meta_path))
     generator = RAGGenerator(str(config_path))
-    return searcher, generator
+    # Per-stage latency histograms and JSON traces; Prometheus endpoint on metrics.port (0 = off)
+    metrics.configure(generator.client.config)
+    # Opt-in capture of anonymised questions for workload replay (query_log.enabled)
+    query_log.configure(generator.client.config)
+    metrics_conf = generator.client.config.get("metrics", {})
+    if metrics_conf.get("port"):
+        metrics.start_http_server(metrics_conf["port"], metrics_conf.get("host", "127.0.0.1"))
+    # Spilled chat debug payloads of sessions that are gone (no session-end hook in Streamlit)
+    ChatHistory.remove_stale(generator.client.config)
+    # RAG_PROFILE=sample streamlit run src/web_ui.py: sampled profile flushed to data/profiles/
+    start_service_profiler("web_ui")
+    # Index version is resolved from data/index/CURRENT and hot-swapped on rebuild
+    reload_interval = generator.client.config.get("index", {}).get("reload_interval_sec", 10)
+    searcher_holder = HotReloadingSearcher(poll_interval=reload_interval).start()
+    return searcher_holder, generator
 
 try:
-    searcher, generator = load_rag_system()
+    searcher_holder, generator = load_rag_system()
 except Exception as e:
     st.error(f"Failed to load RAG system: {e}")
     st.stop()
 
+# Pin one searcher version for the whole script run
+searcher = searcher_holder.current
+
 # Sidebar
 with st.sidebar:
     st.title("⚙️ Configuration")
@@ -100,8 +119,18 @@ with st.sidebar:
         st.info(f"**{provider.upper()}**")
     except:
         st.warning("Unknown Provider")
+    st.caption(f"Index version: `{searcher.version}`")
         
     top_k = st.slider("Top-K Retrieval", min_value=1, max_value=10, value=3)
+    
+    # Metadata filters (applied inside the vector search)
+    block_types = st.multiselect("Block Types", searcher.filter_values("block_type"))
+    # Restrict the fan-out to some sources (empty = all shards)
+    source_shards = st.multiselect("Sources", searcher.shard_names) if len(searcher.shard_names) > 1 else []
+    auto_time_filter = st.checkbox("Filter by dates mentioned in question", value=True)
+    # MMR: trade some relevance for fewer near-duplicate blocks (1.0 = off)
+    mmr_lambda = st.slider("Diversity (MMR λ)", min_value=0.0, max_value=1.0,
+                           value=float(searcher.mmr_lambda if searcher.mmr_lambda is not None else 1.0), step=0.05)
     st.divider()
     st.markdown("### About")
     st.markdown("This is a RAG demo for BytePlus ECS documentation.")
@@ -109,31 +138,79 @@ with st.sidebar:
 # Main Chat Interface
 st.title("🤖 BytePlus ECS Assistant")
 
-# Initialize chat history
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+# Initialize chat history (bounded; sources are block_id references, old prompts spilled to disk)
+if "history" not in st.session_state:
+    st.session_state.history = ChatHistory.from_config(generator.client.config)
+history = st.session_state.history
+if "visible_messages" not in st.session_state:
+    st.session_state.visible_messages = history.visible_messages
+
+
+def render_answer_details(message):
+    """Sources (looked up from the shared metadata, not stored per message) and, on request, the prompt."""
+    with st.expander("🔍 Retrieved Context (Source Documents)"):
+        score_name = message.get("score_kind") or "Score"
+        for idx, (block_id, score) in enumerate(message["sources"]):
+            block = searcher.get_block(block_id)
+            if block is None:
+                st.markdown(f"**{idx+1}.** `{block_id}` ({score_name}: {score:.4f}) · from index version "
+                            f"`{message['index_version']}`, no longer in `{searcher.version}`")
+                continue
+            source = block.get("source_meta", {})
+            st.markdown(f"**{idx+1}. [{source.get('title', 'Unknown')}]({source.get('url', '#')})** ({score_name}: {score:.4f})")
+            st.caption(block.get("content", "")[:300] + "...")
+    if message.get("debug") and st.checkbox("Show prompt", key=f"show_prompt_{message['id']}"):
+        # Read back (from disk for older turns) only when asked for
+        payload = history.debug(message) or {}
+        st.json(payload.get("final_messages", []))
+
+
+def score_kind(trace, lexical: bool, rewrites) -> str:
+    """
+    What the final result scores are, from the stages that ran: BM25, RRF fusion rank
+    scores (~0.016-0.033), cross-encoder logits or cosine similarity. Only comparable within one answer.
+    """
+    if lexical:
+        return "BM25"
+    if rewrites:
+        return "RRF"
+    reranks = [s for s in trace.spans if s["name"] == "rerank"]
+    if reranks and not reranks[-1].get("fallback"):
+        return "Rerank"
+    if any(s["name"] == "lexical_search" for s in trace.spans):
+        return "RRF"
+    return "Cosine"
 
-# Display chat messages from history on app rerun
-for message in st.session_state.messages:
+
+def show_earlier_messages():
+    # Never more than the kept history, so rendering stays bounded too
+    st.session_state.visible_messages = min(st.session_state.visible_messages + history.visible_messages,
+                                            history.max_messages)
+
+
+# Display chat messages from history on app rerun (only the newest ones)
+hidden = len(history) - len(history.visible(st.session_state.visible_messages))
+if hidden:
+    st.button(f"Show earlier messages ({hidden} more)", on_click=show_earlier_messages)
+for message in history.visible(st.session_state.visible_messages):
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
-        # If there are sources in the message metadata, display them
-        if "sources" in message:
-            with st.expander("🔍 Retrieved Context (Source Documents)"):
-                for idx, source in enumerate(message["sources"]):
-                    url = source.get("url", "#")
-                    st.markdown(f"**{idx+1}. [{source['title']}]({url})** (Score: {source['score']:.4f})")
-                    st.caption(source['content'][:300] + "...")
+        if message["role"] == "assistant":
+            render_answer_details(message)
 
 # Accept user input
 if prompt := st.chat_input("Ask a question about ECS..."):
-    # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    # Add user message to chat history; a new question collapses the view to the newest messages again
+    history.add_user(prompt)
+    st.session_state.visible_messages = history.visible_messages
     
     # Display user message in chat message container
     with st.chat_message("user"):
         st.markdown(prompt)
 
+    # One trace per question: stage spans, token counts, appended to the trace log
+    chat_trace = metrics.start_trace("chat", index_version=searcher.version)
+
     # Display assistant response in chat message container
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
@@ -142,33 +219,74 @@ if prompt := st.chat_input("Ask a question about ECS..."):
         with st.status("Thinking...", expanded=False) as status:
             st.write("Searching knowledge base...")
             start_t = time.time()
-            results = searcher.search(prompt, top_k=top_k)
+            filters = {}
+            if block_types:
+                filters["block_type"] = block_types
+            query_log.record("chat", prompt, top_k, dict(filters), source_shards or None, mmr_lambda,
+                             auto_time_filter=auto_time_filter, stream=True)
+            time_range = time_range_from_text(prompt) if auto_time_filter else None
+            if time_range:
+                filters["time_from"], filters["time_to"] = time_range
+            shards = source_shards or None
+
+            def retrieve(filters):
+                # Identifier-only questions are answered from the BM25 index without encoding
+                lexical = searcher.lexical_lookup(prompt, top_k=top_k, filters=filters, shards=shards)
+                if lexical is not None:
+                    return lexical, None
+                # Encode once; the vector is reused as the answer cache key
+                vector = searcher.embedder.encode(prompt)
+                return searcher.search_vector(vector, top_k=top_k, filters=filters, shards=shards,
+                                              mmr_lambda=mmr_lambda, query_text=prompt), vector
+
+            # Expansion / translation runs on the LLM while the original query is searched
+            # (identifier lookups are skipped; they are answered from BM25 directly)
+            pending_rewrite = None
+            if generator.rewriter and not (searcher.lexical_fast_path and is_lexical_query(prompt)):
+                pending_rewrite = generator.rewriter.submit(prompt)
+            results, query_vector = retrieve(filters)
+            if not results and time_range:
+                # Detected date matched nothing; fall back to the unrestricted search
+                filters.pop("time_from")
+                filters.pop("time_to")
+                results, query_vector = retrieve(filters)
+            rewrites = []
+            if pending_rewrite is not None and query_vector is not None:
+                # Waits at most what is left of deadline_ms after the original retrieval;
+                # a later rewrite is cached for the next ask
+                rewrites = generator.rewriter.wait(pending_rewrite)
+                results = searcher.search_rewrites(results, rewrites, top_k=top_k, filters=filters,
+                                                   shards=shards, mmr_lambda=mmr_lambda)
             retrieve_time = (time.time() - start_t) * 1000 # ms
-            st.write(f"Found {len(results)} documents in {retrieve_time:.0f}ms.")
+            # Compared against the shadow candidate index in the background (if enabled)
+            searcher.mirror(prompt, results, top_k, filters, shards, mmr_lambda, rewrites, latency_ms=retrieve_time)
+            mode = "lexical fast path" if query_vector is None else "hybrid"
+            score_name = score_kind(chat_trace, query_vector is None, rewrites)
+            st.write(f"Found {len(results)} documents in {retrieve_time:.0f}ms ({mode}).")
+            for rewrite in rewrites:
+                st.write(f"Also searched: _{rewrite}_")
             
-            # 2. Generation
             st.write("Generating answer...")
-            start_t = time.time()
-            response = generator.answer(prompt, results)
-            gen_time = (time.time() - start_t) * 1000 # ms
-            
-            answer = response["answer"]
-            debug_info = response["debug"]
             
-            status.update(label=f"Done! (Total: {(retrieve_time + gen_time):.0f}ms)", state="complete", expanded=False)
+        # 2. Generation (streamed into the placeholder as tokens arrive)
+        start_t = time.time()
+        stream = generator.answer_stream(prompt, results, query_vector=query_vector, index_version=searcher.version)
+        answer = ""
+        for delta in stream:
+            answer += delta
+            message_placeholder.markdown(answer + "▌")
+        gen_time = (time.time() - start_t) * 1000 # ms
+        
+        debug_info = stream.debug
+        ttft = debug_info.get("ttft_ms") or 0.0
+        cache_note = " (cached answer)" if debug_info.get("cache_hit") else ""
+        
+        status.update(label=f"Done! (Total: {(retrieve_time + gen_time):.0f}ms, first token: {ttft:.0f}ms){cache_note}", state="complete", expanded=False)
             
         message_placeholder.markdown(answer)
+        chat_trace.attrs.update({"mode": mode, "results": len(results), "cache_hit": debug_info.get("cache_hit", False)})
+        metrics.finish_trace(chat_trace)
         
-        # Prepare sources for history (Simplified for display)
-        sources_meta = []
-        for res in results:
-            sources_meta.append({
-                "title": res.get("source_meta", {}).get("title", "Unknown"),
-                "url": res.get("source_meta", {}).get("url", "#"),
-                "score": res.get("score", 0.0),
-                "content": res.get("content", "")
-            })
-            
         # ---------------------------------------------------------
         # P1: Enhanced Debug Console
         # ---------------------------------------------------------
@@ -177,36 +295,104 @@ if prompt := st.chat_input("Ask a question about ECS..."):
             
             # Tab 1: Retrieval
             with tab1:
-                st.caption(f"Top-{len(results)} Retrieved Chunks")
+                st.caption(f"Top-{len(results)} Retrieved Chunks · {score_name} scores (comparable within this answer only)")
                 for idx, res in enumerate(results):
                     with st.container():
                         col1, col2 = st.columns([1, 4])
                         with col1:
-                            st.metric(f"Rank {idx+1}", f"{res.get('score', 0.0):.4f}")
+                            st.metric(f"Rank {idx+1} · {score_name}", f"{res.score:.4f}")
                         with col2:
-                            source = res.get('source_meta', {})
+                            source = res.source_meta
                             st.markdown(f"**Source:** [{source.get('title', 'Untitled')}]({source.get('url', '#')})")
-                            st.markdown(f"**Block ID:** `{res.get('block_id', 'N/A')}`")
+                            st.markdown(f"**Block ID:** `{res.block_id or 'N/A'}`")
                             with st.expander("Show Content", expanded=False):
-                                st.code(res.get('content', ''), language='text')
+                                st.code(res.content, language='text')
                         st.divider()
             
             # Tab 2: Prompt
             with tab2:
+                context_stats = debug_info.get("context", {})
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Prompt Tokens", context_stats.get("prompt_tokens", 0))
+                col2.metric("Context Tokens", f"{context_stats.get('context_tokens', 0)} / {context_stats.get('token_budget', '∞')}")
+                col3.metric("Chunks Packed", f"{context_stats.get('packed_chunks', len(results))} / {len(results)}")
+                if "input_context_tokens" in context_stats:
+                    st.caption(
+                        f"Raw retrieved context: {context_stats['input_context_tokens']} tokens · "
+                        f"merged {context_stats['merged_chunks']}, trimmed {context_stats['trimmed_chunks']}, "
+                        f"dropped {context_stats['dropped_chunks']}"
+                    )
                 st.caption("Final messages sent to LLM")
                 st.json(debug_info.get("final_messages", []))
                 
             # Tab 3: Stats
             with tab3:
-                col1, col2, col3 = st.columns(3)
+                col1, col2, col3, col4 = st.columns(4)
                 col1.metric("Retrieval Latency", f"{retrieve_time:.0f} ms")
-                col2.metric("Generation Latency", f"{gen_time:.0f} ms")
-                col3.metric("Total Latency", f"{(retrieve_time + gen_time):.0f} ms")
-
-    # Add assistant message to chat history
-    st.session_state.messages.append({
-        "role": "assistant", 
-        "content": answer,
-        "sources": sources_meta,
-        "debug": debug_info # Store debug info in history too
-    })
+                col2.metric("Time to First Token", f"{ttft:.0f} ms")
+                col3.metric("Generation Latency", f"{gen_time:.0f} ms")
+                col4.metric("Total Latency", f"{(retrieve_time + gen_time):.0f} ms")
+                sched_stats = generator.scheduler.stats()
+                col1, col2, col3 = st.columns(3)
+                col1.metric("LLM In-Flight", f"{sched_stats['in_flight']}/{sched_stats['max_in_flight']}")
+                col2.metric("Queue Wait p95", f"{sched_stats['queue_wait_p95_ms']:.0f} ms")
+                col3.metric("Rejected / Timed Out", f"{sched_stats['rejected']} / {sched_stats['timed_out']}")
+                if debug_info.get("degraded"):
+                    st.warning(f"LLM call skipped under load: {debug_info['degraded']}")
+                usage = debug_info.get("usage", {})
+                usage_stats = generator.accountant.stats()
+                currency = usage_stats["currency"]
+                estimated = " (est.)" if usage.get("estimated") else ""
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("Tokens In / Out" + estimated, f"{usage.get('prompt_tokens', 0)} / {usage.get('completion_tokens', 0)}")
+                col2.metric("Request Cost", f"{usage.get('cost', 0.0):.4f} {currency}")
+                col3.metric("Cost 1h / 24h", f"{usage_stats.get('cost_1h', 0.0):.2f} / {usage_stats.get('cost_24h', 0.0):.2f}")
+                col4.metric("Budget Used", f"{usage_stats['budget_pressure']:.0%}")
+                budget = debug_info.get("budget", {})
+                if budget.get("scale", 1.0) < 1.0:
+                    st.warning(
+                        f"Usage budget {budget['pressure']:.0%} used: max_tokens capped to {budget['max_tokens']}, "
+                        f"context budget to {budget['context_token_budget'] or '∞'} tokens"
+                    )
+                if usage_stats["providers"]:
+                    st.caption("Token usage by provider (since start)")
+                    st.dataframe(
+                        [{"provider": name, **totals} for name, totals in usage_stats["providers"].items()],
+                        hide_index=True,
+                    )
+                if generator.cache is not None:
+                    cache_stats = generator.cache.stats()
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("Answer Cache", "HIT" if debug_info.get("cache_hit") else "MISS")
+                    col2.metric("Cache Hit Rate", f"{cache_stats['hit_rate']:.0%}")
+                    col3.metric("Cached Answers", cache_stats["size"])
+                if generator.rewriter is not None:
+                    rewrite_stats = generator.rewriter.stats()
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("Query Rewrites", len(rewrites))
+                    col2.metric("Rewrite Cache Hits", f"{rewrite_stats['cache_hits']} / {rewrite_stats['requests']}")
+                    col3.metric("Rewrites Late / Failed", f"{rewrite_stats['late']} / {rewrite_stats['failed']}")
+                if searcher.reranker is not None:
+                    rerank_stats = searcher.reranker.stats()
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("Rerank p95", f"{rerank_stats['latency_p95_ms']:.0f} ms")
+                    col2.metric("Rerank Fallbacks", f"{rerank_stats['fallbacks']} / {rerank_stats['queries']}")
+                    col3.metric("Rerank Cache Hits", rerank_stats["cache_hits"])
+                if searcher.shadow is not None and searcher.shadow.ready:
+                    shadow_stats = searcher.shadow.stats()
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("Shadow Overlap@k", f"{shadow_stats['overlap_at_k']:.0%}",
+                                help=f"Candidate index {searcher.shadow.version}, model {searcher.shadow.model_name}")
+                    col2.metric("Shadow p95 vs Production p95",
+                                f"{shadow_stats['latency_p95_ms']:.0f} / {shadow_stats['production_p95_ms']:.0f} ms")
+                    col3.metric("Shadow Compared / Dropped", f"{shadow_stats['compared']} / {shadow_stats['dropped']}")
+                stage_ms = chat_trace.stage_ms()
+                if stage_ms:
+                    st.caption(f"Stage breakdown (trace `{chat_trace.trace_id}`)")
+                    st.dataframe(
+                        [{"stage": name, "ms": round(ms, 1)} for name, ms in sorted(stage_ms.items(), key=lambda kv: -kv[1])],
+                        hide_index=True,
+                    )
+
+    # Add assistant message to chat history (the full prompt stays in memory for the newest answers only)
+    history.add_assistant(answer, results, debug_info, index_version=searcher.version, score_kind=score_name)
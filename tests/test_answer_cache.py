@@ -0,0 +1,70 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from generator import answer_cache
+from generator.answer_cache import SemanticAnswerCache
+
+
+def _unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+Q = _unit(1, 0, 0)
+NEAR = _unit(1, 0.1, 0)   # cosine ~0.995
+FAR = _unit(1, 1, 0)      # cosine ~0.71
+
+
+def test_similarity_threshold():
+    cache = SemanticAnswerCache(similarity_threshold=0.95)
+    cache.store(Q, ["b1", "b2"], "v1", "answer")
+    assert cache.lookup(NEAR, ["b2", "b1"], "v1") == "answer"
+    assert cache.lookup(FAR, ["b1", "b2"], "v1") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_block_ids_must_match():
+    cache = SemanticAnswerCache()
+    cache.store(Q, ["b1", "b2"], "v1", "answer")
+    assert cache.lookup(Q, ["b1"], "v1") is None
+    assert cache.lookup(Q, ["b1", "b3"], "v1") is None
+
+
+def test_entries_are_kept_per_index_version():
+    cache = SemanticAnswerCache()
+    cache.store(Q, ["b1"], "v1", "old answer")
+    cache.store(Q, ["b1"], "v2", "new answer")
+    assert cache.lookup(Q, ["b1"], "v2") == "new answer"
+    # A searcher still on the previous version keeps its entries
+    assert cache.lookup(Q, ["b1"], "v1") == "old answer"
+    assert cache.lookup(Q, ["b1"], "v3") is None
+    assert cache.stats()["size"] == 2
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = SemanticAnswerCache(ttl_sec=60)
+    cache.store(Q, ["b1"], "v1", "answer")
+    now[0] += 30
+    assert cache.lookup(Q, ["b1"], "v1") == "answer"
+    now[0] += 31
+    assert cache.lookup(Q, ["b1"], "v1") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_lru_eviction():
+    cache = SemanticAnswerCache(max_entries=2)
+    cache.store(_unit(1, 0, 0), ["a"], "v1", "A")
+    cache.store(_unit(0, 1, 0), ["b"], "v1", "B")
+    # Touching A makes B the least recently used
+    assert cache.lookup(_unit(1, 0, 0), ["a"], "v1") == "A"
+    cache.store(_unit(0, 0, 1), ["c"], "v1", "C")
+    assert cache.lookup(_unit(0, 1, 0), ["b"], "v1") is None
+    assert cache.lookup(_unit(1, 0, 0), ["a"], "v1") == "A"
+    assert cache.lookup(_unit(0, 0, 1), ["c"], "v1") == "C"
+    assert cache.stats()["evictions"] == 1
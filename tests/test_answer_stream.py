@@ -0,0 +1,92 @@
+import asyncio
+import os
+import sys
+
+import numpy as np
+import pytest
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from generator.generate import RAGGenerator
+
+
+class _FakeAsyncClient:
+    """Async client stand-in: yields `parts`, then raises `error` if given."""
+
+    def __init__(self, parts, error=None):
+        self.parts = parts
+        self.error = error
+
+    async def generate_stream(self, messages, max_tokens=None, usage=None):
+        for part in self.parts:
+            yield part
+        if self.error is not None:
+            raise self.error
+
+
+@pytest.fixture
+def generator(tmp_path, monkeypatch):
+    # Test-local config: independent of what rag_config.yaml enables
+    monkeypatch.setenv("TEST_LLM_API_KEY", "test-key")
+    config = {
+        "provider": "test",
+        "test": {"api_key_env": "TEST_LLM_API_KEY", "base_url": "http://127.0.0.1:9/v1", "model": "test"},
+        "answer_cache": {"enabled": True, "similarity_threshold": 0.95},
+    }
+    path = tmp_path / "rag_config.yaml"
+    path.write_text(yaml.safe_dump(config), encoding="utf-8")
+    return RAGGenerator(str(path))
+
+
+CHUNKS = [{"content": "Resize an instance from the console.", "block_id": "b1",
+           "source_meta": {"title": "Resize", "url": "https://example.com/resize"}}]
+
+
+def _ask(gen, vector):
+    stream = gen.answer_stream("How do I resize?", CHUNKS, query_vector=vector, index_version="v1")
+    text = "".join(stream)
+    return text, stream.debug
+
+
+def test_failed_stream_is_not_cached(generator):
+    vector = np.ones((1, 8), dtype=np.float32) / np.sqrt(8)
+    generator._loop_client = _FakeAsyncClient(["The answer is ", "partially"], ConnectionError("connection reset"))
+    text, debug = _ask(generator, vector)
+    assert text == "The answer is partiallyError calling LLM: connection reset"
+    assert debug["error"] == "connection reset"
+
+    generator._loop_client = _FakeAsyncClient(["Full ", "answer."])
+    text, debug = _ask(generator, vector)
+    assert debug["cache_hit"] is False
+    assert text == "Full answer."
+
+
+def test_completed_stream_is_cached(generator):
+    vector = np.full((1, 8), -1.0, dtype=np.float32) / np.sqrt(8)
+    generator._loop_client = _FakeAsyncClient(["Full ", "answer."])
+    _ask(generator, vector)
+    text, debug = _ask(generator, vector)
+    assert debug["cache_hit"] is True
+    assert text == "Full answer."
+
+
+async def _ask_async(gen, vector):
+    stream = await gen.answer_stream_async("How do I resize?", CHUNKS, query_vector=vector, index_version="v1")
+    text = "".join([delta async for delta in stream])
+    return text, stream.debug
+
+
+def test_failed_async_stream_is_not_cached(generator):
+    vector = np.eye(1, 8, 3, dtype=np.float32)
+    generator._async_client = _FakeAsyncClient(["The answer is ", "partially"], ConnectionError("connection reset"))
+    text, debug = asyncio.run(_ask_async(generator, vector))
+    assert text == "The answer is partiallyError calling LLM: connection reset"
+    assert debug["error"] == "connection reset"
+
+    generator._async_client = _FakeAsyncClient(["Full ", "answer."])
+    text, debug = asyncio.run(_ask_async(generator, vector))
+    assert debug["cache_hit"] is False
+    assert text == "Full answer."
+    text, debug = asyncio.run(_ask_async(generator, vector))
+    assert debug["cache_hit"] is True
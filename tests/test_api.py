@@ -0,0 +1,68 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+# The API module loads the search stack (sentence-transformers, FAISS)
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("faiss")
+from fastapi.testclient import TestClient
+
+from serving import api
+
+
+class _Embedder:
+    def encode(self, texts):
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+
+class _Searcher:
+    embedder = _Embedder()
+
+    def plan(self, top_k, mmr_lambda):
+        return {"fetch_k": top_k}
+
+    def first_stage(self, vectors, fetch_k, filters, shards):
+        if filters and any(isinstance(v, list) and v and isinstance(v[0], list) for v in filters.values()):
+            raise TypeError("unhashable type: 'list'")
+        return [[f"hit-{i}"] for i in range(len(vectors))]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # No lifespan: requests are rejected or answered before any model is needed
+    monkeypatch.setitem(api._state, "api_token", "")
+    return TestClient(api.app)
+
+
+@pytest.mark.parametrize("body", [
+    {"query": "resize", "top_k": 0},
+    {"query": "resize", "top_k": api.MAX_TOP_K + 1},
+    {"query": "resize", "mmr_lambda": 1.5},
+    {"query": "resize", "mmr_lambda": -0.1},
+    {"query": ""},
+])
+def test_out_of_range_fields_are_rejected(client, body):
+    assert client.post("/search", json=body).status_code == 400
+
+
+def test_bearer_token_is_required_when_configured(client, monkeypatch):
+    monkeypatch.setitem(api._state, "api_token", "s3cret")
+    assert client.post("/search", json={"query": "resize"}).status_code == 401
+    response = client.post("/search", json={"query": "resize", "top_k": 0},
+                           headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 400
+
+
+def test_bad_filter_only_fails_its_own_group(monkeypatch):
+    monkeypatch.setitem(api._state, "holder", type("Holder", (), {"current": _Searcher()})())
+    items = [
+        {"query": "a", "top_k": 3, "filters": {"block_type": [["x"]]}, "shards": None, "mmr_lambda": None},
+        {"query": "b", "top_k": 3, "filters": None, "shards": None, "mmr_lambda": None},
+    ]
+    (_, _, bad, _), (_, _, good, _) = api._encode_and_search(items)
+    assert isinstance(bad, TypeError)
+    assert good == ["hit-0"]
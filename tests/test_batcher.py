@@ -0,0 +1,92 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from serving.batcher import MicroBatcher
+
+
+def test_concurrent_requests_share_a_batch():
+    calls = []
+
+    def double(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    async def main():
+        batcher = MicroBatcher(double, max_batch_size=8, max_wait_ms=50)
+        batcher.start()
+        try:
+            return await asyncio.gather(*[batcher.submit(i) for i in range(5)]), batcher.stats()
+        finally:
+            await batcher.stop()
+
+    results, stats = asyncio.run(main())
+    assert results == [0, 2, 4, 6, 8]
+    assert calls == [[0, 1, 2, 3, 4]]
+    assert stats["batches"] == 1 and stats["items"] == 5
+
+
+def test_batches_are_capped_at_max_batch_size():
+    sizes = []
+
+    def echo(items):
+        sizes.append(len(items))
+        return items
+
+    async def main():
+        batcher = MicroBatcher(echo, max_batch_size=3, max_wait_ms=50)
+        try:
+            return await asyncio.gather(*[batcher.submit(i) for i in range(7)])
+        finally:
+            await batcher.stop()
+
+    assert asyncio.run(main()) == list(range(7))
+    assert max(sizes) <= 3 and sum(sizes) == 7
+
+
+def test_per_item_errors_stay_with_their_request():
+    # The batch function returns exceptions for bad items (as api._encode_and_search does)
+    def parse(items):
+        return [ValueError(item) if item == "bad" else item.upper() for item in items]
+
+    async def submit(batcher, item):
+        result = await batcher.submit(item)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def main():
+        batcher = MicroBatcher(parse, max_batch_size=8, max_wait_ms=50)
+        try:
+            return await asyncio.gather(*[submit(batcher, i) for i in ("a", "bad", "c")], return_exceptions=True)
+        finally:
+            await batcher.stop()
+
+    ok1, bad, ok2 = asyncio.run(main())
+    assert (ok1, ok2) == ("A", "C")
+    assert isinstance(bad, ValueError)
+
+
+def test_failing_batch_fails_its_requests_only():
+    def flaky(items):
+        if "boom" in items:
+            raise RuntimeError("batch failed")
+        return items
+
+    async def main():
+        batcher = MicroBatcher(flaky, max_batch_size=8, max_wait_ms=20)
+        try:
+            with pytest.raises(RuntimeError):
+                await batcher.submit("boom")
+            # The collector keeps running after a failed batch
+            return await batcher.submit("next"), batcher.stats()
+        finally:
+            await batcher.stop()
+
+    result, stats = asyncio.run(main())
+    assert result == "next"
+    assert stats["errors"] == 1
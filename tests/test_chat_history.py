@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from utils.chat_history import ChatHistory
+
+RESULTS = [SimpleNamespace(block_id="b1", score=0.91234567)]
+
+
+def _debug(question):
+    return {"ttft_ms": 12.0, "cache_hit": False,
+            "final_messages": [{"role": "user", "content": f"{question} (ops@corp.example)"}]}
+
+
+def _turn(history, i):
+    history.add_user(f"question {i}")
+    return history.add_assistant(f"answer {i}", RESULTS, debug=_debug(f"question {i}"), index_version="v1")
+
+
+def test_oldest_messages_are_dropped():
+    history = ChatHistory(max_messages=4, visible_messages=3)
+    for i in range(5):
+        _turn(history, i)
+    assert len(history) == 4
+    assert [m["content"] for m in history.messages] == ["question 3", "answer 3", "question 4", "answer 4"]
+    assert [m["content"] for m in history.visible()] == ["answer 3", "question 4", "answer 4"]
+    assert history.visible(0) == []
+
+
+def test_sources_and_stats_are_compact():
+    history = ChatHistory()
+    message = _turn(history, 0)
+    assert message["sources"] == [("b1", 0.9123)]
+    assert message["stats"] == {"ttft_ms": 12.0, "cache_hit": False}
+
+
+def test_older_debug_payloads_are_spilled_anonymised(tmp_path):
+    history = ChatHistory(debug_in_memory=1, spill_dir=tmp_path, session_id="s1")
+    first, second = _turn(history, 0), _turn(history, 1)
+    assert first["debug"] == "spilled" and second["debug"] == "memory"
+    assert (tmp_path / "s1" / f"{first['id']}.json").exists()
+    spilled = history.debug(first)
+    assert spilled["final_messages"][0]["content"] == "question 0 (user@example.com)"
+    # The newest payload stays in memory, unredacted
+    assert history.debug(second)["final_messages"][0]["content"] == "question 1 (ops@corp.example)"
+
+
+def test_without_spill_dir_older_payloads_are_dropped():
+    history = ChatHistory(debug_in_memory=1)
+    first, second = _turn(history, 0), _turn(history, 1)
+    assert first["debug"] is None and history.debug(first) is None
+    assert history.debug(second) is not None
+
+
+def test_dropped_messages_and_clear_remove_spilled_files(tmp_path):
+    history = ChatHistory(max_messages=2, debug_in_memory=0, spill_dir=tmp_path, session_id="s1")
+    first = _turn(history, 0)
+    path = tmp_path / "s1" / f"{first['id']}.json"
+    assert path.exists()
+    _turn(history, 1)
+    assert not path.exists()
+    history.clear()
+    assert len(history) == 0 and not (tmp_path / "s1").exists()
+
+
+def test_remove_stale_sessions(tmp_path):
+    (tmp_path / "old").mkdir()
+    (tmp_path / "new").mkdir()
+    day_ago = time.time() - 25 * 3600
+    os.utime(tmp_path / "old", (day_ago, day_ago))
+    config = {"chat_history": {"spill_dir": str(tmp_path), "spill_ttl_hours": 24}}
+    assert ChatHistory.remove_stale(config) == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["new"]
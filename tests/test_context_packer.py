@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from generator.context_packer import count_tokens, pack_context, trim_to_relevant
+
+
+def _chunk(block_id, score, content):
+    return {"block_id": block_id, "score": score, "content": content,
+            "source_meta": {"title": block_id, "url": f"https://example.com/{block_id}"}}
+
+
+def test_pack_context_keeps_retrieval_order():
+    # MMR picked the diverse b3 over the near-duplicate b2, so scores are not descending
+    chunks = [_chunk("b1", 0.9, "Resize an instance."), _chunk("b3", 0.5, "Billing changes after resizing."),
+              _chunk("b2", 0.8, "Resize an instance type.")]
+    packed, stats = pack_context("How do I resize?", chunks, token_budget=1000)
+    assert [c["block_id"] for c in packed] == ["b1", "b3", "b2"]
+    assert stats["packed_chunks"] == 3
+
+
+def test_trim_to_relevant_cuts_cjk_to_token_budget():
+    # One unpunctuated CJK sentence: the hard cut must respect tokens, not characters
+    content = "调整实例规格" * 200
+    trimmed = trim_to_relevant(content, "如何调整实例规格", 50)
+    assert 0 < count_tokens(trimmed) <= 50
+    assert content.startswith(trimmed)
@@ -0,0 +1,109 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from retrieval.filters import MetadataFilterIndex
+from utils.dates import normalize_time, time_range_from_text
+
+BLOCKS = [
+    {"block_id": "b0", "block_type": "release_version", "product": "ecs", "time": "October 21, 2025"},
+    {"block_id": "b1", "block_type": "faq", "product": "ecs", "time": "2025-10-31"},
+    {"block_id": "b2", "block_type": "release_version", "product": "rds", "time": "2025年11月1日"},
+    None,  # tombstoned by an incremental update
+    {"block_id": "b4", "block_type": "faq", "product": "rds"},
+    {"block_id": "b5", "block_type": "release_version", "product": "ecs", "time_iso": "2025-09-30"},
+]
+
+
+@pytest.mark.parametrize("value, end, expected", [
+    ("October 21, 2025", False, "2025-10-21"),
+    ("October 2025", False, "2025-10-01"),
+    ("October 2025", True, "2025-10-31"),
+    ("2024/2", True, "2024-02-29"),
+    ("2025年10月", True, "2025-10-31"),
+    ("no date here", False, None),
+    ("2025-13-01", False, None),
+])
+def test_normalize_time(value, end, expected):
+    assert normalize_time(value, end=end) == expected
+
+
+def test_time_range_from_text():
+    assert time_range_from_text("What changed in October 2025?") == ("2025-10-01", "2025-10-31")
+    assert time_range_from_text("How do I resize?") is None
+
+
+def test_no_filters_means_whole_index():
+    index = MetadataFilterIndex(BLOCKS)
+    assert index.candidates(None) is None
+    assert index.candidates({}) is None
+
+
+def test_categorical_filters_intersect():
+    index = MetadataFilterIndex(BLOCKS)
+    assert index.candidates({"block_type": "faq"}).tolist() == [1, 4]
+    assert index.candidates({"product": ["rds", "ecs"]}).tolist() == [0, 1, 2, 4, 5]
+    assert index.candidates({"block_type": "release_version", "product": "ecs"}).tolist() == [0, 5]
+    assert index.values("product") == ["ecs", "rds"]
+
+
+def test_time_bounds_are_inclusive():
+    index = MetadataFilterIndex(BLOCKS)
+    assert index.candidates({"time_from": "2025-10-21", "time_to": "2025-10-31"}).tolist() == [0, 1]
+    # Month bounds cover the whole month on both ends
+    assert index.candidates({"time_from": "October 2025", "time_to": "October 2025"}).tolist() == [0, 1]
+    assert index.candidates({"time_from": "2025-11-01"}).tolist() == [2]
+    assert index.candidates({"time_to": "2025-09-30"}).tolist() == [5]
+
+
+def test_empty_candidate_sets():
+    index = MetadataFilterIndex(BLOCKS)
+    assert index.candidates({"product": "vpc"}).tolist() == []
+    assert index.candidates({"time_from": "2025-11-02", "time_to": "2025-10-01"}).tolist() == []
+    assert index.candidates({"block_type": "faq", "time_from": "2025-11-01"}).tolist() == []
+    with pytest.raises(ValueError):
+        index.candidates({"time_from": "someday"})
+
+
+@pytest.fixture
+def shard(tmp_path):
+    pytest.importorskip("sentence_transformers")
+    faiss = pytest.importorskip("faiss")
+    from retrieval.search_engine import IndexShard
+
+    vectors = np.eye(len(BLOCKS), 8, dtype=np.float32)
+    # Position 1 is closest to the query, then 0, 2, 5
+    query = np.array([[0.5, 0.9, 0.3, 0, 0, 0.2, 0, 0]], dtype=np.float32)
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(8))
+    live = [pos for pos, b in enumerate(BLOCKS) if b is not None]
+    index.add_with_ids(vectors[live], np.asarray(live, dtype=np.int64))
+    index_file, meta_file = tmp_path / "byteplus.index", tmp_path / "byteplus_meta.json"
+    faiss.write_index(index, str(index_file))
+    meta_file.write_text(json.dumps(BLOCKS), encoding="utf-8")
+    return IndexShard("docs", str(index_file), str(meta_file)), query
+
+
+def test_search_subset_ranks_only_candidates(shard):
+    shard, query = shard
+    scores, ids = shard._search_subset(query, np.array([0, 2, 5], dtype=np.int64), top_k=2)
+    assert ids[0].tolist() == [0, 2]
+    assert scores[0][0] >= scores[0][1]
+
+
+def test_search_subset_empty_candidates(shard):
+    shard, query = shard
+    scores, ids = shard._search_subset(query, np.empty(0, dtype=np.int64), top_k=3)
+    assert ids.shape == (1, 0) and scores.shape == (1, 0)
+
+
+def test_filtered_search_returns_only_matching_rows(shard):
+    shard, query = shard
+    results = shard.search_vector(query, top_k=5, filters={"block_type": "release_version"})
+    assert [r.block_id for r in results] == ["b0", "b2", "b5"]
+    assert shard.search_vector(query, top_k=5, filters={"product": "vpc"}) == []
+    assert [r.block_id for r in shard.search_vector(query, top_k=1)] == ["b1"]
@@ -0,0 +1,163 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from retrieval import index_store
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    root = tmp_path / "index"
+    monkeypatch.setattr(index_store, "INDEX_ROOT", root)
+    monkeypatch.setattr(index_store, "VERSIONS_DIR", root / "versions")
+    monkeypatch.setattr(index_store, "CURRENT_FILE", root / "CURRENT")
+    root.mkdir()
+    return index_store
+
+
+def make_version(store, model_name=None, shards=("docs",)):
+    version_dir = store.new_version_dir()
+    for name in shards:
+        index_file, meta_file = store.artifact_paths(store.shard_dir(version_dir, name))
+        for path in (index_file, meta_file):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("x")
+    if model_name:
+        store.write_model(version_dir, model_name)
+    return version_dir
+
+
+def test_publish_swaps_current_atomically(store, monkeypatch):
+    first, second = make_version(store), make_version(store)
+    store.publish(first)
+    assert store.current_version() == first.name
+    assert store.current_shard_paths()[1] == first.name
+
+    def failing_replace(src, dst):
+        raise OSError("disk full")
+
+    # Readers see either the old or the new pointer, never a partial write
+    with monkeypatch.context() as patched:
+        patched.setattr(store.os, "replace", failing_replace)
+        with pytest.raises(OSError):
+            store.publish(second)
+    assert store.current_version() == first.name
+    store.publish(second)
+    assert store.current_version() == second.name
+    assert not store.CURRENT_FILE.with_suffix(".tmp").exists()
+
+
+def test_publish_refuses_incomplete_version(store):
+    live = make_version(store)
+    store.publish(live)
+    broken = make_version(store)
+    os.remove(store.shard_paths(broken)["docs"][1])
+    with pytest.raises(FileNotFoundError):
+        store.publish(broken)
+    with pytest.raises(FileNotFoundError):
+        store.publish(store.new_version_dir())
+    assert store.current_version() == live.name
+
+
+def test_gc_keeps_live_and_marked_versions(store):
+    versions = [make_version(store) for _ in range(6)]
+    store.publish(versions[0])
+    store.keep(versions[2])
+    removed = store.gc_versions(keep=2)
+    assert removed == [versions[1].name, versions[3].name]
+    assert store.list_versions() == [versions[0].name, versions[2].name, versions[4].name, versions[5].name]
+
+
+def test_link_shard_carries_artifacts_over(store):
+    live = make_version(store, shards=("docs", "faq"))
+    target = store.new_version_dir()
+    store.link_shard(live, target, "faq")
+    assert list(store.shard_paths(target)) == ["faq"]
+    for src, dst in zip(store.shard_paths(live)["faq"], store.shard_paths(target)["faq"]):
+        assert os.path.samefile(src, dst) or open(src).read() == open(dst).read()
+
+
+class _Searcher:
+    """SimpleRAGSearcher stand-in recording close()."""
+
+    def __init__(self, version=None, shard_paths=None):
+        if version == "broken":
+            raise FileNotFoundError("missing shard")
+        self.version = version or "v1"
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_hot_reload_swaps_and_closes_previous(monkeypatch):
+    pytest.importorskip("sentence_transformers")
+    pytest.importorskip("faiss")
+    from retrieval import hot_reload
+
+    monkeypatch.setattr(hot_reload, "SimpleRAGSearcher", _Searcher)
+    live = {"version": "v1"}
+    monkeypatch.setattr(hot_reload.index_store, "current_shard_paths", lambda: ({}, live["version"]))
+    reloading = hot_reload.HotReloadingSearcher()
+    first = reloading.current
+    assert not reloading.check_for_update()
+
+    live["version"] = "broken"
+    assert not reloading.check_for_update()
+    assert reloading.current is first and not first.closed
+    assert "broken" in reloading.last_error
+
+    live["version"] = "v2"
+    assert reloading.check_for_update()
+    assert reloading.version == "v2"
+    assert first.closed and not reloading.current.closed
+    assert reloading.last_error is None
+
+
+def test_version_model_is_recorded(store):
+    assert store.version_model(make_version(store, "model-a")) == "model-a"
+    assert store.version_model(make_version(store)) is None
+
+
+def test_publish_refuses_other_model(store):
+    live = make_version(store, "model-a")
+    store.publish(live, model_name="model-a")
+    candidate = make_version(store, "model-b")
+    with pytest.raises(ValueError, match="model-b"):
+        store.publish(candidate, model_name="model-a")
+    assert store.current_version() == live.name
+
+
+def test_publish_accepts_unrecorded_model(store):
+    # Versions built before the model was recorded stay publishable
+    version_dir = make_version(store)
+    store.publish(version_dir, model_name="model-a")
+    assert store.current_version() == version_dir.name
+
+
+def test_shadow_with_other_model_does_not_follow_live(store):
+    pytest.importorskip("sentence_transformers")
+    from retrieval.shadow import ShadowSearcher
+
+    store.publish(make_version(store, "model-a"))
+    shadow = ShadowSearcher(model_name="model-b", config={"embedding": {"model_name": "model-a"}})
+    shadow._thread.join(timeout=5)
+    assert not shadow.ready
+    assert "shadow.version" in shadow.load_error
+
+
+def test_build_index_model_requires_no_publish(monkeypatch):
+    pytest.importorskip("sentence_transformers")
+    pytest.importorskip("faiss")
+    from retrieval import build_index
+
+    monkeypatch.setattr(build_index, "configured_model_name", lambda: "model-a")
+    monkeypatch.setattr(build_index, "build", lambda args: None)
+    monkeypatch.setattr(sys, "argv", ["build_index.py", "--model", "model-b"])
+    with pytest.raises(SystemExit):
+        build_index.main()
+    monkeypatch.setattr(sys, "argv", ["build_index.py", "--model", "model-b", "--no-publish"])
+    build_index.main()
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from retrieval.lexical import is_lexical_query, tokenize
+
+
+@pytest.mark.parametrize("query", [
+    "ecs.g3i.large",
+    "ModifyInstanceSpec",
+    "InvalidParameter.NotFound",
+    "QUOTA_EXCEEDED",
+    "g3i c3a",
+    "`DescribeInstances` ecs.c3a.2xlarge",
+])
+def test_identifier_queries_take_the_fast_path(query):
+    assert is_lexical_query(query)
+
+
+@pytest.mark.parametrize("query", [
+    "2025年10月发生了什么？",
+    "如何把实例升级到g3i规格",
+    "什么是ECS？",
+    "ecs.g3i.large规格",
+    "What is g3i?",
+    "how to resize an instance",
+    "resize",
+    "",
+    "one two three four.x",
+])
+def test_natural_language_and_cjk_queries_do_not(query):
+    assert not is_lexical_query(query)
+
+
+def test_tokenize_keeps_identifiers_whole_and_splits_parts():
+    terms = tokenize("Use ecs.g3i.large with 实例规格")
+    assert "ecs.g3i.large" in terms and "g3i" in terms
+    assert "实例" in terms and "规格" in terms
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from benchmark.mock_llm_server import MockLLMBehaviour, MockLLMServer
+from generator.async_llm_client import AsyncLLMClient
+from generator.generate import RAGGenerator
+
+
+def _server(**behaviour):
+    return MockLLMServer(MockLLMBehaviour(ttft_ms=10, token_ms=1, tokens=8, jitter=0, **behaviour)).start()
+
+
+@pytest.fixture
+def providers(tmp_path, monkeypatch):
+    """Writes a config whose primary / fallback providers point at two mock servers."""
+    servers = []
+
+    def make(primary, secondary, hedge_after_sec=0):
+        servers.extend([primary, secondary])
+        config = {
+            "provider": "primary",
+            "llm": {"fallback_provider": "secondary", "request_timeout_sec": 5, "total_deadline_sec": 10,
+                    "max_retries": 0, "hedge_after_sec": hedge_after_sec},
+        }
+        for name, server in (("primary", primary), ("secondary", secondary)):
+            config[name] = {"api_key_env": f"{name.upper()}_API_KEY", "base_url": server.base_url,
+                            "model": "mock-llm", "max_tokens": 64}
+            monkeypatch.setenv(f"{name.upper()}_API_KEY", "mock-key")
+        path = tmp_path / "rag_config.yaml"
+        path.write_text(yaml.safe_dump(config), encoding="utf-8")
+        return str(path)
+
+    yield make
+    for server in servers:
+        server.stop()
+
+
+async def _collect(config_path, parts=None):
+    client = AsyncLLMClient(config_path)
+    parts = [] if parts is None else parts
+    try:
+        async for delta in client.generate_stream([{"role": "user", "content": "How do I resize?"}]):
+            parts.append(delta)
+        return "".join(parts)
+    finally:
+        await client.aclose()
+
+
+def test_stream_fails_over_when_primary_fails(providers):
+    primary, secondary = _server(error_rate=1.0), _server()
+    text = asyncio.run(_collect(providers(primary, secondary)))
+    assert text.startswith("Mock answer to: How do I resize?")
+    assert primary.stats()["errors"] == 1
+    assert secondary.stats()["streams"] == 1
+
+
+def test_stream_hedges_slow_primary(providers):
+    primary = MockLLMServer(MockLLMBehaviour(ttft_ms=3000, tokens=8, jitter=0)).start()
+    secondary = _server()
+    start_t = time.perf_counter()
+    text = asyncio.run(_collect(providers(primary, secondary, hedge_after_sec=0.2)))
+    assert text.startswith("Mock answer to:")
+    assert time.perf_counter() - start_t < 2
+    assert primary.stats()["streams"] == 1
+    assert secondary.stats()["streams"] == 1
+
+
+def test_stream_error_after_first_token_is_not_retried(providers):
+    primary, secondary = _server(disconnect_after=3), _server()
+    config_path = providers(primary, secondary)
+    parts = []
+    with pytest.raises(Exception):
+        asyncio.run(_collect(config_path, parts))
+    assert "".join(parts) == "Mock answer to: "
+    assert primary.stats()["streams"] == 1
+    assert secondary.stats()["requests"] == 0
+
+
+def test_sync_answer_stream_fails_over(providers):
+    primary, secondary = _server(error_rate=1.0), _server()
+    generator = RAGGenerator(providers(primary, secondary))
+    stream = generator.answer_stream("How do I resize?", [{"content": "Resize from the console.", "block_id": "b1"}])
+    text = "".join(stream)
+    assert text.startswith("Mock answer to:")
+    assert "error" not in stream.debug
+    assert secondary.stats()["streams"] == 1
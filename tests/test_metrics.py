@@ -0,0 +1,100 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from utils import metrics
+from utils.metrics import Counter, Histogram, MetricsRegistry
+
+
+@pytest.fixture(autouse=True)
+def no_trace_log(monkeypatch):
+    monkeypatch.setitem(metrics._trace_log, "path", None)
+
+
+def test_counter_prometheus_output():
+    counter = Counter("rag_test_total", "Test counter")
+    counter.inc(kind="prompt", provider="deepseek")
+    counter.inc(2, kind="prompt", provider="deepseek")
+    counter.inc()
+    assert counter.render() == [
+        "# HELP rag_test_total Test counter",
+        "# TYPE rag_test_total counter",
+        "rag_test_total 1.0",
+        'rag_test_total{kind="prompt",provider="deepseek"} 3.0',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("rag_test_seconds", "Test histogram", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, stage="embed")
+    assert histogram.render()[2:] == [
+        'rag_test_seconds_bucket{stage="embed",le="0.1"} 2',
+        'rag_test_seconds_bucket{stage="embed",le="1.0"} 3',
+        'rag_test_seconds_bucket{stage="embed",le="+Inf"} 4',
+        'rag_test_seconds_sum{stage="embed"} 2.65',
+        'rag_test_seconds_count{stage="embed"} 4',
+    ]
+    snapshot = histogram.snapshot()['{stage="embed"}']
+    assert snapshot["count"] == 4 and snapshot["p50"] == 0.5
+
+
+def test_collectors_export_numeric_gauges():
+    registry = MetricsRegistry()
+    registry.register_collector("rag_cache", lambda: {"size": 3, "enabled": True, "name": "x"})
+    registry.register_collector("rag_broken", lambda: 1 / 0)
+    assert registry.render_prometheus() == "# TYPE rag_cache_size gauge\nrag_cache_size 3.0\n"
+
+
+def test_spans_attach_to_the_active_trace_only():
+    with metrics.trace("answer") as t:
+        with metrics.span("embed", texts=1):
+            pass
+        with metrics.stage_prefix("shadow:"):
+            metrics.observe_stage("vector_search", 2.0)
+    with metrics.span("outside"):
+        pass
+    assert [s["name"] for s in t.spans] == ["embed", "shadow:vector_search"]
+    assert t.spans[0]["texts"] == 1
+    assert metrics.current_trace() is None
+
+
+def test_trace_does_not_leak_into_other_threads():
+    seen = []
+    with metrics.trace("answer"):
+        thread = threading.Thread(target=lambda: seen.append(metrics.current_trace()))
+        thread.start()
+        thread.join()
+    assert seen == [None]
+
+
+def test_concurrent_tasks_keep_their_own_trace():
+    async def request(name):
+        with metrics.trace(name) as t:
+            await asyncio.sleep(0.01)
+            with metrics.span("retrieve"):
+                await asyncio.sleep(0.01)
+            return t, metrics.current_trace()
+
+    async def main():
+        return await asyncio.gather(request("a"), request("b"))
+
+    for t, current in asyncio.run(main()):
+        assert current is t
+        assert [s["name"] for s in t.spans] == ["retrieve"]
+
+
+def test_trace_log_rotation(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    metrics.configure({"metrics": {"trace_log": str(path), "trace_log_max_mb": 100 / 2**20}})
+    for i in range(3):
+        with metrics.trace(f"t{i}"):
+            pass
+    assert json.loads(path.read_text(encoding="utf-8").splitlines()[-1])["name"] == "t2"
+    assert (tmp_path / "traces.jsonl.1").exists()
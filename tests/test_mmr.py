@@ -0,0 +1,39 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from retrieval.mmr import mmr_select
+
+
+def _unit(rows):
+    vectors = np.asarray(rows, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+QUERY = _unit([[1, 0, 0]])[0]
+# 0 and 1 are near-duplicates and the most relevant; 2 is less relevant but different
+CANDIDATES = _unit([[1, 0.1, 0], [1, 0.12, 0], [0.6, 0, 0.8], [0.1, 1, 0]])
+
+
+def test_lambda_one_is_relevance_order():
+    assert mmr_select(QUERY, CANDIDATES, k=4, lambda_mult=1.0) == [0, 1, 2, 3]
+
+
+def test_diversity_pushes_near_duplicates_down():
+    assert mmr_select(QUERY, CANDIDATES, k=2, lambda_mult=0.5) == [0, 2]
+
+
+def test_lambda_zero_ignores_relevance_after_first_pick():
+    # Only dissimilarity to what was already selected counts: 3 is furthest from 0
+    assert mmr_select(QUERY, CANDIDATES, k=3, lambda_mult=0.0) == [0, 3, 2]
+
+
+def test_precomputed_relevance_and_bounds():
+    relevance = np.array([0.1, 0.2, 0.9, 0.3], dtype=np.float32)
+    assert mmr_select(QUERY, CANDIDATES, k=1, lambda_mult=1.0, relevance=relevance) == [2]
+    assert len(mmr_select(QUERY, CANDIDATES, k=10)) == 4
+    assert mmr_select(QUERY, CANDIDATES, k=0) == []
+    assert mmr_select(QUERY, CANDIDATES[:0], k=3) == []
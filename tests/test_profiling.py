@@ -0,0 +1,57 @@
+import argparse
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from utils import profiling
+
+
+def _args(*argv):
+    parser = argparse.ArgumentParser()
+    profiling.add_profile_arguments(parser)
+    return parser.parse_args(list(argv))
+
+
+def _work():
+    return sum(i * i for i in range(20000))
+
+
+@pytest.fixture(autouse=True)
+def clean_env(monkeypatch):
+    for name in (profiling.ENV_MODE, profiling.ENV_DIR, profiling.ENV_MEMORY):
+        monkeypatch.delenv(name, raising=False)
+
+
+@pytest.mark.parametrize("value", ["", "0", "off", "false"])
+def test_off_is_a_no_op(tmp_path, monkeypatch, value):
+    monkeypatch.setenv(profiling.ENV_MODE, value)
+    with profiling.profiled("stage", _args(), artifact_dir=str(tmp_path)) as profiler:
+        _work()
+    assert profiler is None
+    assert not (tmp_path / "profiles").exists()
+
+
+def test_flag_writes_cprofile_artifacts(tmp_path):
+    with profiling.profiled("stage", _args("--profile"), artifact_dir=str(tmp_path)) as profiler:
+        _work()
+    assert profiler.mode == "cprofile"
+    suffixes = sorted(p.name.split("_stage", 1)[1] for p in (tmp_path / "profiles").iterdir())
+    assert suffixes == [".folded", ".prof", ".txt"]
+    assert "_work" in (tmp_path / "profiles" / f"{profiler.prefix}.txt").read_text(encoding="utf-8")
+
+
+def test_env_turns_on_sampling_for_services(tmp_path, monkeypatch):
+    monkeypatch.setenv(profiling.ENV_MODE, "1")
+    monkeypatch.setenv(profiling.ENV_DIR, str(tmp_path))
+    with profiling.profiled("service", _args(), service=True) as profiler:
+        _work()
+    assert profiler.mode == "sample"
+    assert sorted(p.suffix for p in tmp_path.iterdir()) == [".folded", ".txt"]
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        profiling.Profiler("stage", mode="perf")
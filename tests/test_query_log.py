@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from utils.query_log import anonymize
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("mail jane.doe+ops@corp.example.cn about it", "mail user@example.com about it"),
+    ("call +86 138 0013 8000 now", "call +00 000 0000 0000 now"),
+    ("card 4111-1111-1111-1111", "card 0000-0000-0000-0000"),
+    ("from host 10.1.2.3", "from host 192.0.2.1"),
+])
+def test_personal_data_is_redacted(text, expected):
+    assert anonymize(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "release notes of 2025-10-21",
+    "changes between 2025-10-01 - 2025-10-21",
+    "ecs.g7.large in cn-beijing",
+    "version 1.2.3 and 12345",
+])
+def test_dates_and_identifiers_are_kept(text):
+    assert anonymize(text) == text
+
+
+def test_number_next_to_date_is_redacted():
+    assert anonymize("2025-10-21 13800138000") == "2025-10-21 00000000000"
@@ -0,0 +1,132 @@
+import glob
+import hashlib
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+import pytest
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+# The pipeline loads the embedding and index stack (sentence-transformers, FAISS)
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("faiss")
+from benchmark.fixture_server import FixtureServer, SyntheticDocs
+from pipeline import rebuild
+from retrieval import index_store
+
+PAGES = 6
+
+
+class _HashEmbedder:
+    """Deterministic stand-in for RAGEmbedder; counts loads and encoded texts."""
+    loads = 0
+    encoded = 0
+    fail = False
+    embedding_dim = 8
+    model_name = "test-model"
+
+    def __init__(self, config_path=None, model_name=None):
+        type(self).loads += 1
+
+    def encode(self, texts):
+        if self.fail:
+            raise RuntimeError("embedding backend down")
+        type(self).encoded += len(texts)
+        vectors = np.array([
+            np.frombuffer(hashlib.sha256(t.encode("utf-8")).digest()[:8], dtype=np.uint8) + 1.0 for t in texts
+        ], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    root = tmp_path / "index"
+    monkeypatch.setattr(index_store, "INDEX_ROOT", root)
+    monkeypatch.setattr(index_store, "VERSIONS_DIR", root / "versions")
+    monkeypatch.setattr(index_store, "CURRENT_FILE", root / "CURRENT")
+    root.mkdir()
+    monkeypatch.setattr(_HashEmbedder, "loads", 0)
+    monkeypatch.setattr(_HashEmbedder, "encoded", 0)
+    monkeypatch.setattr(_HashEmbedder, "fail", False)
+    monkeypatch.setattr(rebuild, "RAGEmbedder", _HashEmbedder)
+    config = tmp_path / "rag_config.yaml"
+    config.write_text(yaml.safe_dump({
+        "embedding": {"model_name": "test-model"},
+        "pipeline": {"queue_size": 1, "embed_batch_size": 4, "recrawl_after_hours": 0},
+    }), encoding="utf-8")
+    server = FixtureServer(SyntheticDocs(pages=PAGES, paragraphs=4)).start()
+    yield tmp_path, str(config), [{"url": server.seed_url, "source_name": "fixture_docs"}]
+    server.stop()
+
+
+def _pipeline(workdir, crawl="never"):
+    tmp_path, config, sources = workdir
+    return rebuild.RebuildPipeline(sources, str(tmp_path / "raw"), str(tmp_path / "processed" / "blocks.json"),
+                                   crawl=crawl, config_path=config, max_pages=PAGES, delay=0)
+
+
+def test_unchanged_input_skips_every_stage(workdir):
+    first = _pipeline(workdir, crawl="always").run()
+    assert first["stages"]["crawl"]["items"] == PAGES
+    assert first["stages"]["process"]["items"] == PAGES
+    assert first["stages"]["embed"]["items"] == first["blocks"] > 0
+    assert index_store.current_version() == first["index_version"]
+    assert index_store.version_model(index_store.current_version_dir()) == "test-model"
+
+    _HashEmbedder.loads = _HashEmbedder.encoded = 0
+    second = _pipeline(workdir).run()
+    stages = second["stages"]
+    assert stages["process"]["items"] == 0 and stages["process"]["cached"] == PAGES
+    assert stages["embed"]["items"] == 0 and stages["embed"]["cached"] == second["blocks"]
+    assert stages["index"]["skipped"]
+    assert second["index_version"] == first["index_version"]
+    # Every vector was reused from the live index, so the model was never loaded
+    assert _HashEmbedder.loads == 0 and _HashEmbedder.encoded == 0
+
+
+def test_changed_page_is_reprocessed(workdir):
+    tmp_path = workdir[0]
+    first = _pipeline(workdir, crawl="always").run()
+    page = sorted(glob.glob(str(tmp_path / "raw" / "**" / "*.json"), recursive=True))[-1]
+    with open(page, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    raw["raw_content"] = raw["raw_content"].replace("instance", "server")
+    with open(page, "w", encoding="utf-8") as f:
+        json.dump(raw, f)
+
+    second = _pipeline(workdir).run()
+    stages = second["stages"]
+    assert stages["process"]["items"] == 1 and stages["process"]["cached"] == PAGES - 1
+    assert 0 < stages["embed"]["items"] < second["blocks"]
+    assert second["index_version"] != first["index_version"]
+
+    with open(tmp_path / "processed" / rebuild.STATE_FILENAME, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    assert state["index_version"] == second["index_version"]
+    assert state["embedding_model"] == "test-model"
+
+
+def test_failing_stage_does_not_hang(workdir):
+    _HashEmbedder.fail = True
+    pipeline = _pipeline(workdir, crawl="always")
+    errors = []
+
+    def run():
+        try:
+            pipeline.run()
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    # queue_size 1: crawl and process block on full queues once embed stops reading
+    thread.join(timeout=30)
+    assert not thread.is_alive(), "pipeline hung after a stage failed"
+    assert isinstance(errors[0], RuntimeError)
+    assert "embed" in str(errors[0])
+    assert isinstance(errors[0].__cause__, RuntimeError)
+    assert index_store.current_version() is None
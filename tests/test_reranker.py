@@ -0,0 +1,69 @@
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from retrieval.reranker import CrossEncoderReranker
+
+
+class _CrossEncoder:
+    """Scores a pair by the number in its passage; `delay` seconds per batch, or raises `error`."""
+    delay = 0.0
+    error = None
+
+    def __init__(self, model_name, max_length=512):
+        pass
+
+    def predict(self, pairs, batch_size=16, show_progress_bar=False):
+        if self.error is not None:
+            raise self.error
+        time.sleep(self.delay)
+        return [float(passage.split()[-1]) for _, passage in pairs]
+
+
+@pytest.fixture
+def reranker(monkeypatch):
+    # The model itself is replaced; budget, cache and fallback logic are the real ones
+    monkeypatch.setitem(sys.modules, "sentence_transformers", SimpleNamespace(CrossEncoder=_CrossEncoder))
+    monkeypatch.setattr(_CrossEncoder, "delay", 0.0)
+    monkeypatch.setattr(_CrossEncoder, "error", None)
+    return CrossEncoderReranker(batch_size=2, time_budget_ms=100)
+
+
+def _candidates(*scores):
+    return [SimpleNamespace(block_id=f"b{i}", content=f"passage {score}", source_meta={})
+            for i, score in enumerate(scores)]
+
+
+def test_reorders_by_cross_encoder_score(reranker):
+    candidates = _candidates(1, 5, 3, 4)
+    results, scores = reranker.rerank("resize", candidates, top_k=3)
+    assert [r.block_id for r in results] == ["b1", "b3", "b2"]
+    assert scores.tolist() == [5, 4, 3]
+    # Repeated query: every pair comes from the cache
+    reranker.rerank("resize", candidates, top_k=3)
+    stats = reranker.stats()
+    assert stats["pairs_scored"] == 4 and stats["cache_hits"] == 4
+
+
+def test_budget_overrun_keeps_first_stage_order(reranker):
+    _CrossEncoder.delay = 0.3
+    candidates = _candidates(1, 5, 3, 4)
+    start_t = time.perf_counter()
+    results, scores = reranker.rerank("resize", candidates, top_k=2)
+    assert time.perf_counter() - start_t < 0.25
+    assert scores is None
+    assert [r.block_id for r in results] == ["b0", "b1"]
+    assert reranker.stats()["fallbacks"] == 1
+
+
+def test_scoring_error_keeps_first_stage_order(reranker):
+    _CrossEncoder.error = RuntimeError("CUDA out of memory")
+    results, scores = reranker.rerank("resize", _candidates(1, 5, 3), top_k=3)
+    assert scores is None
+    assert [r.block_id for r in results] == ["b0", "b1", "b2"]
+    assert reranker.stats()["fallbacks"] == 1
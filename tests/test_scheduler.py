@@ -0,0 +1,82 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from generator.scheduler import LLMScheduler, SchedulerRejectedError, SchedulerTimeoutError
+
+
+async def _call(scheduler, hold_sec, timeout=None):
+    try:
+        async with scheduler.async_slot(timeout):
+            await asyncio.sleep(hold_sec)
+        return "ok"
+    except SchedulerRejectedError:
+        return "rejected"
+    except SchedulerTimeoutError:
+        return "timed_out"
+
+
+def test_async_callers_queue_then_get_rejected():
+    scheduler = LLMScheduler(max_in_flight=1, max_queue=2, queue_timeout_sec=5)
+
+    async def main():
+        return await asyncio.gather(*[_call(scheduler, 0.05) for _ in range(5)])
+
+    outcomes = asyncio.run(main())
+    assert sorted(outcomes) == ["ok", "ok", "ok", "rejected", "rejected"]
+    stats = scheduler.stats()
+    assert stats["admitted"] == 3 and stats["rejected"] == 2 and stats["in_flight"] == 0
+
+
+def test_async_waiters_time_out():
+    scheduler = LLMScheduler(max_in_flight=1, max_queue=8, queue_timeout_sec=0.05)
+
+    async def main():
+        return await asyncio.gather(_call(scheduler, 0.3), *[_call(scheduler, 0.0) for _ in range(3)])
+
+    outcomes = asyncio.run(main())
+    assert outcomes == ["ok", "timed_out", "timed_out", "timed_out"]
+    assert scheduler.stats()["queued"] == 0
+
+
+def test_async_waiters_do_not_hold_executor_threads():
+    scheduler = LLMScheduler(max_in_flight=1, max_queue=64, queue_timeout_sec=2)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        waiters = [asyncio.ensure_future(_call(scheduler, 0.5 if i == 0 else 0.0)) for i in range(40)]
+        await asyncio.sleep(0.05)
+        start_t = time.monotonic()
+        await loop.run_in_executor(None, lambda: None)
+        elapsed = time.monotonic() - start_t
+        await asyncio.gather(*waiters)
+        return elapsed
+
+    assert asyncio.run(main()) < 0.2
+
+
+def test_sync_release_wakes_async_waiter():
+    scheduler = LLMScheduler(max_in_flight=1, max_queue=4, queue_timeout_sec=2)
+    token = scheduler.acquire()
+    threading.Timer(0.05, scheduler.release, args=(token,)).start()
+
+    async def main():
+        start_t = time.monotonic()
+        assert await _call(scheduler, 0.0) == "ok"
+        return time.monotonic() - start_t
+
+    assert asyncio.run(main()) < 1.0
+
+
+def test_sync_queue_full_is_rejected():
+    scheduler = LLMScheduler(max_in_flight=1, max_queue=0, queue_timeout_sec=1)
+    token = scheduler.acquire()
+    with pytest.raises(SchedulerRejectedError):
+        scheduler.acquire()
+    scheduler.release(token)
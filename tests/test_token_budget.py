@@ -0,0 +1,56 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from generator.token_budget import TokenAccountant
+
+
+def _accountant(**kwargs):
+    return TokenAccountant(budgets=[{"window_sec": 3600, "max_tokens": 10000}], soft_limit=0.8,
+                           min_max_tokens=256, min_context_tokens=800, **kwargs)
+
+
+def test_no_caps_below_soft_limit():
+    accountant = _accountant()
+    accountant.record("deepseek", 5000, 2000)
+    caps = accountant.caps(2048, 4000)
+    assert caps["pressure"] == pytest.approx(0.7)
+    assert caps == {"pressure": caps["pressure"], "scale": 1.0, "max_tokens": 2048, "context_token_budget": 4000}
+    assert accountant.stats()["capped_requests"] == 0
+
+
+def test_caps_scale_down_linearly_past_soft_limit():
+    accountant = _accountant()
+    accountant.record("deepseek", 7000, 2000)
+    caps = accountant.caps(2048, 4000)
+    # 90% used: halfway between the soft limit and the budget
+    assert caps["scale"] == pytest.approx(0.5)
+    assert caps["max_tokens"] == 1024
+    assert caps["context_token_budget"] == 2000
+    assert accountant.stats()["capped_requests"] == 1
+
+
+def test_caps_stop_at_the_floors():
+    accountant = _accountant()
+    accountant.record("deepseek", 9000, 3000)
+    caps = accountant.caps(2048, 4000)
+    assert caps["scale"] == 0.0
+    assert caps["max_tokens"] == 256
+    assert caps["context_token_budget"] == 800
+    # Floors never raise a limit that was already lower
+    assert accountant.caps(128, None) == {"pressure": caps["pressure"], "scale": 0.0,
+                                          "max_tokens": 128, "context_token_budget": None}
+
+
+def test_cost_budget_and_usage_totals():
+    accountant = TokenAccountant(prices={"deepseek": {"prompt": 1.0, "completion": 2.0}},
+                                 budgets=[{"window_sec": 60, "max_cost": 0.01}])
+    usage = accountant.record("deepseek", 1000, 2000)
+    assert usage["cost"] == pytest.approx(0.005)
+    assert accountant.pressure() == pytest.approx(0.5)
+    stats = accountant.stats()
+    assert stats["providers"]["deepseek"]["requests"] == 1
+    assert stats["prompt_tokens_1h"] == 1000 and stats["completion_tokens_1m"] == 2000
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+# build_index loads the embedding stack (sentence-transformers, FAISS)
+pytest.importorskip("sentence_transformers")
+faiss = pytest.importorskip("faiss")
+from retrieval import build_index
+
+
+class _HashEmbedder:
+    """Deterministic content -> unit vector, so updated and rebuilt indexes are comparable."""
+    embedding_dim = 8
+
+    def encode(self, texts):
+        vectors = np.array([
+            np.frombuffer(hashlib.sha256(t.encode("utf-8")).digest()[:8], dtype=np.uint8) + 1.0
+            for t in texts
+        ], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture(autouse=True)
+def embedder(monkeypatch):
+    monkeypatch.setattr(build_index, "RAGEmbedder", _HashEmbedder)
+
+
+def _block(block_id, content, **meta):
+    return {"block_id": block_id, "content": content, **meta}
+
+
+OLD = [_block("a", "alpha"), _block("b", "beta"), _block("c", "gamma"), _block("d", "delta")]
+NEW = [
+    _block("a", "alpha", title="Alpha"),   # metadata only
+    _block("b", "beta, revised"),          # content changed
+    _block("d", "delta"),                  # unchanged; "c" is removed
+    _block("e", "epsilon"),                # added
+]
+
+
+def _load(index_file, meta_file):
+    index = faiss.read_index(index_file)
+    with open(meta_file, "r", encoding="utf-8") as f:
+        blocks = json.load(f)
+    ids = faiss.vector_to_array(index.id_map)
+    vectors = {blocks[pos]["block_id"]: index.index.reconstruct(row) for row, pos in enumerate(ids)}
+    return index, blocks, vectors
+
+
+def _build(tmp_path, name, blocks):
+    index_file, meta_file = str(tmp_path / f"{name}.index"), str(tmp_path / f"{name}_meta.json")
+    build_index.build_full(blocks, index_file, meta_file, _HashEmbedder())
+    return index_file, meta_file
+
+
+def test_update_matches_full_rebuild(tmp_path):
+    live = _build(tmp_path, "live", OLD)
+    rebuilt = _build(tmp_path, "rebuilt", NEW)
+    out = str(tmp_path / "updated.index"), str(tmp_path / "updated_meta.json")
+
+    _, old_blocks, _ = _load(*live)
+    added, changed, removed_ids = build_index.diff_blocks(old_blocks, NEW)
+    stats = build_index.update_index(added, changed, removed_ids, *live, *out, compact_threshold=1.0)
+    assert stats == {"added": 1, "changed": 2, "removed": 1, "reembedded": 1}
+
+    index, blocks, vectors = _load(*out)
+    _, rebuilt_blocks, rebuilt_vectors = _load(*rebuilt)
+    assert index.ntotal == len(NEW)
+    # The removed block is tombstoned, so the other ids stay valid
+    assert blocks[2] is None
+    assert sorted((b for b in blocks if b), key=lambda b: b["block_id"]) == rebuilt_blocks
+    assert vectors.keys() == rebuilt_vectors.keys()
+    for block_id, vector in vectors.items():
+        np.testing.assert_allclose(vector, rebuilt_vectors[block_id], rtol=1e-6)
+
+
+def test_live_version_is_not_modified(tmp_path):
+    live = _build(tmp_path, "live", OLD)
+    out = str(tmp_path / "updated.index"), str(tmp_path / "updated_meta.json")
+    build_index.update_index([], [], ["a"], *live, *out)
+    index, blocks, _ = _load(*live)
+    assert blocks == OLD
+    assert index.ntotal == len(OLD)
+
+
+def test_compaction_renumbers_ids(tmp_path):
+    live = _build(tmp_path, "live", OLD)
+    out = str(tmp_path / "updated.index"), str(tmp_path / "updated_meta.json")
+    stats = build_index.update_index([], [], ["a", "c"], *live, *out, compact_threshold=0.3)
+    assert stats["compacted"] == 1
+    index, blocks, vectors = _load(*out)
+    assert [b["block_id"] for b in blocks] == ["b", "d"]
+    assert faiss.vector_to_array(index.id_map).tolist() == [0, 1]
+    np.testing.assert_allclose(vectors["d"], _HashEmbedder().encode(["delta"])[0], rtol=1e-6)